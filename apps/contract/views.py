@@ -7,6 +7,11 @@ from django.core.paginator import Paginator
 from .models import Contract
 from .serializers import ContractSerializer
 from apps.users.views import get_user_permissions_helper
+from apps.core.permissions.scopes import ScopeSpec, apply_scope
+from apps.core.utils.pagination import CURSOR_PARAM, InvalidCursor, get_cursor_page, parse_page_size
+
+# 合同的提交人记录的是昵称；合同表没有地区字段，按地区查看不生效
+CONTRACT_SCOPE = ScopeSpec(owner_user_field='nickname')
 
 def apply_permission_filters(queryset, user):
     """
@@ -14,23 +19,7 @@ def apply_permission_filters(queryset, user):
     """
     user_permissions = get_user_permissions_helper(user)
     contract_permissions = user_permissions['permissions']['contract']
-    
-    if not contract_permissions['data']['view_all']:
-        filters = Q()
-        
-        if contract_permissions['data']['view_own']:
-            filters |= Q(submitter=user.nickname)
-        
-        if contract_permissions['data']['view_by_location']:
-            # 假设合同表中有 business_location 字段，根据实际情况调整
-            filters |= Q(business_location__icontains=user.location)
-        
-        if contract_permissions['data']['view_department_submissions']:
-            department_users = user.objects.filter(dept_id=user.dept_id).values_list('username', flat=True)
-            filters |= Q(submitter__in=department_users)
-        
-        queryset = queryset.filter(filters)
-    
+    queryset = apply_scope(queryset, contract_permissions['data'], user, CONTRACT_SCOPE)
     return queryset, contract_permissions
 
 @api_view(['GET'])
@@ -79,6 +68,24 @@ def contract_list(request):
     # 获取分页参数
     page = int(request.query_params.get('page', 1))
     page_size = int(request.query_params.get('page_size', 10))
+
+    # 游标分页：按 id 索引定位下一页，不统计总数
+    if CURSOR_PARAM in request.query_params:
+        try:
+            page_size = parse_page_size(page_size)
+            contracts, next_cursor = get_cursor_page(queryset, request.query_params.get(CURSOR_PARAM), page_size)
+        except InvalidCursor as e:
+            return Response({'success': False, 'message': str(e)}, status=400)
+        serializer = ContractSerializer(contracts, many=True)
+        return Response({
+            'success': True,
+            'data': {
+                'list': serializer.data,
+                'next': next_cursor,
+                'pageSize': page_size,
+                'permissions': contract_permissions
+            }
+        })
     
     # 排序
     queryset = queryset.order_by('-id')
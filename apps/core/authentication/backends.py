@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Subquery
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+def set_user_claims(token, user):
+    """将用户常用字段及用户的令牌版本写入令牌，access token 会从 refresh token 复制这些声明"""
+    token['username'] = user.username
+    token['nickname'] = user.nickname
+    token['dept_id'] = user.dept_id
+    token['roles'] = list(user.roles or [])
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+def refresh_token_for_user(user):
+    """为用户签发携带扩展声明的 refresh token"""
+    return set_user_claims(RefreshToken.for_user(user), user)
+
+
+class ClaimsUser(TokenUser):
+    """
+    由令牌声明构建的用户对象，角色、部门等以令牌声明为准
+    访问声明之外的属性时使用 db_user（认证时已读取，未设置时按需加载）
+    """
+
+    @cached_property
+    def nickname(self):
+        return self.token.get('nickname', '')
+
+    @cached_property
+    def dept_id(self):
+        return self.token.get('dept_id')
+
+    @cached_property
+    def roles(self):
+        return self.token.get('roles', [])
+
+    def has_role(self, role_name):
+        return role_name in self.roles
+
+    @cached_property
+    def db_user(self):
+        return get_user_model().objects.get(id=self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'token':
+            raise AttributeError(name)
+        return getattr(self.db_user, name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    每个请求只按主键读取一次用户记录（附带全局权限版本）并校验令牌版本和启用状态，
+    令牌版本一致且用户仍启用时直接使用 ClaimsUser，
+    否则（用户信息、角色变化、被禁用或删除）回退为从数据库读取完整用户
+    版本保存在数据库中，所有 worker 看到的失效状态一致
+    """
+
+    def get_user(self, validated_token):
+        from apps.users.models import PermissionVersion
+
+        version = validated_token.get(TOKEN_VERSION_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if version is not None and user_id is not None:
+            # 校验版本时按主键读出的整行同时作为 ClaimsUser 的 db_user，访问声明之外的属性不再查询
+            db_user = (
+                get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .annotate(permission_version=Subquery(PermissionVersion.objects.filter(id=1).values('version')[:1]))
+                .first()
+            )
+            if db_user and db_user.is_active and db_user.token_version == version:
+                user = ClaimsUser(validated_token)
+                user.db_user = db_user
+                # 同一请求内编译权限时复用已读取的权限版本
+                user.permission_version = db_user.permission_version
+                return user
+        return super().get_user(validated_token)
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class AutocompleteConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.core.autocomplete'
+    verbose_name = '自动补全'
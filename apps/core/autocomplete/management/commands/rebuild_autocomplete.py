@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.core.autocomplete.services import AUTOCOMPLETE_SOURCES, rebuild_autocomplete
+
+class Command(BaseCommand):
+    help = 'Rebuild the autocomplete dictionaries from business tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', choices=list(AUTOCOMPLETE_SOURCES), help='Source to rebuild, may be repeated (default: all)')
+
+    def handle(self, *args, **options):
+        for source in options['source'] or AUTOCOMPLETE_SOURCES:
+            with transaction.atomic():
+                count = rebuild_autocomplete(source)
+            self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {source} autocomplete ({count} values)'))
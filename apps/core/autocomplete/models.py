@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class AutocompleteValue(models.Model):
+    """各业务表可补全字段的去重取值及出现次数，随业务数据增删改增量维护"""
+
+    source = models.CharField(max_length=50, verbose_name='数据来源', help_text='业务表标识，如 customer、expense')
+    field = models.CharField(max_length=100, verbose_name='字段名')
+    value = models.CharField(max_length=255, verbose_name='取值')
+    count = models.IntegerField(default=0, verbose_name='出现次数')
+
+    class Meta:
+        db_table = 'zy_autocomplete_value'
+        verbose_name = '自动补全取值'
+        verbose_name_plural = '自动补全取值'
+        unique_together = ('source', 'field', 'value')
+
+    def __str__(self):
+        return f'{self.source}.{self.field}: {self.value}'
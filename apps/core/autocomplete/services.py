@@ -0,0 +1,224 @@
+import bisect
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+# 数据来源 -> (模型, 维护补全字典的字段)
+AUTOCOMPLETE_SOURCES = {
+    'customer': ('customer.Customer', (
+        'company_name', 'daily_contact', 'sales_representative', 'tax_bureau', 'business_source',
+        'chief_accountant', 'responsible_accountant', 'enterprise_status', 'enterprise_type',
+        'boss_name', 'submitter',
+    )),
+    'expense': ('expense.Expense', (
+        'company_name', 'company_type', 'company_location', 'license_type', 'agency_type',
+        'business_type', 'contract_type', 'invoice_software_provider', 'insurance_types',
+        'charge_method', 'submitter', 'auditor',
+    )),
+}
+
+# 受限权限用户需回表校验的候选值上限，超过时退回直接查询业务表
+SCOPE_CANDIDATE_LIMIT = 500
+SCOPE_CHECK_BATCH = 100
+
+# 前缀匹配不足时，查询词达到该长度才回退到包含匹配（需遍历整个字典）
+SUBSTRING_MIN_QUERY_LENGTH = 2
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_autocomplete_fields(source):
+    return AUTOCOMPLETE_SOURCES[source][1]
+
+
+def _normalize(value):
+    if value is None:
+        return None
+    value = str(value)
+    return value[:255] if value else None
+
+
+def _increment(source, field, value):
+    from .models import AutocompleteValue
+
+    updated = AutocompleteValue.objects.filter(source=source, field=field, value=value).update(count=F('count') + 1)
+    if not updated:
+        try:
+            with transaction.atomic():
+                AutocompleteValue.objects.create(source=source, field=field, value=value, count=1)
+        except IntegrityError:
+            # 并发插入时另一事务已创建该记录
+            AutocompleteValue.objects.filter(source=source, field=field, value=value).update(count=F('count') + 1)
+
+
+def _decrement(source, field, value):
+    from .models import AutocompleteValue
+
+    entries = AutocompleteValue.objects.filter(source=source, field=field, value=value)
+    entries.update(count=F('count') - 1)
+    entries.filter(count__lte=0).delete()
+
+
+def remember_previous_values(source, instance):
+    """pre_save 时记录更新前的字段值，用于 post_save 计算差异"""
+    fields = get_autocomplete_fields(source)
+    previous = None
+    if instance.pk:
+        previous = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+    instance._autocomplete_previous = previous or {}
+
+
+def apply_saved_values(source, instance):
+    """post_save 时按字段值变化增减计数"""
+    previous = getattr(instance, '_autocomplete_previous', {})
+    for field in get_autocomplete_fields(source):
+        old_value = _normalize(previous.get(field))
+        new_value = _normalize(getattr(instance, field))
+        if old_value == new_value:
+            continue
+        if old_value is not None:
+            _decrement(source, field, old_value)
+        if new_value is not None:
+            _increment(source, field, new_value)
+        invalidate_index(source, field)
+
+
+def remove_deleted_values(source, instance):
+    for field in get_autocomplete_fields(source):
+        value = _normalize(getattr(instance, field))
+        if value is not None:
+            _decrement(source, field, value)
+            invalidate_index(source, field)
+
+
+def adjust_value_counts(source, field, deltas):
+    """
+    按 {取值: 增减数量} 批量调整计数，用于 queryset.update() 等不触发信号的批量更新
+    """
+    from .models import AutocompleteValue
+
+    changed = False
+    for value, delta in deltas.items():
+        value = _normalize(value)
+        if value is None or not delta:
+            continue
+        changed = True
+        entries = AutocompleteValue.objects.filter(source=source, field=field, value=value)
+        if entries.update(count=F('count') + delta):
+            if delta < 0:
+                entries.filter(count__lte=0).delete()
+        elif delta > 0:
+            try:
+                with transaction.atomic():
+                    AutocompleteValue.objects.create(source=source, field=field, value=value, count=delta)
+            except IntegrityError:
+                entries.update(count=F('count') + delta)
+    if changed:
+        invalidate_index(source, field)
+
+
+def rebuild_autocomplete(source):
+    """按业务表全量重建补全字典，返回写入的取值数量"""
+    from .models import AutocompleteValue
+
+    model_label, fields = AUTOCOMPLETE_SOURCES[source]
+    model = apps.get_model(model_label)
+
+    AutocompleteValue.objects.filter(source=source).delete()
+    entries = []
+    for field in fields:
+        counts = {}
+        rows = model.objects.exclude(**{f'{field}__isnull': True}).values(field).annotate(total=Count('id')).order_by()
+        for row in rows:
+            value = _normalize(row[field])
+            if value is not None:
+                counts[value] = counts.get(value, 0) + row['total']
+        entries.extend(
+            AutocompleteValue(source=source, field=field, value=value, count=total)
+            for value, total in counts.items()
+        )
+    AutocompleteValue.objects.bulk_create(entries, batch_size=1000)
+    for field in fields:
+        invalidate_index(source, field)
+    return len(entries)
+
+
+def invalidate_index(source, field):
+    with _indexes_lock:
+        _indexes.pop((source, field), None)
+
+
+def _get_index(source, field):
+    """
+    返回按小写取值排序的 (小写取值列表, 原始取值列表)，
+    在进程内缓存 AUTOCOMPLETE_INDEX_TTL 秒，其它进程的更新在过期后可见
+    """
+    from .models import AutocompleteValue
+
+    now = time.monotonic()
+    with _indexes_lock:
+        cached = _indexes.get((source, field))
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+    values = AutocompleteValue.objects.filter(source=source, field=field, count__gt=0).values_list('value', flat=True)
+    pairs = sorted((value.lower(), value) for value in values)
+    keys = [key for key, _ in pairs]
+    originals = [value for _, value in pairs]
+
+    ttl = getattr(settings, 'AUTOCOMPLETE_INDEX_TTL', 60)
+    with _indexes_lock:
+        _indexes[(source, field)] = (now + ttl, keys, originals)
+    return keys, originals
+
+
+def search_index(source, field, query, limit):
+    """
+    不区分大小写匹配，最多返回 limit 个，前缀匹配在前，其余包含匹配在后，各自按取值排序
+    前缀匹配不足 limit 且查询词不少于 SUBSTRING_MIN_QUERY_LENGTH 时才扫描包含匹配，凑满即停止
+    """
+    keys, originals = _get_index(source, field)
+    query = query.lower()
+
+    start = bisect.bisect_left(keys, query)
+    end = start
+    while end < len(keys) and end - start < limit and keys[end].startswith(query):
+        end += 1
+    matches = originals[start:end]
+    if len(matches) >= limit or len(query) < SUBSTRING_MIN_QUERY_LENGTH:
+        return matches
+
+    for i, key in enumerate(keys):
+        if start <= i < end or query not in key:
+            continue
+        matches.append(originals[i])
+        if len(matches) >= limit:
+            break
+    return matches
+
+
+def get_autocomplete_values(source, field, query, scoped_queryset, unrestricted, limit=10):
+    """
+    从补全字典返回匹配的取值
+    unrestricted 为 False 时仅保留在 scoped_queryset（已按权限过滤）中出现过的取值，
+    候选过多无法高效校验时返回 None，由调用方直接查询业务表
+    """
+    if unrestricted:
+        return search_index(source, field, query, limit)
+    matches = search_index(source, field, query, SCOPE_CANDIDATE_LIMIT + 1)
+    if len(matches) > SCOPE_CANDIDATE_LIMIT:
+        return None
+
+    results = []
+    for offset in range(0, len(matches), SCOPE_CHECK_BATCH):
+        batch = matches[offset:offset + SCOPE_CHECK_BATCH]
+        visible = set(scoped_queryset.filter(**{f'{field}__in': batch}).values_list(field, flat=True).distinct())
+        results.extend(value for value in batch if value in visible)
+        if len(results) >= limit:
+            break
+    return results[:limit]
@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from .scopes import ScopeSpec, department_member_exists
+
+BENCHMARK_SIZES = (10, 100, 1000, 5000)
+
+EXPENSE_SCOPE = ScopeSpec(location_field='company_location')
+
+
+def seed_scope_benchmark(size, records_per_user=5):
+    """
+    创建一个包含 size 个用户的部门（本部门与下级部门各一半）、同等规模的无关部门及各用户的费用记录
+    返回被测部门 id
+    """
+    from apps.expense.models import Expense
+    from apps.users.models import Department, User
+    from apps.users.services import insert_department_closure
+
+    root = Department.objects.create(name=f'bench_root_{size}')
+    insert_department_closure(root)
+    child = Department.objects.create(name=f'bench_child_{size}', parent=root)
+    insert_department_closure(child)
+    other = Department.objects.create(name=f'bench_other_{size}')
+    insert_department_closure(other)
+
+    users = []
+    for i in range(size):
+        users.append(User(username=f'bench_{size}_{i}', dept_id=root.id if i % 2 else child.id))
+        users.append(User(username=f'bench_{size}_other_{i}', dept_id=other.id))
+    User.objects.bulk_create(users, batch_size=1000)
+
+    Expense.objects.bulk_create(
+        [Expense(company_name=f'bench_{size}', submitter=user.username) for user in users for _ in range(records_per_user)],
+        batch_size=1000
+    )
+    return root.id
+
+
+def materialized_department_filter(dept_id):
+    """原实现：先把部门用户名取回 Python，再以字面量列表 submitter__in 过滤"""
+    from apps.users.models import User
+    from apps.users.services import get_department_subtree_ids
+
+    usernames = list(User.objects.filter(
+        Q(dept_id=dept_id) | Q(dept_id__in=get_department_subtree_ids(dept_id))
+    ).values_list('username', flat=True))
+    return Q(submitter__in=usernames)
+
+
+def compiled_department_filter(dept_id):
+    return Q(department_member_exists(dept_id, EXPENSE_SCOPE))
+
+
+def _measure(build_filter, dept_id, repeat):
+    from apps.expense.models import Expense
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            queryset = Expense.objects.filter(build_filter(dept_id))
+            count = queryset.count()
+            list(queryset.order_by('-id').values_list('id', flat=True)[:10])
+        timings.append((time.perf_counter() - start) * 1000)
+    return count, statistics.median(timings), len(queries)
+
+
+def run_scope_benchmark(sizes=BENCHMARK_SIZES, repeat=5):
+    """
+    对每个部门规模比较两种部门数据权限过滤方式，数据在事务中创建并回滚
+    返回 [(规模, 记录数, 原实现毫秒, 原实现查询次数, 子查询毫秒, 子查询查询次数)]
+    """
+    results = []
+    with transaction.atomic():
+        for size in sizes:
+            dept_id = seed_scope_benchmark(size)
+            count, legacy_ms, legacy_queries = _measure(materialized_department_filter, dept_id, repeat)
+            compiled_count, compiled_ms, compiled_queries = _measure(compiled_department_filter, dept_id, repeat)
+            if count != compiled_count:
+                raise AssertionError(f'结果不一致: {count} != {compiled_count}')
+            results.append((size, count, legacy_ms, legacy_queries, compiled_ms, compiled_queries))
+        transaction.set_rollback(True)
+    return results
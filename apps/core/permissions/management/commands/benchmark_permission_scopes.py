@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from apps.core.permissions.benchmark import BENCHMARK_SIZES, run_scope_benchmark
+
+class Command(BaseCommand):
+    help = 'Compare materialized username lists with correlated subqueries for department data scopes (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES), help='Department sizes (users)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement, the median is reported')
+
+    def handle(self, *args, **options):
+        results = run_scope_benchmark(options['sizes'], options['repeat'])
+
+        self.stdout.write(f'{"users":>8} {"rows":>8} {"list ms":>10} {"queries":>8} {"exists ms":>10} {"queries":>8}')
+        for size, count, legacy_ms, legacy_queries, compiled_ms, compiled_queries in results:
+            self.stdout.write(
+                f'{size:>8} {count:>8} {legacy_ms:>10.2f} {legacy_queries:>8} {compiled_ms:>10.2f} {compiled_queries:>8}'
+            )
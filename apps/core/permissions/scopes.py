@@ -0,0 +1,65 @@
+from django.db.models import Exists, OuterRef, Q, Subquery
+
+
+class ScopeSpec:
+    """
+    描述业务表字段与数据权限范围的对应关系
+    owner_field: 业务表中记录提交人的字段
+    owner_user_field: 提交人字段对应的用户表字段（username 或 nickname）
+    location_field / location_lookup: 按地区查看时与用户所在部门名称比较的字段及查询方式，为空表示不支持
+    """
+
+    def __init__(self, owner_field='submitter', owner_user_field='username', location_field=None, location_lookup='exact'):
+        self.owner_field = owner_field
+        self.owner_user_field = owner_user_field
+        self.location_field = location_field
+        self.location_lookup = location_lookup
+
+
+def department_name_subquery(dept_id):
+    """用户所在部门名称的标量子查询"""
+    from apps.users.models import Department
+
+    return Subquery(Department.objects.filter(id=dept_id).values('name')[:1])
+
+
+def department_member_exists(dept_id, spec):
+    """
+    相关子查询：记录的提交人是否为该部门及其下级部门（闭包表）的用户
+    由数据库在一次查询中完成关联，不再把部门用户名列表取回 Python
+    """
+    from apps.users.models import DepartmentClosure, User
+
+    subtree = DepartmentClosure.objects.filter(ancestor_id=dept_id).values('descendant_id')
+    return Exists(
+        User.objects.filter(Q(dept_id=dept_id) | Q(dept_id__in=subtree))
+        .filter(**{spec.owner_user_field: OuterRef(spec.owner_field)})
+    )
+
+
+def compile_scope_filter(data_permissions, user, spec):
+    """
+    将模块的数据权限（compile_permissions 结果中的 data 部分）编译为查询条件
+    拥有 view_all 时返回 None，表示不限制
+    """
+    if data_permissions['view_all']:
+        return None
+
+    filters = Q()
+    if data_permissions['view_own']:
+        filters |= Q(**{spec.owner_field: getattr(user, spec.owner_user_field)})
+
+    if data_permissions['view_by_location'] and spec.location_field and user.dept_id:
+        filters |= Q(**{f'{spec.location_field}__{spec.location_lookup}': department_name_subquery(user.dept_id)})
+
+    if data_permissions['view_department_submissions'] and user.dept_id:
+        filters |= Q(department_member_exists(user.dept_id, spec))
+
+    return filters
+
+
+def apply_scope(queryset, data_permissions, user, spec):
+    filters = compile_scope_filter(data_permissions, user, spec)
+    if filters is None:
+        return queryset
+    return queryset.filter(filters)
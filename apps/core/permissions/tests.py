@@ -0,0 +1,50 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.expense.models import Expense
+from apps.users.models import Department, User
+from apps.users.services import insert_department_closure
+
+from .benchmark import compiled_department_filter, materialized_department_filter, seed_scope_benchmark
+from .scopes import ScopeSpec, compile_scope_filter
+
+DATA_PERMISSIONS = {'view_all': False, 'view_own': False, 'view_by_location': False, 'view_department_submissions': False}
+
+
+class ScopeCompilerTests(TestCase):
+    """部门数据权限编译为相关子查询后，结果应与原先的用户名列表方式一致"""
+
+    def assert_same_result(self, dept_id):
+        expected = set(Expense.objects.filter(materialized_department_filter(dept_id)).values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            actual = set(Expense.objects.filter(compiled_department_filter(dept_id)).values_list('id', flat=True))
+        self.assertEqual(actual, expected)
+        self.assertEqual(len(queries), 1)
+
+    def test_small_department(self):
+        self.assert_same_result(seed_scope_benchmark(10, records_per_user=2))
+
+    def test_large_department(self):
+        self.assert_same_result(seed_scope_benchmark(5000, records_per_user=1))
+
+    def test_compile_scopes(self):
+        dept = Department.objects.create(name='郑州')
+        insert_department_closure(dept)
+        user = User.objects.create(username='a', nickname='甲', dept_id=dept.id)
+        User.objects.create(username='b', nickname='乙', dept_id=dept.id)
+        Expense.objects.create(company_name='own', submitter='a')
+        Expense.objects.create(company_name='colleague', submitter='b')
+        Expense.objects.create(company_name='local', submitter='x', company_location='郑州')
+        Expense.objects.create(company_name='other', submitter='x', company_location='北京')
+
+        def visible(**permissions):
+            filters = compile_scope_filter({**DATA_PERMISSIONS, **permissions}, user, ScopeSpec(location_field='company_location'))
+            queryset = Expense.objects.all() if filters is None else Expense.objects.filter(filters)
+            return set(queryset.values_list('company_name', flat=True))
+
+        self.assertEqual(visible(view_all=True), {'own', 'colleague', 'local', 'other'})
+        self.assertEqual(visible(view_own=True), {'own'})
+        self.assertEqual(visible(view_by_location=True), {'local'})
+        self.assertEqual(visible(view_department_submissions=True), {'own', 'colleague'})
+        self.assertEqual(visible(view_own=True, view_by_location=True), {'own', 'local'})
@@ -0,0 +1,105 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+
+# 请求参数 count_mode 选择总数统计方式
+COUNT_MODE_PARAM = 'count_mode'
+COUNT_MODE_EXACT = 'exact'          # 精确 COUNT(*)，按 (过滤条件, 表版本) 缓存
+COUNT_MODE_ESTIMATED = 'estimated'  # 无过滤条件时读取 MySQL 表统计信息
+COUNT_MODE_NONE = 'none'            # 不统计总数，仅返回是否还有下一页
+COUNT_MODES = (COUNT_MODE_EXACT, COUNT_MODE_ESTIMATED, COUNT_MODE_NONE)
+
+COUNT_CACHE_TIMEOUT = 300
+
+
+def get_count_mode(params):
+    mode = params.get(COUNT_MODE_PARAM)
+    return mode if mode in COUNT_MODES else COUNT_MODE_EXACT
+
+
+def _table_version_key(model):
+    return f'table:{model._meta.db_table}'
+
+
+def get_table_version(model):
+    """表数据版本号，保存在数据库中，所有 worker 读到同一版本"""
+    from apps.users.services import get_cache_version
+
+    return get_cache_version(_table_version_key(model))
+
+
+def bump_table_version(model):
+    """表数据变化时调用，使所有进程中该表的精确总数缓存失效"""
+    from apps.users.services import bump_cache_version
+
+    bump_cache_version(_table_version_key(model))
+
+
+def get_exact_count(queryset):
+    """按查询 SQL 和表版本缓存的精确总数"""
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    sql_hash = hashlib.md5(sql.encode('utf-8')).hexdigest()
+    cache_key = f'count:{queryset.model._meta.db_table}:{get_table_version(queryset.model)}:{sql_hash}'
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def get_estimated_count(queryset):
+    """
+    无过滤条件时从 information_schema 读取 InnoDB 表行数估计值
+    有过滤条件或非 MySQL 数据库时退回缓存的精确总数
+    """
+    if queryset.query.where or connection.vendor != 'mysql':
+        return get_exact_count(queryset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return get_exact_count(queryset)
+    return int(row[0])
+
+
+class CountedPaginator(Paginator):
+    """使用预先计算好的总数的分页器，避免 Paginator 再执行 COUNT(*)"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._precomputed_count = count
+
+    @cached_property
+    def count(self):
+        return self._precomputed_count
+
+
+def paginate_with_count_mode(queryset, page, page_size, count_mode):
+    """
+    按指定的总数统计方式分页
+    返回 (当前页记录, 分页信息)，分页信息包含 total、hasMore 和 countMode
+    """
+    if count_mode == COUNT_MODE_NONE:
+        offset = (max(page, 1) - 1) * page_size
+        items = list(queryset[offset:offset + page_size + 1])
+        return items[:page_size], {'total': None, 'hasMore': len(items) > page_size, 'countMode': count_mode}
+
+    if count_mode == COUNT_MODE_ESTIMATED:
+        total = get_estimated_count(queryset)
+    else:
+        total = get_exact_count(queryset)
+
+    paginator = CountedPaginator(queryset, page_size, total)
+    page_obj = paginator.get_page(page)
+    return page_obj, {'total': total, 'hasMore': page_obj.has_next(), 'countMode': count_mode}
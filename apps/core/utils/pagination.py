@@ -0,0 +1,86 @@
+import base64
+import json
+
+# 请求中携带该参数（可为空，表示第一页）即启用游标分页
+CURSOR_PARAM = 'after'
+
+# 游标分页每页记录数上限
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPageSize(InvalidCursor):
+    pass
+
+
+def parse_page_size(page_size):
+    """将每页记录数转换为整数并限制在 1..MAX_PAGE_SIZE，无法转换时抛出 InvalidPageSize"""
+    if isinstance(page_size, bool):
+        raise InvalidPageSize('无效的每页记录数')
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        raise InvalidPageSize('无效的每页记录数')
+    return min(max(page_size, 1), MAX_PAGE_SIZE)
+
+
+def encode_cursor(last_id):
+    """将当前页最后一条记录的 id 编码为不透明游标"""
+    payload = json.dumps({'id': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回记录 id，格式不正确时抛出 InvalidCursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['id']
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise InvalidCursor('无效的分页游标')
+    if not isinstance(last_id, int):
+        raise InvalidCursor('无效的分页游标')
+    return last_id
+
+
+def get_cursor_page(queryset, after, page_size):
+    """
+    基于 id 索引的游标分页（按 -id 排序），不使用 OFFSET，深度翻页性能恒定
+    after 为上一页返回的游标，为空表示第一页，page_size 按 parse_page_size 规范化
+    返回 (当前页记录列表, 下一页游标)，没有更多数据时下一页游标为 None
+    """
+    page_size = parse_page_size(page_size)
+    queryset = queryset.order_by('-id')
+    if after:
+        queryset = queryset.filter(id__lt=decode_cursor(after))
+
+    # 多取一条用于判断是否还有下一页
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        # 兼容 values() 查询返回的字典
+        next_cursor = encode_cursor(last['id'] if isinstance(last, dict) else last.id)
+    return items, next_cursor
+
+
+def iter_keyset_batches(queryset, fields, batch_size):
+    """
+    按 id 升序分批读取 values_list 元组，每批一次 id > 上批最后 id 的范围查询
+    MySQL 驱动会把整个结果集读入内存，iterator(chunk_size) 并不能限制内存，分批查询才能保证每次最多 batch_size 行
+    每次产出一批记录（不含 id 的元组列表）
+    """
+    queryset = queryset.order_by('id')
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(batch.values_list('id', *fields)[:batch_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < batch_size:
+            return
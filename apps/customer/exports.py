@@ -0,0 +1,95 @@
+import json
+
+from django.db import models
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from apps.core.utils.pagination import iter_keyset_batches
+
+from .models import Customer
+
+# 每批从数据库读取的行数
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 导出支持的过滤参数 -> 字段
+EXPORT_FILTERS = {
+    'companyName': 'company_name',
+    'dailyContact': 'daily_contact',
+    'salesRepresentative': 'sales_representative',
+    'taxBureau': 'tax_bureau',
+    'bossName': 'boss_name',
+}
+
+BOOLEAN_FIELDS = ('has_online_banking', 'is_online_banking_custodian')
+
+
+def filter_export_queryset(queryset, params):
+    for param, field in EXPORT_FILTERS.items():
+        value = params.get(param)
+        if value:
+            queryset = queryset.filter(**{f'{field}__icontains': value})
+    return queryset
+
+
+def get_export_fields():
+    return [field for field in Customer._meta.get_fields() if not field.is_relation]
+
+
+def _get_formatter(field):
+    if isinstance(field, models.JSONField):
+        return lambda value: json.dumps(value, ensure_ascii=False)
+    if isinstance(field, models.DateTimeField):
+        return lambda value: value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+    if isinstance(field, models.DateField):
+        return lambda value: value.strftime('%Y-%m-%d') if value else ''
+    if field.name in BOOLEAN_FIELDS:
+        return lambda value: '是' if value == 'true' else '否' if value == 'false' else ''
+    return None
+
+
+def write_customer_workbook(queryset, output, progress=None):
+    """
+    使用 write-only 工作簿将客户数据写入 output（文件对象），
+    按 id 分批读取 values_list 结果，每次只在内存中保留一批记录
+    progress 为可选回调，每写完一批调用一次，参数为已写入行数
+    返回写入的数据行数
+    """
+    fields = get_export_fields()
+    formatters = [_get_formatter(field) for field in fields]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('客户列表')
+    # write-only 模式下列宽需在写入数据前设置
+    for col in range(1, len(fields) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 20
+    ws.append([field.verbose_name for field in fields])
+
+    count = 0
+    for rows in iter_keyset_batches(queryset, [field.name for field in fields], EXPORT_CHUNK_SIZE):
+        for row in rows:
+            ws.append([
+                formatter(value) if formatter else value
+                for formatter, value in zip(formatters, row)
+            ])
+        count += len(rows)
+        if progress:
+            progress(count)
+
+    wb.save(output)
+    if progress:
+        progress(count)
+    return count
+
+
+def run_export(user, params, output, progress):
+    """后台导出任务入口：按请求参数和用户权限导出客户 Excel，返回文件名"""
+    from .views import apply_permission_filters
+
+    queryset = filter_export_queryset(Customer.objects.all(), params)
+    queryset, _ = apply_permission_filters(queryset, user)
+    total = queryset.count()
+
+    write_customer_workbook(queryset, output, lambda count: progress(count, total))
+    return 'customers.xlsx'
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.customer.models import Customer
+from apps.customer.search import FULLTEXT_INDEX_NAME, get_fulltext_index_sql
+
+class Command(BaseCommand):
+    help = 'Create the ngram FULLTEXT index used by customer search (MySQL only)'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('FULLTEXT index requires MySQL, other databases use the in-memory search index')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s',
+                [Customer._meta.db_table, FULLTEXT_INDEX_NAME]
+            )
+            if cursor.fetchone()[0]:
+                self.stdout.write(f'Index {FULLTEXT_INDEX_NAME} already exists')
+                return
+            cursor.execute(get_fulltext_index_sql())
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created index {FULLTEXT_INDEX_NAME}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.customer.relations import rebuild_customer_relations
+
+class Command(BaseCommand):
+    help = 'Rebuild customer relation keys and company groups'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_customer_relations()
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt customer relations ({count} groups)'))
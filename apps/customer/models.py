@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from apps.core.utils.counting import bump_table_version
+from apps.core.autocomplete.services import remember_previous_values, apply_saved_values, remove_deleted_values
 from django.utils import timezone
 
 class Customer(models.Model):
@@ -73,3 +77,62 @@ class Customer(models.Model):
         verbose_name = '客户信息'
         verbose_name_plural = '客户信息'
         db_table = 'zy_customer'
+
+class CustomerRelationKey(models.Model):
+    """客户关联键（老板名称、法人身份证、联系电话、企业名称等），共享关联键的客户互相关联"""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='relation_keys', verbose_name='客户', db_comment='客户ID')
+    key = models.CharField(max_length=255, verbose_name='关联键', db_comment='关联键，格式为 类型:值')
+
+    class Meta:
+        verbose_name = '客户关联键'
+        verbose_name_plural = '客户关联键'
+        db_table = 'zy_customer_relation_key'
+        unique_together = ('customer', 'key')
+        indexes = [
+            models.Index(fields=['key']),
+        ]
+
+class CustomerGroup(models.Model):
+    """客户所属的关联企业分组（关联键图的连通分量），分组 id 为分组内最小的客户 id"""
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='group_membership', verbose_name='客户', db_comment='客户ID')
+    group_id = models.BigIntegerField(db_index=True, verbose_name='分组ID', db_comment='关联企业分组ID')
+
+    class Meta:
+        verbose_name = '关联企业分组'
+        verbose_name_plural = '关联企业分组'
+        db_table = 'zy_customer_group'
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def bump_customer_table_version(sender, **kwargs):
+    """数据变化时使总数缓存失效"""
+    bump_table_version(sender)
+
+
+@receiver(pre_save, sender=Customer)
+def remember_customer_autocomplete_values(sender, instance, **kwargs):
+    remember_previous_values('customer', instance)
+
+@receiver(post_save, sender=Customer)
+def update_customer_autocomplete_values(sender, instance, **kwargs):
+    """增量维护自动补全字典"""
+    apply_saved_values('customer', instance)
+
+@receiver(post_delete, sender=Customer)
+def remove_customer_autocomplete_values(sender, instance, **kwargs):
+    remove_deleted_values('customer', instance)
+
+@receiver(post_save, sender=Customer)
+def update_customer_relation_index(sender, instance, **kwargs):
+    """增量维护关联企业分组"""
+    from .relations import update_customer_relations
+    update_customer_relations(instance)
+
+@receiver(pre_delete, sender=Customer)
+def remember_customer_group(sender, instance, **kwargs):
+    instance._relation_group_id = CustomerGroup.objects.filter(customer_id=instance.id).values_list('group_id', flat=True).first()
+
+@receiver(post_delete, sender=Customer)
+def regroup_deleted_customer(sender, instance, **kwargs):
+    from .relations import remove_customer_relations
+    remove_customer_relations(getattr(instance, '_relation_group_id', None))
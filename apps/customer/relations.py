@@ -0,0 +1,178 @@
+import logging
+import re
+
+from django.db import transaction
+from django.db.models import Count, Subquery
+
+from .models import Customer, CustomerGroup, CustomerRelationKey
+
+logger = logging.getLogger(__name__)
+
+# 用于关联企业的联系电话字段
+# 财务负责人、办税员电话常由代账机构人员跨客户共用，不作为关联键，否则无关客户会被合并为同一分组
+PHONE_FIELDS = (
+    'daily_contact_phone',
+    'legal_representative_phone',
+)
+
+# 被超过该数量客户共享的关联键视为公共联系方式，不参与关联
+RELATION_KEY_MAX_CUSTOMERS = 50
+# 单个分组遍历的客户数上限，超过时停止扩展并记录告警
+RELATION_GROUP_MAX_SIZE = 1000
+
+RELATION_FIELDS = ('company_name', 'boss_name', 'legal_representative_id', 'affiliated_enterprises') + PHONE_FIELDS
+
+# 同宗企业文本中企业名称的分隔符
+_AFFILIATED_SPLIT_RE = re.compile(r'[,，、;；/\s]+')
+_NON_DIGIT_RE = re.compile(r'\D')
+
+
+def extract_relation_keys(customer):
+    """
+    提取客户的关联键：老板名称、法人身份证、联系电话、自身企业名称及同宗企业中解析出的企业名称
+    两个客户拥有相同的关联键即视为相关
+    """
+    keys = set()
+    if customer.company_name and customer.company_name.strip():
+        keys.add(f'company:{customer.company_name.strip()}')
+    if customer.boss_name and customer.boss_name.strip():
+        keys.add(f'boss:{customer.boss_name.strip()}')
+    if customer.legal_representative_id and customer.legal_representative_id.strip():
+        keys.add(f'legal_id:{customer.legal_representative_id.strip().upper()}')
+    for field in PHONE_FIELDS:
+        phone = _NON_DIGIT_RE.sub('', getattr(customer, field) or '')
+        if len(phone) >= 7:
+            keys.add(f'phone:{phone}')
+    for name in _AFFILIATED_SPLIT_RE.split(customer.affiliated_enterprises or ''):
+        if len(name) >= 2:
+            keys.add(f'company:{name}')
+    return {key[:255] for key in keys}
+
+
+def _linking_keys(keys):
+    """过滤掉被过多客户共享的关联键"""
+    counts = (
+        CustomerRelationKey.objects.filter(key__in=keys)
+        .values('key').annotate(customers=Count('id')).order_by()
+    )
+    return {row['key'] for row in counts if row['customers'] <= RELATION_KEY_MAX_CUSTOMERS}
+
+
+def _connected_component(customer_ids):
+    """从给定客户出发，沿共享关联键做广度优先遍历，返回连通的客户 id 集合（最多 RELATION_GROUP_MAX_SIZE 个）"""
+    component = set(customer_ids)
+    frontier = set(customer_ids)
+    seen_keys = set()
+    while frontier:
+        keys = set(CustomerRelationKey.objects.filter(customer_id__in=frontier).values_list('key', flat=True)) - seen_keys
+        if not keys:
+            break
+        seen_keys |= keys
+        keys = _linking_keys(keys)
+        if not keys:
+            break
+        linked = set(CustomerRelationKey.objects.filter(key__in=keys).values_list('customer_id', flat=True))
+        frontier = linked - component
+        if len(component) + len(frontier) > RELATION_GROUP_MAX_SIZE:
+            logger.warning('关联企业分组超过 %s 个客户，停止扩展（起点 %s）', RELATION_GROUP_MAX_SIZE, sorted(customer_ids)[:5])
+            frontier = set(sorted(frontier)[:RELATION_GROUP_MAX_SIZE - len(component)])
+        component |= frontier
+    return component
+
+
+def _lock_component(customer_ids):
+    """
+    锁定连通分量内的客户后重新计算分量，直到分量不再扩大
+    并发维护同一分组的事务按客户 id 顺序加锁而串行执行
+    """
+    component = set(customer_ids)
+    locked = set()
+    while True:
+        to_lock = component - locked
+        list(Customer.objects.select_for_update().filter(id__in=to_lock).order_by('id').values_list('id', flat=True))
+        locked |= to_lock
+        component = _connected_component(customer_ids)
+        if component <= locked:
+            return component
+
+
+def _assign_group(component):
+    """以连通分量中最小的客户 id 作为分组 id"""
+    group_id = min(component)
+    existing = set(CustomerGroup.objects.filter(customer_id__in=component).values_list('customer_id', flat=True))
+    CustomerGroup.objects.bulk_create(
+        [CustomerGroup(customer_id=customer_id, group_id=group_id) for customer_id in component - existing],
+        ignore_conflicts=True
+    )
+    CustomerGroup.objects.filter(customer_id__in=component).exclude(group_id=group_id).update(group_id=group_id)
+    return group_id
+
+
+def _regroup(customer_ids):
+    """重新计算一组客户的分组，用于关联键删除后原分组可能拆分的情况"""
+    remaining = set(customer_ids)
+    while remaining:
+        component = _lock_component([remaining.pop()])
+        _assign_group(component)
+        remaining -= component
+
+
+def update_customer_relations(customer):
+    """
+    客户保存后增量维护关联键和分组，关联键没有变化时不做任何写入
+    在事务中锁定分组内的客户，调用方应与客户保存处于同一事务
+    """
+    new_keys = extract_relation_keys(customer)
+    with transaction.atomic():
+        old_keys = set(CustomerRelationKey.objects.filter(customer_id=customer.id).values_list('key', flat=True))
+        old_group_id = CustomerGroup.objects.filter(customer_id=customer.id).values_list('group_id', flat=True).first()
+        if new_keys == old_keys and old_group_id is not None:
+            return
+
+        CustomerRelationKey.objects.filter(customer_id=customer.id, key__in=old_keys - new_keys).delete()
+        CustomerRelationKey.objects.bulk_create(
+            [CustomerRelationKey(customer_id=customer.id, key=key) for key in new_keys - old_keys],
+            ignore_conflicts=True
+        )
+
+        component = _lock_component([customer.id])
+        _assign_group(component)
+
+        # 删除了关联键时，原分组中不再连通的客户需要拆分为新的分组
+        if old_group_id is not None and old_keys - new_keys:
+            former_members = set(CustomerGroup.objects.filter(group_id=old_group_id).values_list('customer_id', flat=True))
+            _regroup(former_members - component)
+
+
+def remove_customer_relations(group_id):
+    """客户删除后（关联键和分组记录已级联删除），重新计算原分组中其余客户的分组"""
+    if group_id is None:
+        return
+    with transaction.atomic():
+        _regroup(CustomerGroup.objects.filter(group_id=group_id).values_list('customer_id', flat=True))
+
+
+def rebuild_customer_relations():
+    """全量重建关联键和分组，返回分组数量"""
+    CustomerGroup.objects.all().delete()
+    CustomerRelationKey.objects.all().delete()
+
+    keys = []
+    for customer in Customer.objects.only('id', *RELATION_FIELDS).iterator(chunk_size=2000):
+        keys.extend(CustomerRelationKey(customer_id=customer.id, key=key) for key in extract_relation_keys(customer))
+    CustomerRelationKey.objects.bulk_create(keys, batch_size=1000)
+
+    groups = 0
+    remaining = set(Customer.objects.values_list('id', flat=True))
+    while remaining:
+        component = _connected_component([remaining.pop()])
+        _assign_group(component)
+        remaining -= component
+        groups += 1
+    return groups
+
+
+def get_group_customers(customer_id):
+    """返回与客户处于同一分组的全部客户（含自身），通过分组 id 索引一次查询"""
+    group_id = CustomerGroup.objects.filter(customer_id=customer_id).values('group_id')
+    return Customer.objects.filter(group_membership__group_id=Subquery(group_id))
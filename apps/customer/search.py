@@ -0,0 +1,119 @@
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+from apps.core.utils.counting import get_table_version
+from .models import Customer
+
+# 请求参数 q 启用全文检索，结果按相关度排序
+SEARCH_PARAM = 'q'
+
+# 参与全文检索的字段，与 FULLTEXT 索引的列保持一致
+SEARCH_FIELDS = (
+    'company_name',
+    'daily_contact',
+    'boss_name',
+    'legal_representative_name',
+    'financial_contact_name',
+    'main_business',
+    'business_scope',
+    'business_address',
+)
+
+FULLTEXT_INDEX_NAME = 'ft_customer_search'
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[一-鿿]+')
+
+
+def get_search_backend():
+    """CUSTOMER_SEARCH_BACKEND 为 auto 时，MySQL 使用 FULLTEXT 索引，其它数据库使用内存倒排索引"""
+    backend = getattr(settings, 'CUSTOMER_SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'fulltext' if connection.vendor == 'mysql' else 'memory'
+    return backend
+
+
+def get_fulltext_index_sql():
+    columns = ', '.join(SEARCH_FIELDS)
+    return f'ALTER TABLE {Customer._meta.db_table} ADD FULLTEXT INDEX {FULLTEXT_INDEX_NAME} ({columns}) WITH PARSER ngram'
+
+
+def tokenize(text):
+    """
+    与 MySQL ngram 解析器（ngram_token_size=2）保持一致的分词：
+    中文按相邻两字切分，字母数字按单词切分
+    """
+    tokens = []
+    for part in _TOKEN_RE.findall((text or '').lower()):
+        if part.isascii() or len(part) == 1:
+            tokens.append(part)
+        else:
+            tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    return tokens
+
+
+class InvertedIndex:
+    """客户搜索字段的内存倒排索引，按 TF-IDF 计算相关度"""
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        self.size = 0
+        for row in rows:
+            customer_id, values = row[0], row[1:]
+            self.size += 1
+            for token in tokenize(' '.join(value for value in values if value)):
+                self.postings[token][customer_id] = self.postings[token].get(customer_id, 0) + 1
+
+    def search(self, query):
+        """返回按相关度从高到低排序的客户 id 列表，任一词命中即返回（与自然语言模式一致）"""
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + self.size / len(postings))
+            for customer_id, tf in postings.items():
+                scores[customer_id] += tf * idf
+        return sorted(scores, key=lambda customer_id: (-scores[customer_id], -customer_id))
+
+
+_memory_index = {'version': None, 'index': None}
+_memory_index_lock = threading.Lock()
+
+
+def get_memory_index():
+    """按客户表版本缓存倒排索引，客户数据变化后下次检索时重建"""
+    version = get_table_version(Customer)
+    with _memory_index_lock:
+        if _memory_index['version'] != version:
+            rows = Customer.objects.values_list('id', *SEARCH_FIELDS).iterator(chunk_size=2000)
+            _memory_index['index'] = InvertedIndex(rows)
+            _memory_index['version'] = version
+        return _memory_index['index']
+
+
+def search_customers(queryset, query):
+    """
+    在 queryset 上应用全文检索，返回附带 relevance 注解并按相关度排序的 queryset
+    其它过滤条件（权限、字段过滤）可以在返回结果上继续叠加
+    """
+    if get_search_backend() == 'fulltext':
+        columns = ', '.join(SEARCH_FIELDS)
+        relevance = RawSQL(f'MATCH ({columns}) AGAINST (%s IN NATURAL LANGUAGE MODE)', (query,))
+        return queryset.annotate(relevance=relevance).filter(relevance__gt=0).order_by('-relevance', '-id')
+
+    ranked_ids = get_memory_index().search(query)
+    if not ranked_ids:
+        return queryset.none()
+    relevance = Case(
+        *[When(id=customer_id, then=Value(len(ranked_ids) - position)) for position, customer_id in enumerate(ranked_ids)],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(id__in=ranked_ids).annotate(relevance=relevance).order_by('-relevance', '-id')
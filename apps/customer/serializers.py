@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Customer
 import json
+import datetime
 from decimal import Decimal
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -55,3 +56,55 @@ class CustomerSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         # 添加额外的验证逻辑（如果需要）
         return attrs
+
+
+# 列表默认返回的精简字段，完整字段仅在详情接口中返回
+CUSTOMER_LIST_FIELDS = (
+    'id', 'company_name', 'daily_contact', 'daily_contact_phone', 'sales_representative',
+    'tax_bureau', 'business_source', 'chief_accountant', 'responsible_accountant',
+    'enterprise_status', 'business_status', 'boss_name', 'submitter', 'create_time', 'update_time',
+)
+
+CUSTOMER_FIELD_NAMES = tuple(field.name for field in Customer._meta.concrete_fields)
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def resolve_list_fields(fields_param, field_mapping):
+    """
+    解析 fields 参数（逗号分隔，支持驼峰或下划线字段名），为空时返回默认精简字段
+    字段不存在时抛出 InvalidFields
+    """
+    if not fields_param:
+        return CUSTOMER_LIST_FIELDS
+
+    fields = ['id']
+    for name in fields_param.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        field = field_mapping.get(name, name)
+        if field not in CUSTOMER_FIELD_NAMES:
+            raise InvalidFields(f'无效的字段: {name}')
+        if field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+
+def serialize_customer_row(row):
+    """
+    将 values() 返回的字典转换为与 CustomerSerializer 一致的输出格式，
+    列表接口不再为每行实例化模型和序列化器字段
+    """
+    data = {}
+    for key, value in row.items():
+        if isinstance(value, datetime.datetime):
+            value = value.strftime('%Y-%m-%d %H:%M:%S')
+        elif isinstance(value, datetime.date):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        data[key] = value
+    return data
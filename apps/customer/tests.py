@@ -1,3 +1,217 @@
-from django.test import TestCase
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from apps.users.models import Permission, Role, User
+
+from .exports import get_export_fields
+from .models import Customer, CustomerGroup
+from .relations import get_group_customers, rebuild_customer_relations
+from .search import search_customers, tokenize
+from .serializers import CUSTOMER_LIST_FIELDS
+
+
+class CustomerRelationTests(TestCase):
+    """关联企业分组随客户增删改增量维护，结果与全量重建一致"""
+
+    def group_of(self, customer):
+        return set(get_group_customers(customer.id).values_list('company_name', flat=True))
+
+    def assert_matches_rebuild(self):
+        groups = dict(CustomerGroup.objects.values_list('customer_id', 'group_id'))
+        rebuild_customer_relations()
+        self.assertEqual(dict(CustomerGroup.objects.values_list('customer_id', 'group_id')), groups)
+
+    def test_merge_through_shared_key(self):
+        a = Customer.objects.create(company_name='甲', boss_name='张三')
+        b = Customer.objects.create(company_name='乙', legal_representative_id='110101199001011234')
+        self.assertEqual(self.group_of(a), {'甲'})
+
+        # 丙同时与甲、乙共享关联键，三者合并为一个分组
+        Customer.objects.create(company_name='丙', boss_name='张三', legal_representative_id='110101199001011234')
+        self.assertEqual(self.group_of(b), {'甲', '乙', '丙'})
+        self.assertEqual(CustomerGroup.objects.get(customer=b).group_id, a.id)
+        self.assert_matches_rebuild()
+
+    def test_split_when_key_removed(self):
+        a = Customer.objects.create(company_name='甲', boss_name='张三')
+        bridge = Customer.objects.create(company_name='乙', boss_name='张三', daily_contact_phone='13800000000')
+        c = Customer.objects.create(company_name='丙', daily_contact_phone='138-0000-0000')
+        self.assertEqual(self.group_of(c), {'甲', '乙', '丙'})
+
+        bridge.daily_contact_phone = ''
+        bridge.save()
+        self.assertEqual(self.group_of(a), {'甲', '乙'})
+        self.assertEqual(self.group_of(c), {'丙'})
+        self.assert_matches_rebuild()
+
+    def test_delete_splits_group(self):
+        a = Customer.objects.create(company_name='甲', boss_name='张三')
+        bridge = Customer.objects.create(company_name='乙', boss_name='张三', daily_contact_phone='13800000000')
+        c = Customer.objects.create(company_name='丙', daily_contact_phone='13800000000')
+
+        bridge.delete()
+        self.assertEqual(self.group_of(a), {'甲'})
+        self.assertEqual(self.group_of(c), {'丙'})
+        self.assertEqual(CustomerGroup.objects.get(customer=c).group_id, c.id)
+        self.assert_matches_rebuild()
+
+    def test_shared_agency_contacts_do_not_link(self):
+        a = Customer.objects.create(company_name='甲', tax_officer_phone='13900000000', financial_contact_phone='13700000000')
+        Customer.objects.create(company_name='乙', tax_officer_phone='13900000000', financial_contact_phone='13700000000')
+        self.assertEqual(self.group_of(a), {'甲'})
+
+    @mock.patch('apps.customer.relations.RELATION_KEY_MAX_CUSTOMERS', 2)
+    def test_widely_shared_key_is_ignored(self):
+        a = Customer.objects.create(company_name='甲', boss_name='张三')
+        Customer.objects.create(company_name='乙', boss_name='张三')
+        self.assertEqual(self.group_of(a), {'甲', '乙'})
+
+        # 第三个客户共享同一老板名称后，该关联键超过上限，不再用于新的关联
+        c = Customer.objects.create(company_name='丙', boss_name='张三')
+        self.assertEqual(self.group_of(c), {'丙'})
+
+
+@override_settings(CUSTOMER_SEARCH_BACKEND='memory')
+class CustomerSearchFallbackTests(TestCase):
+    """非 MySQL 数据库的全文检索退回内存倒排索引，按 TF-IDF 相关度排序"""
+
+    def setUp(self):
+        cache.clear()
+        self.exact = Customer.objects.create(company_name='星河科技', main_business='科技服务、科技咨询')
+        self.partial = Customer.objects.create(company_name='星河贸易')
+        self.other = Customer.objects.create(company_name='远山科技')
+        self.unrelated = Customer.objects.create(company_name='青松餐饮')
+
+    def search(self, query, queryset=None):
+        return list(search_customers(queryset or Customer.objects.all(), query).values_list('id', flat=True))
+
+    def test_tokenize_matches_ngram_parser(self):
+        self.assertEqual(tokenize('星河科技 ABC-2024'), ['星河', '河科', '科技', 'abc', '2024'])
+
+    def test_ranked_by_relevance(self):
+        # 命中词越多、词频越高越靠前，相关度相同时新记录在前
+        self.assertEqual(self.search('星河科技'), [self.exact.id, self.other.id, self.partial.id])
+        self.assertEqual(self.search('不存在'), [])
+
+    def test_filters_apply_on_top_of_search(self):
+        queryset = Customer.objects.filter(company_name__icontains='贸易')
+        self.assertEqual(self.search('星河科技', queryset), [self.partial.id])
+
+    def test_index_rebuilt_after_save(self):
+        self.assertNotIn(self.unrelated.id, self.search('星河'))
+        self.unrelated.company_name = '星河餐饮'
+        self.unrelated.save()
+        self.assertIn(self.unrelated.id, self.search('星河'))
+
+    def test_list_endpoint_keeps_ranking(self):
+        role = Role.objects.create(name='viewer', code='viewer')
+        Permission.objects.filter(role=role, permission_name='customer_data_view_all').update(permission_value=True)
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='viewer', roles=['viewer']))
+
+        data = client.get('/customer/list/', {'q': '星河科技'}).json()['data']
+        self.assertEqual([row['id'] for row in data['list']], [self.exact.id, self.other.id, self.partial.id])
+        self.assertEqual(data['total'], 3)
+
+
+class CustomerExportTests(TestCase):
+    """客户 Excel 导出：按 id 分批读取，表头与字段一致，只导出数据权限和过滤条件范围内的记录"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(5):
+            Customer.objects.create(company_name=f'星河{i}', submitter='owner' if i % 2 == 0 else 'someone')
+
+    def user_with_scope(self, username, permission_name):
+        role = Role.objects.create(name=f'scope_{username}', code=f'scope_{username}')
+        Permission.objects.filter(role=role, permission_name=permission_name).update(permission_value=True)
+        return User.objects.create(username=username, roles=[role.name])
+
+    def export(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/customer/export/', params)
+        self.assertEqual(response.status_code, 200)
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)['客户列表']
+        rows = list(sheet.iter_rows(values_only=True))
+        return rows[0], rows[1:]
+
+    def test_headers_and_rows_in_batches(self):
+        viewer = self.user_with_scope('viewer', 'customer_data_view_all')
+        with mock.patch('apps.customer.exports.EXPORT_CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            headers, rows = self.export(viewer)
+
+        fields = get_export_fields()
+        self.assertEqual(list(headers), [field.verbose_name for field in fields])
+        name_index = [field.name for field in fields].index('company_name')
+        self.assertEqual([row[name_index] for row in rows], [f'星河{i}' for i in range(5)])
+        # 每批一次带 LIMIT 的 id 范围查询：2 + 2 + 1 行
+        batches = [query['sql'] for query in queries if 'FROM "zy_customer"' in query['sql'] and 'LIMIT 2' in query['sql']]
+        self.assertEqual(len(batches), 3)
+
+    def test_scope_and_filters_limit_rows(self):
+        owner = self.user_with_scope('owner', 'customer_data_view_own')
+        headers, rows = self.export(owner)
+        submitter_index = list(headers).index(Customer._meta.get_field('submitter').verbose_name)
+        self.assertEqual([row[submitter_index] for row in rows], ['owner'] * 3)
+
+        _, rows = self.export(owner, companyName='星河2')
+        self.assertEqual(len(rows), 1)
+
+
+class CustomerListProjectionTests(TestCase):
+    """列表默认只查询精简字段，fields 参数可指定字段子集，未知字段返回 400"""
+
+    def setUp(self):
+        self.client = APIClient()
+        role = Role.objects.create(name='viewer', code='viewer')
+        Permission.objects.filter(role=role, permission_name='customer_data_view_all').update(permission_value=True)
+        self.client.force_authenticate(User.objects.create(username='viewer', roles=[role.name]))
+        Customer.objects.create(
+            company_name='星河', boss_name='张三', tax_registration_type='一般纳税人',
+            annual_inspection_password='secret', registered_capital=100,
+        )
+
+    def fetch(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/customer/list/', params)
+        # 列表查询只选取投影的列
+        list_sql = [q['sql'] for q in queries if q['sql'].startswith('SELECT "zy_customer"."id"')]
+        self.assertEqual(len(list_sql), 1)
+        select = list_sql[0].split(' FROM ')[0]
+        columns = {column.split('.')[1].strip('"') for column in select[len('SELECT '):].split(', ')}
+        return response, columns
+
+    def test_default_compact_fields(self):
+        response, columns = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        row = response.json()['data']['list'][0]
+        self.assertEqual(set(row), set(CUSTOMER_LIST_FIELDS))
+        self.assertNotIn('annual_inspection_password', row)
+        self.assertEqual(columns, set(CUSTOMER_LIST_FIELDS))
+
+    def test_fields_subset(self):
+        response, columns = self.fetch(fields='companyName, tax_registration_type,registeredCapital')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['list'], [{
+            'id': Customer.objects.get().id, 'company_name': '星河',
+            'tax_registration_type': '一般纳税人', 'registered_capital': '100',
+        }])
+        self.assertEqual(columns, {'id', 'company_name', 'tax_registration_type', 'registered_capital'})
+
+    def test_unknown_field_rejected(self):
+        response = self.client.get('/customer/list/', {'fields': 'companyName,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+    def test_cursor_page_size_validated(self):
+        response = self.client.get('/customer/list/', {'after': '', 'page_size': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        data = self.client.get('/customer/list/', {'after': '', 'page_size': '1'}).json()['data']
+        self.assertEqual((data['pageSize'], len(data['list']), data['next']), (1, 1, None))
@@ -8,6 +8,7 @@ urlpatterns = [
     path('delete/<int:pk>/', views.delete_customer, name='delete-customer'),
     path('detail/<int:id>/', views.get_customer_detail, name='get_customer_detail'),
     path('related-customers/', views.get_related_customers, name='get_related_customers'),
+    path('group/<int:id>/', views.get_customer_group, name='get_customer_group'),
     path('export/', views.export_customers, name='export_customers'),
     path('autocomplete/', views.get_autocomplete_options, name='customer-autocomplete'),
 ]
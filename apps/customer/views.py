@@ -6,7 +6,7 @@ from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.core.paginator import Paginator
 from .models import Customer
-from .serializers import CustomerSerializer
+from .serializers import CustomerSerializer, InvalidFields, resolve_list_fields, serialize_customer_row
 from django.db.models import Q, fields as model_fields, Func, F
 from django.utils import timezone
 from rest_framework.pagination import PageNumberPagination
@@ -19,14 +19,19 @@ import uuid
 from django.utils.encoding import escape_uri_path
 from django.core.exceptions import ValidationError
 from decimal import Decimal, InvalidOperation
-from django.http import HttpResponse
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-from io import BytesIO
+from django.http import FileResponse
+import tempfile
 import json
-from django.db import models
+from django.db import transaction
 from django.db.models.functions import Lower
 from apps.users.views import get_user_permissions_helper
+from apps.core.permissions.scopes import ScopeSpec, apply_scope
+from apps.core.utils.pagination import CURSOR_PARAM, InvalidCursor, get_cursor_page, parse_page_size
+from apps.core.utils.counting import get_count_mode, paginate_with_count_mode
+from apps.core.autocomplete.services import get_autocomplete_fields, get_autocomplete_values
+from .search import SEARCH_PARAM, search_customers
+from .exports import EXPORT_CONTENT_TYPE, filter_export_queryset, write_customer_workbook
+from .relations import get_group_customers
 
 # Create your views here.
 
@@ -49,25 +54,13 @@ class CustomerViewSet(ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+# 客户数据权限范围：按地区查看时匹配经营地址中包含用户所在部门名称的客户
+CUSTOMER_SCOPE = ScopeSpec(location_field='business_address', location_lookup='icontains')
+
 def apply_permission_filters(queryset, user):
     user_permissions = get_user_permissions_helper(user)
     customer_permissions = user_permissions['permissions']['customer']
-    
-    if not customer_permissions['data']['view_all']:
-        filters = Q()
-        
-        if customer_permissions['data']['view_own']:
-            filters |= Q(submitter=user.username)
-        
-        if customer_permissions['data']['view_by_location']:
-            filters |= Q(business_address__icontains=customer_permissions['data']['view_by_location'])
-        
-        if customer_permissions['data']['view_department_submissions']:
-            department_users = user.objects.filter(dept_id=user.dept_id).values_list('username', flat=True)
-            filters |= Q(submitter__in=department_users)
-        
-        queryset = queryset.filter(filters)
-    
+    queryset = apply_scope(queryset, customer_permissions['data'], user, CUSTOMER_SCOPE)
     return queryset, customer_permissions
 
 @api_view(['GET'])
@@ -80,6 +73,11 @@ def get_customer_list(request):
     # 创建字段映射
     field_mapping = generate_field_mapping()
 
+    # 全文检索，结果按相关度排序，字段过滤可继续叠加用于精确筛选
+    search_query = request.query_params.get(SEARCH_PARAM, '').strip()
+    if search_query:
+        queryset = search_customers(queryset, search_query)
+
     # 动态处理搜索参数
     for key, value in request.query_params.items():
         if value:
@@ -88,23 +86,48 @@ def get_customer_list(request):
                 queryset = queryset.filter(**{f"{db_field}__icontains": value})
 
 
+    # 列表只查询需要的字段（默认精简字段，可通过 fields 参数指定），直接序列化字典
+    try:
+        list_fields = resolve_list_fields(request.query_params.get('fields'), field_mapping)
+    except InvalidFields as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    queryset = queryset.values(*list_fields)
+
+    # 游标分页：按 id 索引定位下一页，不统计总数
+    if CURSOR_PARAM in request.query_params:
+        try:
+            page_size = parse_page_size(request.query_params.get('page_size', 10))
+            customers, next_cursor = get_cursor_page(queryset, request.query_params.get(CURSOR_PARAM), page_size)
+        except InvalidCursor as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'success': True,
+            'data': {
+                'list': [serialize_customer_row(row) for row in customers],
+                'next': next_cursor,
+                'pageSize': page_size,
+                'permissions': customer_permissions
+            }
+        })
+
     # 获取查询参数
     page = int(request.query_params.get('page', 1))
     page_size = int(request.query_params.get('page_size', 10))
 
-    # 排序
-    queryset = queryset.order_by('-id')
+    # 排序（全文检索时保持相关度排序）
+    if not search_query:
+        queryset = queryset.order_by('-id')
 
-    # 分页
-    paginator = Paginator(queryset, page_size)
-    customers = paginator.get_page(page)
+    # 分页，总数统计方式由 count_mode 参数选择
+    customers, page_info = paginate_with_count_mode(queryset, page, page_size, get_count_mode(request.query_params))
 
-    serializer = CustomerSerializer(customers, many=True, context={'request': request})
     return Response({
         'success': True,
         'data': {
-            'list': serializer.data,
-            'total': paginator.count,
+            'list': [serialize_customer_row(row) for row in customers],
+            'total': page_info['total'],
+            'hasMore': page_info['hasMore'],
+            'countMode': page_info['countMode'],
             'currentPage': page,
             'pageSize': page_size,
             'permissions': customer_permissions
@@ -119,7 +142,9 @@ def create_customer(request):
     data = request.data.copy()
     serializer = CustomerSerializer(data=data)
     if serializer.is_valid():
-        serializer.save(submitter=request.user.username)
+        # 关联企业分组与客户记录在同一事务中维护
+        with transaction.atomic():
+            serializer.save(submitter=request.user.username)
         return Response({'success': True, 'data': serializer.data}, 
                       status=status.HTTP_201_CREATED)
     else:
@@ -141,7 +166,8 @@ def update_customer(request, pk):
     try:
         serializer = CustomerSerializer(customer, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'success': True, 'data': serializer.data})
         else:
             return Response({'success': False, 'errors': serializer.errors}, 
@@ -158,7 +184,8 @@ def delete_customer(request, pk):
     except Customer.DoesNotExist:
         return Response({'success': False, 'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    customer.delete()
+    with transaction.atomic():
+        customer.delete()
     return Response({'success': True}, status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['GET'])
@@ -197,73 +224,39 @@ def get_related_customers(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def export_customers(request):
-    # 获取查询参数
-    company_name = request.query_params.get('companyName')
-    daily_contact = request.query_params.get('dailyContact')
-    sales_representative = request.query_params.get('salesRepresentative')
-    tax_bureau = request.query_params.get('taxBureau')
-    boss_name = request.query_params.get('bossName')
+def get_customer_group(request, id):
+    """返回与该客户通过老板、法人、联系电话或同宗企业关联的全部客户"""
+    if not Customer.objects.filter(id=id).exists():
+        return Response({'success': False, 'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    queryset, _ = apply_permission_filters(get_group_customers(id), request.user)
+    group = queryset.order_by('id').values('id', 'company_name', 'boss_name', 'legal_representative_name')
+
+    return Response({
+        'success': True,
+        'data': list(group)
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_customers(request):
     # 应用过滤
-    queryset = Customer.objects.all()
-    if company_name:
-        queryset = queryset.filter(company_name__icontains=company_name)
-    if daily_contact:
-        queryset = queryset.filter(daily_contact__icontains=daily_contact)
-    if sales_representative:
-        queryset = queryset.filter(sales_representative__icontains=sales_representative)
-    if tax_bureau:
-        queryset = queryset.filter(tax_bureau__icontains=tax_bureau)
-    if boss_name:
-        queryset = queryset.filter(boss_name__icontains=boss_name)
+    queryset = filter_export_queryset(Customer.objects.all(), request.query_params)
 
     # 应用权限过滤
     queryset, _ = apply_permission_filters(queryset, request.user)
 
-    # 创建工作簿和工作表
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "客户列表"
-
-    # 获取所有字段
-    fields = [field for field in Customer._meta.get_fields() if not field.is_relation]
-
-    # 写入表头
-    for col, field in enumerate(fields, start=1):
-        ws.cell(row=1, column=col, value=field.verbose_name)
-
-    # 写入数据
-    for row, customer in enumerate(queryset, start=2):
-        for col, field in enumerate(fields, start=1):
-            value = getattr(customer, field.name)
-            if isinstance(field, models.JSONField):
-                value = json.dumps(value, ensure_ascii=False)
-            elif isinstance(field, models.DateTimeField):
-                value = value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
-            elif isinstance(field, models.DateField):
-                value = value.strftime('%Y-%m-%d') if value else ''
-            elif field.name in ['has_online_banking', 'is_online_banking_custodian']:
-                value = '是' if value == 'true' else '否' if value == 'false' else ''
-            ws.cell(row=row, column=col, value=value)
-
-    # 调整列宽
-    for col in range(1, len(fields) + 1):
-        ws.column_dimensions[get_column_letter(col)].width = 20
-
-    # 保存到内存中
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
-    # 创建 HTTP 响应
-    response = HttpResponse(
-        buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=customers.xlsx'
+    # 写入临时文件后分块流式返回，避免整个工作簿在内存中保留多份
+    output = tempfile.TemporaryFile()
+    write_customer_workbook(queryset, output)
+    output.seek(0)
 
-    return response
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename='customers.xlsx',
+        content_type=EXPORT_CONTENT_TYPE
+    )
 
 def generate_field_mapping():
     """
@@ -292,7 +285,18 @@ def get_autocomplete_options(request):
         return Response({'success': False, 'error': 'Invalid field'}, status=status.HTTP_400_BAD_REQUEST)
     
     # 应用权限过滤
-    queryset, _ = apply_permission_filters(Customer.objects.all(), request.user)
+    queryset, customer_permissions = apply_permission_filters(Customer.objects.all(), request.user)
+
+    # 已维护补全字典的字段直接从内存索引查询
+    if field in get_autocomplete_fields('customer'):
+        values = get_autocomplete_values(
+            'customer', field, query, queryset, unrestricted=customer_permissions['data']['view_all']
+        )
+        if values is not None:
+            return Response({
+                'success': True,
+                'data': values
+            })
     
     # 获取唯一值，忽略大小写，并按字段值排序
     values = queryset.annotate(
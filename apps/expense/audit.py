@@ -0,0 +1,169 @@
+from collections import Counter
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apps.core.autocomplete.services import adjust_value_counts
+from apps.core.utils.counting import bump_table_version
+
+from .models import Expense, ExpenseAuditClaim
+from .summary import SOURCE_FIELDS, apply_contribution_changes, get_contribution
+
+# 单次批量审核的记录数上限
+BATCH_AUDIT_MAX_IDS = 1000
+
+# 每条记录的处理结果
+RESULT_UPDATED = 'updated'
+RESULT_NOT_FOUND = 'not_found'
+RESULT_NO_PERMISSION = 'no_permission'
+RESULT_ALREADY_AUDITED = 'already_audited'
+RESULT_NOT_AUDITED = 'not_audited'
+RESULT_CLAIMED = 'claimed_by_other'
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def parse_batch_ids(ids):
+    """校验并去重 id 列表，保持原有顺序"""
+    if not isinstance(ids, list) or not ids:
+        raise InvalidBatch('ids 必须为非空列表')
+    try:
+        ids = list(dict.fromkeys(int(expense_id) for expense_id in ids))
+    except (TypeError, ValueError):
+        raise InvalidBatch('ids 中包含无效的费用记录ID')
+    if len(ids) > BATCH_AUDIT_MAX_IDS:
+        raise InvalidBatch(f'单次最多处理 {BATCH_AUDIT_MAX_IDS} 条记录')
+    return ids
+
+
+def _batch_update(ids, scoped_queryset, is_eligible, ineligible_result, changes, auditor=None):
+    """
+    在一个事务中锁定记录，筛选出权限范围内且状态符合的记录，用一条 UPDATE 更新
+    update() 不触发信号，由此处同步维护总数缓存、自动补全字典和收入汇总表
+    返回 {id: 处理结果}
+    """
+    with transaction.atomic():
+        locked = {
+            row['id']: row
+            for row in Expense.objects.select_for_update().filter(id__in=ids).values('id', 'auditor', *SOURCE_FIELDS)
+        }
+        visible = set(scoped_queryset.filter(id__in=locked).values_list('id', flat=True))
+        claimed = set(get_active_claims(locked, exclude_auditor=auditor)) if auditor else set()
+
+        results = {}
+        eligible = []
+        for expense_id in ids:
+            row = locked.get(expense_id)
+            if row is None:
+                results[expense_id] = RESULT_NOT_FOUND
+            elif expense_id not in visible:
+                results[expense_id] = RESULT_NO_PERMISSION
+            elif not is_eligible(row):
+                results[expense_id] = ineligible_result
+            elif expense_id in claimed:
+                results[expense_id] = RESULT_CLAIMED
+            else:
+                results[expense_id] = RESULT_UPDATED
+                eligible.append(row)
+
+        if eligible:
+            eligible_ids = [row['id'] for row in eligible]
+            Expense.objects.filter(id__in=eligible_ids).update(**changes)
+            ExpenseAuditClaim.objects.filter(expense_id__in=eligible_ids).delete()
+
+            auditor_deltas = Counter()
+            for row in eligible:
+                auditor_deltas[row['auditor']] -= 1
+                auditor_deltas[changes['auditor']] += 1
+            adjust_value_counts('expense', 'auditor', auditor_deltas)
+
+            apply_contribution_changes(
+                (get_contribution(row), get_contribution({**row, 'status': changes['status']}))
+                for row in eligible
+            )
+            bump_table_version(Expense)
+    return results
+
+
+def batch_audit_expenses(ids, scoped_queryset, auditor, audit_status, reject_reason=None):
+    """批量审核未审核的记录，audit_status 为 1（通过）或 2（拒绝）"""
+    changes = {'status': audit_status, 'auditor': auditor, 'audit_date': date.today()}
+    if audit_status == 2:  # 审核拒绝
+        changes['reject_reason'] = reject_reason
+    return _batch_update(ids, scoped_queryset, lambda row: row['status'] == 0, RESULT_ALREADY_AUDITED, changes, auditor)
+
+
+def batch_cancel_audit_expenses(ids, scoped_queryset):
+    """批量取消审核，未审核的记录跳过"""
+    changes = {'status': 0, 'auditor': None, 'audit_date': None, 'reject_reason': None}
+    return _batch_update(ids, scoped_queryset, lambda row: row['status'] != 0, RESULT_NOT_AUDITED, changes)
+
+
+def get_active_claims(expense_ids, exclude_auditor=None):
+    """返回 {费用记录ID: 审核员}，仅包含租约未过期的领取"""
+    claims = ExpenseAuditClaim.objects.filter(expense_id__in=expense_ids, lease_until__gt=timezone.now())
+    if exclude_auditor:
+        claims = claims.exclude(auditor=exclude_auditor)
+    return dict(claims.values_list('expense_id', 'auditor'))
+
+
+def claim_audit_queue(auditor, scoped_queryset, count):
+    """
+    为审核员领取最多 count 条未审核记录，返回 (记录 id 列表, 租约到期时间)
+    先续期本人未过期的领取，不足部分按 id 顺序领取未被他人占用的记录；
+    候选记录以 SELECT ... FOR UPDATE SKIP LOCKED 锁定，并发领取的审核员会跳过彼此正在领取的行，不会互相等待
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.EXPENSE_AUDIT_LEASE_SECONDS)
+
+    with transaction.atomic():
+        own = ExpenseAuditClaim.objects.filter(auditor=auditor, lease_until__gt=now, expense__status=0)
+        own_ids = list(own.order_by('expense_id').values_list('expense_id', flat=True)[:count])
+        if own_ids:
+            ExpenseAuditClaim.objects.filter(expense_id__in=own_ids, auditor=auditor).update(lease_until=lease_until)
+
+        new_ids = []
+        if len(own_ids) < count:
+            active_claims = ExpenseAuditClaim.objects.filter(expense_id=OuterRef('pk'), lease_until__gt=now)
+            new_ids = list(
+                scoped_queryset.filter(status=0)
+                .exclude(Exists(active_claims))
+                .select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', flat=True)[:count - len(own_ids)]
+            )
+        if new_ids:
+            new_ids = _insert_claims(new_ids, auditor, lease_until, now)
+    return sorted(own_ids + new_ids), lease_until
+
+
+def _insert_claims(expense_ids, auditor, lease_until, now):
+    """
+    写入领取记录，返回实际领取成功的 id
+    候选记录是按快照排除有效领取后选出的，其间其他审核员可能已提交了对同一记录的领取：
+    只删除已过期的领取，插入时主键冲突说明记录已被他人领取，跳过该记录
+    """
+    ExpenseAuditClaim.objects.filter(expense_id__in=expense_ids, lease_until__lte=now).delete()
+    claimed = []
+    for expense_id in expense_ids:
+        try:
+            with transaction.atomic():
+                ExpenseAuditClaim.objects.create(expense_id=expense_id, auditor=auditor, lease_until=lease_until, claim_time=now)
+        except IntegrityError:
+            continue
+        claimed.append(expense_id)
+    return claimed
+
+
+def release_audit_claims(auditor, ids=None):
+    """归还审核员领取的记录，ids 为空时归还全部，返回归还数量"""
+    claims = ExpenseAuditClaim.objects.filter(auditor=auditor)
+    if ids is not None:
+        claims = claims.filter(expense_id__in=ids)
+    deleted, _ = claims.delete()
+    return deleted
@@ -0,0 +1,101 @@
+import csv
+import io
+
+from apps.core.utils.pagination import iter_keyset_batches
+
+from .models import Expense
+
+EXPORT_HEADERS = [
+    '企业名称', '企业类型', '企业归属地', '办照类型', '办照费用', '一次性地址费', '牌子费', '刻章费',
+    '代理类型', '代理费', '记账软件费', '地址费', '代理开始日期', '代理结束日期', '业务类型', '合同类型',
+    '开票软件服务商', '开票软件费', '开票软件开始日期', '开票软件结束日期', '参保险种', '参保人数',
+    '社保代理费', '社保开始日期', '社保结束日期', '统计局报表费', '统计开始日期', '统计结束日期',
+    '变更业务', '变更收费', '行政许可', '行政许可收费', '其他业务', '其他业务收费', '总费用',
+    '提交人', '创建日期', '收费日期', '收费方式', '审核员', '审核日期', '状态', '备注',
+]
+
+# 导出列，顺序与表头一致
+EXPORT_FIELDS = (
+    'company_name', 'company_type', 'company_location', 'license_type', 'license_fee', 'one_time_address_fee',
+    'brand_fee', 'seal_fee', 'agency_type', 'agency_fee', 'accounting_software_fee', 'address_fee',
+    'agency_start_date', 'agency_end_date', 'business_type', 'contract_type', 'invoice_software_provider',
+    'invoice_software_fee', 'invoice_software_start_date', 'invoice_software_end_date', 'insurance_types',
+    'insured_count', 'social_insurance_agency_fee', 'social_insurance_start_date', 'social_insurance_end_date',
+    'statistical_report_fee', 'statistical_start_date', 'statistical_end_date', 'change_business', 'change_fee',
+    'administrative_license', 'administrative_license_fee', 'other_business', 'other_business_fee', 'total_fee',
+    'submitter', 'create_time', 'charge_date', 'charge_method', 'auditor', 'audit_date', 'status', 'remarks',
+)
+
+# 每批从数据库读取的行数，每读完一批输出一次并回调进度
+EXPORT_CHUNK_SIZE = 2000
+
+STATUS_LABELS = dict(Expense._meta.get_field('status').choices)
+CREATE_TIME_INDEX = EXPORT_FIELDS.index('create_time')
+STATUS_INDEX = EXPORT_FIELDS.index('status')
+
+
+class _Echo:
+    """csv.writer 的伪文件对象，writerow 直接返回格式化后的一行文本"""
+
+    def write(self, value):
+        return value
+
+
+def iter_expense_csv(queryset, progress=None):
+    """
+    按 id 分批读取 values_list 元组并生成 CSV 文本块（首块包含 BOM 和表头），不实例化模型，
+    每次只在内存中保留一批记录
+    状态通过预先计算的映射表转换为显示名称
+    progress 为可选回调，参数为已输出行数
+    """
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(EXPORT_HEADERS)
+
+    count = 0
+    for rows in iter_keyset_batches(queryset, EXPORT_FIELDS, EXPORT_CHUNK_SIZE):
+        lines = []
+        for row in rows:
+            row = list(row)
+            # 格式化创建日期到秒级别
+            create_time = row[CREATE_TIME_INDEX]
+            row[CREATE_TIME_INDEX] = create_time.strftime('%Y-%m-%d %H:%M:%S') if create_time else ''
+            row[STATUS_INDEX] = STATUS_LABELS.get(row[STATUS_INDEX], row[STATUS_INDEX])
+            lines.append(writer.writerow(row))
+        yield ''.join(lines)
+
+        count += len(rows)
+        if progress:
+            progress(count)
+    if progress:
+        progress(count)
+
+
+def write_expense_csv(queryset, output, progress=None):
+    """将费用 CSV 写入文本文件对象，返回写入的数据行数"""
+    count = 0
+
+    def track(written):
+        nonlocal count
+        count = written
+        if progress:
+            progress(written)
+
+    for chunk in iter_expense_csv(queryset, track):
+        output.write(chunk)
+    return count
+
+
+def run_export(user, params, output, progress):
+    """后台导出任务入口：按搜索参数和用户权限导出费用 CSV，返回文件名"""
+    from .views import apply_user_permission_filters, build_search_query_from_params
+
+    queryset, _ = apply_user_permission_filters(Expense.objects.all(), user)
+    queryset = queryset.filter(build_search_query_from_params(params))
+    total = queryset.count()
+
+    text_output = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    write_expense_csv(queryset, text_output, lambda count: progress(count, total))
+    text_output.flush()
+    # 交还底层文件对象，避免 TextIOWrapper 回收时关闭它
+    text_output.detach()
+    return 'expenses.csv'
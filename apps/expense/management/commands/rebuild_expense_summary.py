@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.expense.summary import rebuild_summary
+
+class Command(BaseCommand):
+    help = 'Recompute the expense revenue summary table from scratch and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not rewrite the summary table')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = rebuild_summary(dry_run=options['dry_run'])
+
+        for key, current, expected in drift:
+            self.stdout.write(self.style.WARNING(f'Drift {key}: stored={current} expected={expected}'))
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drift)} summary rows drifted (dry run, nothing written)')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt expense summary ({len(drift)} rows drifted)'))
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from apps.core.utils.counting import bump_table_version
+from apps.core.autocomplete.services import remember_previous_values, apply_saved_values, remove_deleted_values
 from django.conf import settings
 from django.core.validators import MaxLengthValidator
 from django.utils import timezone
@@ -65,3 +69,98 @@ class Expense(models.Model):
         verbose_name = '费用记录'
         verbose_name_plural = '费用记录'
         db_table = 'zy_expense'
+        indexes = [
+            # 列表按状态筛选并按 id 倒序分页
+            models.Index(fields=['status', 'id'], name='expense_status_id_idx'),
+            # 本人数据权限按提交人精确过滤，可叠加状态（搜索表单的提交人为模糊匹配，不走此索引）
+            models.Index(fields=['submitter', 'status'], name='expense_submitter_status_idx'),
+            # 按地区数据权限，地区与用户部门名称精确比较（搜索表单的地区为模糊匹配，不走此索引）
+            models.Index(fields=['company_location', 'status'], name='expense_location_status_idx'),
+            # 收费日期区间查询及按状态统计收入
+            models.Index(fields=['charge_date', 'status'], name='expense_charge_date_idx'),
+            models.Index(fields=['create_time'], name='expense_create_time_idx'),
+            models.Index(fields=['audit_date'], name='expense_audit_date_idx'),
+        ]
+
+class ExpenseRevenueSummary(models.Model):
+    """按月份、企业归属地、业务类型、收费方式和状态汇总的费用金额，随费用增删改审核增量维护"""
+    month = models.DateField(verbose_name='月份', db_comment='收费月份（每月1日），无收费日期时按创建日期')
+    company_location = models.CharField(max_length=255, default='', blank=True, verbose_name='企业归属地', db_comment='企业归属地')
+    business_type = models.CharField(max_length=100, default='', blank=True, verbose_name='业务类型', db_comment='业务类型')
+    charge_method = models.CharField(max_length=100, default='', blank=True, verbose_name='收费方式', db_comment='收费方式')
+    status = models.IntegerField(verbose_name='状态', db_comment='费用状态')
+    count = models.IntegerField(default=0, verbose_name='记录数', db_comment='费用记录数')
+    license_fee = models.BigIntegerField(default=0, verbose_name='办照费用合计', db_comment='办照费用合计')
+    one_time_address_fee = models.BigIntegerField(default=0, verbose_name='一次性地址费合计', db_comment='一次性地址费合计')
+    brand_fee = models.BigIntegerField(default=0, verbose_name='牌子费合计', db_comment='牌子费合计')
+    seal_fee = models.BigIntegerField(default=0, verbose_name='刻章费合计', db_comment='刻章费合计')
+    agency_fee = models.BigIntegerField(default=0, verbose_name='代理费合计', db_comment='代理费合计')
+    accounting_software_fee = models.BigIntegerField(default=0, verbose_name='记账软件费合计', db_comment='记账软件费合计')
+    address_fee = models.BigIntegerField(default=0, verbose_name='地址费合计', db_comment='地址费合计')
+    invoice_software_fee = models.BigIntegerField(default=0, verbose_name='开票软件费合计', db_comment='开票软件费合计')
+    social_insurance_agency_fee = models.BigIntegerField(default=0, verbose_name='社保代理费合计', db_comment='社保代理费合计')
+    statistical_report_fee = models.BigIntegerField(default=0, verbose_name='统计局报表费合计', db_comment='统计局报表费合计')
+    change_fee = models.BigIntegerField(default=0, verbose_name='变更收费合计', db_comment='变更收费合计')
+    administrative_license_fee = models.BigIntegerField(default=0, verbose_name='行政许可收费合计', db_comment='行政许可收费合计')
+    other_business_fee = models.BigIntegerField(default=0, verbose_name='其他业务收费合计', db_comment='其他业务收费合计')
+    total_fee = models.BigIntegerField(default=0, verbose_name='总费用合计', db_comment='总费用合计')
+
+    class Meta:
+        verbose_name = '费用收入汇总'
+        verbose_name_plural = '费用收入汇总'
+        db_table = 'zy_expense_revenue_summary'
+        unique_together = ('month', 'company_location', 'business_type', 'charge_method', 'status')
+
+
+class ExpenseAuditClaim(models.Model):
+    """审核队列中审核员对未审核费用记录的领取租约，过期后记录可被其他审核员领取"""
+    expense = models.OneToOneField(Expense, on_delete=models.CASCADE, primary_key=True, related_name='audit_claim', verbose_name='费用记录', db_comment='费用记录ID')
+    auditor = models.CharField(max_length=100, verbose_name='审核员', db_comment='领取记录的审核员用户名')
+    lease_until = models.DateTimeField(verbose_name='租约到期时间', db_comment='租约到期时间')
+    claim_time = models.DateTimeField(default=timezone.now, verbose_name='领取时间', db_comment='领取时间')
+
+    class Meta:
+        verbose_name = '费用审核领取'
+        verbose_name_plural = '费用审核领取'
+        db_table = 'zy_expense_audit_claim'
+        indexes = [
+            models.Index(fields=['auditor', 'lease_until'], name='audit_claim_auditor_idx'),
+            models.Index(fields=['lease_until'], name='audit_claim_lease_idx'),
+        ]
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def bump_expense_table_version(sender, **kwargs):
+    """数据变化时使总数缓存失效"""
+    bump_table_version(sender)
+
+
+@receiver(pre_save, sender=Expense)
+def remember_expense_autocomplete_values(sender, instance, **kwargs):
+    remember_previous_values('expense', instance)
+
+@receiver(post_save, sender=Expense)
+def update_expense_autocomplete_values(sender, instance, **kwargs):
+    """增量维护自动补全字典"""
+    apply_saved_values('expense', instance)
+
+@receiver(post_delete, sender=Expense)
+def remove_expense_autocomplete_values(sender, instance, **kwargs):
+    remove_deleted_values('expense', instance)
+
+@receiver(pre_save, sender=Expense)
+def remember_expense_summary_contribution(sender, instance, **kwargs):
+    from .summary import remember_previous_contribution
+    remember_previous_contribution(instance)
+
+@receiver(post_save, sender=Expense)
+def update_expense_revenue_summary(sender, instance, **kwargs):
+    """增量维护收入汇总表，调用方需在同一事务中保存费用记录"""
+    from .summary import apply_saved_contribution
+    apply_saved_contribution(instance)
+
+@receiver(post_delete, sender=Expense)
+def remove_expense_summary_contribution(sender, instance, **kwargs):
+    from .summary import apply_deleted_contribution
+    apply_deleted_contribution(instance)
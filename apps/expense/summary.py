@@ -0,0 +1,150 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Expense, ExpenseRevenueSummary
+
+# 汇总的金额字段
+FEE_FIELDS = (
+    'license_fee', 'one_time_address_fee', 'brand_fee', 'seal_fee', 'agency_fee',
+    'accounting_software_fee', 'address_fee', 'invoice_software_fee', 'social_insurance_agency_fee',
+    'statistical_report_fee', 'change_fee', 'administrative_license_fee', 'other_business_fee', 'total_fee',
+)
+
+KEY_FIELDS = ('month', 'company_location', 'business_type', 'charge_method', 'status')
+
+# 计算汇总键和金额需要读取的费用字段
+SOURCE_FIELDS = ('charge_date', 'create_time', 'company_location', 'business_type', 'charge_method', 'status') + FEE_FIELDS
+
+
+def summary_month(charge_date, create_time):
+    """按收费日期归入月份，没有收费日期时按创建日期（本地时区）"""
+    day = charge_date
+    if day is None and create_time is not None:
+        day = timezone.localtime(create_time).date() if timezone.is_aware(create_time) else create_time.date()
+    return day.replace(day=1) if day else None
+
+
+def get_contribution(values):
+    """
+    由费用字段值（字典）计算其在汇总表中的 (汇总键, 金额字典)
+    无法确定月份时返回 None
+    """
+    month = summary_month(values['charge_date'], values['create_time'])
+    if month is None:
+        return None
+    key = (
+        month,
+        values['company_location'] or '',
+        values['business_type'] or '',
+        values['charge_method'] or '',
+        int(values['status'] or 0),
+    )
+    return key, {field: int(values[field] or 0) for field in FEE_FIELDS}
+
+
+def _instance_values(instance):
+    return {field: getattr(instance, field) for field in SOURCE_FIELDS}
+
+
+def _apply_delta(key, delta):
+    lookup = dict(zip(KEY_FIELDS, key))
+    changes = {field: F(field) + amount for field, amount in delta.items()}
+
+    rows = ExpenseRevenueSummary.objects.filter(**lookup)
+    if rows.update(**changes):
+        if delta['count'] < 0:
+            rows.filter(count__lte=0).delete()
+        return
+    if delta['count'] <= 0:
+        return
+    try:
+        with transaction.atomic():
+            ExpenseRevenueSummary.objects.create(**lookup, **delta)
+    except IntegrityError:
+        # 并发插入时另一事务已创建该汇总行
+        rows.update(**changes)
+
+
+def apply_contribution_changes(changes):
+    """
+    批量应用 (旧贡献, 新贡献) 变化：按汇总键合并增量后每个汇总键只写入一次
+    用于 queryset.update() 等不触发信号的批量更新
+    """
+    deltas = {}
+    for old, new in changes:
+        if old == new:
+            continue
+        for contribution, sign in ((old, -1), (new, 1)):
+            if contribution is None:
+                continue
+            key, fees = contribution
+            delta = deltas.setdefault(key, dict.fromkeys(('count',) + FEE_FIELDS, 0))
+            delta['count'] += sign
+            for field, amount in fees.items():
+                delta[field] += sign * amount
+    for key, delta in deltas.items():
+        if any(delta.values()):
+            _apply_delta(key, delta)
+
+
+def apply_contribution_change(old, new):
+    """从汇总表中扣除旧贡献并加上新贡献，贡献相同时不做写入"""
+    apply_contribution_changes([(old, new)])
+
+
+def remember_previous_contribution(instance):
+    previous = None
+    if instance.pk:
+        values = Expense.objects.filter(pk=instance.pk).values(*SOURCE_FIELDS).first()
+        previous = get_contribution(values) if values else None
+    instance._summary_previous = previous
+
+
+def apply_saved_contribution(instance):
+    apply_contribution_change(getattr(instance, '_summary_previous', None), get_contribution(_instance_values(instance)))
+
+
+def apply_deleted_contribution(instance):
+    apply_contribution_change(get_contribution(_instance_values(instance)), None)
+
+
+def compute_summary(chunk_size=2000):
+    """从费用表全量计算汇总结果，返回 {汇总键: {'count': 记录数, 金额字段: 合计}}"""
+    totals = {}
+    for values in Expense.objects.values(*SOURCE_FIELDS).iterator(chunk_size=chunk_size):
+        contribution = get_contribution(values)
+        if contribution is None:
+            continue
+        key, fees = contribution
+        row = totals.setdefault(key, dict.fromkeys(('count',) + FEE_FIELDS, 0))
+        row['count'] += 1
+        for field, amount in fees.items():
+            row[field] += amount
+    return totals
+
+
+def rebuild_summary(dry_run=False):
+    """
+    全量重算汇总表并与现有数据比较
+    返回差异列表 [(汇总键, 现有值或 None, 重算值或 None)]，dry_run 为 False 时用重算结果替换汇总表
+    """
+    expected = compute_summary()
+    current = {
+        tuple(row[field] for field in KEY_FIELDS): {field: row[field] for field in ('count',) + FEE_FIELDS}
+        for row in ExpenseRevenueSummary.objects.values(*KEY_FIELDS, 'count', *FEE_FIELDS)
+    }
+
+    drift = [
+        (key, current.get(key), expected.get(key))
+        for key in sorted(set(current) | set(expected), key=str)
+        if current.get(key) != expected.get(key)
+    ]
+
+    if not dry_run:
+        ExpenseRevenueSummary.objects.all().delete()
+        ExpenseRevenueSummary.objects.bulk_create([
+            ExpenseRevenueSummary(**dict(zip(KEY_FIELDS, key)), **values)
+            for key, values in expected.items()
+        ], batch_size=1000)
+    return drift
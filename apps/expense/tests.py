@@ -1,3 +1,536 @@
-from django.test import TestCase
+import csv
+import datetime
+import random
+import threading
+import unittest
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.core.autocomplete.models import AutocompleteValue
+from apps.core.autocomplete.services import get_autocomplete_values, invalidate_index, rebuild_autocomplete, search_index
+from apps.users.models import CacheVersion, Department, Permission, Role, User
+
+from .audit import (
+    BATCH_AUDIT_MAX_IDS, RESULT_ALREADY_AUDITED, RESULT_CLAIMED, RESULT_NO_PERMISSION, RESULT_NOT_AUDITED,
+    RESULT_NOT_FOUND, RESULT_UPDATED, _insert_claims, claim_audit_queue,
+)
+from .exports import EXPORT_FIELDS, EXPORT_HEADERS, iter_expense_csv
+from .models import Expense, ExpenseAuditClaim, ExpenseRevenueSummary
+from .summary import rebuild_summary
+from .views import apply_user_permission_filters, build_search_query
+
+SEED_ROWS = 20000
+
+
+def list_queryset(user, params=None):
+    """与 get_expense_list 相同的构建方式：先应用数据权限，再应用搜索条件"""
+    request = Request(APIRequestFactory().get('/expense/', params or {}))
+    queryset, _ = apply_user_permission_filters(Expense.objects.all(), user)
+    return queryset.filter(build_search_query(request))
+
+
+@unittest.skipUnless(connection.vendor == 'mysql', 'EXPLAIN 检查依赖 MySQL 执行计划')
+class ExpenseQueryPlanTests(TransactionTestCase):
+    """常用的费用筛选条件不应退化为全表扫描"""
+
+    def setUp(self):
+        rng = random.Random(0)
+        today = datetime.date(2025, 1, 1)
+        rows = []
+        for i in range(SEED_ROWS):
+            day = today - datetime.timedelta(days=rng.randrange(1500))
+            # 大部分记录已审核，待审核的只占少数
+            status = 0 if i % 50 == 0 else rng.choice((1, 1, 1, 2))
+            rows.append(Expense(
+                company_name=f'企业{i}',
+                company_location=f'地区{rng.randrange(40)}',
+                submitter=f'user_{rng.randrange(300)}',
+                status=status,
+                charge_date=day,
+                audit_date=day if status == 1 else None,
+                create_time=datetime.datetime.combine(day, datetime.time(9), tzinfo=datetime.timezone.utc),
+                total_fee=rng.randrange(100, 10000),
+            ))
+        Expense.objects.bulk_create(rows, batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE TABLE {Expense._meta.db_table}')
+            cursor.fetchall()
+
+        self.admin = self.user_with_scope('admin', 'expense_data_view_all')
+        self.owner = self.user_with_scope('user_7', 'expense_data_view_own')
+        self.regional = self.user_with_scope(
+            'regional', 'expense_data_view_by_location', dept=Department.objects.create(name='地区3'),
+        )
+
+    def user_with_scope(self, username, permission_name, dept=None):
+        role = Role.objects.create(name=f'scope_{username}', code=f'scope_{username}')
+        Permission.objects.filter(role=role, permission_name=permission_name).update(permission_value=True)
+        return User.objects.create(username=username, roles=[role.name], dept_id=dept.id if dept else None)
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def test_filter_shapes_use_indexes(self):
+        # 提交人、地区索引服务于数据权限范围（精确匹配）；搜索表单中的提交人、地区是 icontains 模糊匹配，用不上索引，不在此列
+        shapes = {
+            'pending_page': list_queryset(self.admin, {'status': '0'}).order_by('-id')[:10],
+            'own_submissions': list_queryset(self.owner).order_by('-id')[:10],
+            'own_pending': list_queryset(self.owner, {'status': '0'}),
+            'location_scope': list_queryset(self.regional).order_by('-id')[:10],
+            'location_pending': list_queryset(self.regional, {'status': '0'}),
+            'charge_date_range': list_queryset(self.admin, {'chargeDateStart': '2024-12-01', 'chargeDateEnd': '2024-12-31'}),
+            'audited_charge_range': list_queryset(self.admin, {'status': '1', 'chargeDateStart': '2024-12-01', 'chargeDateEnd': '2024-12-31'}),
+            'recent_created': list_queryset(self.admin, {'create_time': '2024-12-15'}),
+            'recent_audited': list_queryset(self.admin, {'audit_date': '2024-12-15'}),
+        }
+        for name, queryset in shapes.items():
+            with self.subTest(shape=name):
+                plan = self.explain(queryset)
+                scans = [row for row in plan if row['table'] == Expense._meta.db_table and row['type'] == 'ALL']
+                self.assertFalse(scans, f'{name} 退化为全表扫描: {plan}')
+
+
+class ExpenseAuditQueueTests(TestCase):
+    """审核队列：同一记录在租约有效期内只会分配给一个审核员"""
+
+    def setUp(self):
+        Expense.objects.bulk_create([Expense(company_name=f'企业{i}') for i in range(6)])
+        self.ids = sorted(Expense.objects.values_list('id', flat=True))
+
+    def claim(self, auditor, count):
+        return claim_audit_queue(auditor, Expense.objects.all(), count)[0]
+
+    def test_claims_are_disjoint_and_renewed(self):
+        first = self.claim('a', 2)
+        second = self.claim('b', 2)
+        self.assertEqual(first, self.ids[:2])
+        self.assertEqual(second, self.ids[2:4])
+        # 再次领取时续期本人的记录并补足数量
+        self.assertEqual(self.claim('a', 3), self.ids[:2] + [self.ids[4]])
+
+    def test_live_lease_survives_other_claim(self):
+        self.claim('b', 2)
+        lease = dict(ExpenseAuditClaim.objects.values_list('expense_id', 'lease_until'))
+
+        self.assertEqual(self.claim('a', 10), self.ids[2:])
+        survived = ExpenseAuditClaim.objects.filter(expense_id__in=self.ids[:2])
+        self.assertEqual(set(survived.values_list('auditor', flat=True)), {'b'})
+        self.assertEqual(dict(survived.values_list('expense_id', 'lease_until')), lease)
+
+    def test_expired_lease_is_reassigned(self):
+        self.claim('b', 2)
+        ExpenseAuditClaim.objects.update(lease_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.claim('a', 2), self.ids[:2])
+        self.assertEqual(set(ExpenseAuditClaim.objects.values_list('auditor', flat=True)), {'a'})
+
+    def test_stale_candidate_keeps_committed_claim(self):
+        """模拟候选记录选出后、写入前另一审核员已提交领取的交错顺序"""
+        self.claim('b', 1)
+        now = timezone.now()
+        claimed = _insert_claims(self.ids[:2], 'a', now + datetime.timedelta(minutes=10), now)
+        self.assertEqual(claimed, [self.ids[1]])
+        self.assertEqual(ExpenseAuditClaim.objects.get(expense_id=self.ids[0]).auditor, 'b')
+
+
+@unittest.skipUnless(connection.vendor == 'mysql', 'SKIP LOCKED 并发领取依赖 MySQL 行锁')
+class ExpenseAuditQueueConcurrencyTests(TransactionTestCase):
+    """多个审核员并发领取时不会分到同一条记录"""
+
+    AUDITORS = 8
+    PER_CLAIM = 5
+
+    def setUp(self):
+        Expense.objects.bulk_create([Expense(company_name=f'企业{i}') for i in range(self.AUDITORS * self.PER_CLAIM * 2)])
+
+    def test_concurrent_claims_are_disjoint(self):
+        results = {}
+        barrier = threading.Barrier(self.AUDITORS)
+
+        def worker(auditor):
+            try:
+                barrier.wait()
+                for _ in range(2):
+                    results.setdefault(auditor, set()).update(
+                        claim_audit_queue(auditor, Expense.objects.all(), self.PER_CLAIM * 2)[0]
+                    )
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(f'auditor_{i}',)) for i in range(self.AUDITORS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [expense_id for ids in results.values() for expense_id in ids]
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(
+            dict(ExpenseAuditClaim.objects.values_list('expense_id', 'auditor')),
+            {expense_id: auditor for auditor, ids in results.items() for expense_id in ids},
+        )
+
+
+class ExpenseCountModeTests(TestCase):
+    """费用列表的总数统计方式：exact 缓存精确总数，estimated 在非 MySQL 上退回精确总数，none 不执行 COUNT"""
+
+    def setUp(self):
+        cache.clear()
+        role = Role.objects.create(name='viewer', code='viewer')
+        Permission.objects.filter(role=role, permission_name='expense_data_view_all').update(permission_value=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='viewer', roles=['viewer']))
+        for i in range(3):
+            Expense.objects.create(company_name=f'企业{i}')
+
+    def fetch(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/expense/', {'page_size': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        counts = [query['sql'] for query in queries if 'COUNT(' in query['sql'].upper()]
+        return response.json()['data'], counts
+
+    def test_exact_count_is_cached_until_data_changes(self):
+        data, counts = self.fetch()
+        self.assertEqual((data['total'], data['hasMore'], data['countMode']), (3, True, 'exact'))
+        self.assertEqual(len(counts), 1)
+
+        data, counts = self.fetch()
+        self.assertEqual((data['total'], counts), (3, []))
+
+        Expense.objects.create(company_name='企业3')
+        data, counts = self.fetch()
+        self.assertEqual((data['total'], len(counts)), (4, 1))
+
+    def test_version_bumped_elsewhere_invalidates_count(self):
+        self.assertEqual(self.fetch()[0]['total'], 3)
+        # 其它 worker 写入数据：本进程缓存未被清除，只有数据库中的表版本发生变化
+        Expense.objects.bulk_create([Expense(company_name='企业3')])
+        self.assertEqual(self.fetch()[0]['total'], 3)
+        CacheVersion.objects.filter(key=f'table:{Expense._meta.db_table}').update(version='changed-elsewhere')
+        data, counts = self.fetch()
+        self.assertEqual((data['total'], len(counts)), (4, 1))
+
+    def test_estimated_falls_back_to_exact(self):
+        data, _ = self.fetch(count_mode='estimated')
+        self.assertEqual((data['total'], data['countMode']), (3, 'estimated'))
+
+    def test_none_skips_count(self):
+        data, counts = self.fetch(count_mode='none')
+        self.assertEqual((data['total'], data['hasMore'], len(data['list']), counts), (None, True, 2, []))
+
+        data, counts = self.fetch(count_mode='none', page=2)
+        self.assertEqual((data['hasMore'], len(data['list']), counts), (False, 1, []))
+
+    def test_unknown_mode_uses_exact(self):
+        data, _ = self.fetch(count_mode='bogus')
+        self.assertEqual((data['total'], data['countMode']), (3, 'exact'))
+
+
+class ExpenseCursorPaginationTests(TestCase):
+    """费用列表游标分页：每页记录数在转换前校验，无效值返回 400"""
+
+    def setUp(self):
+        role = Role.objects.create(name='viewer', code='viewer')
+        Permission.objects.filter(role=role, permission_name='expense_data_view_all').update(permission_value=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='viewer', roles=['viewer']))
+        for i in range(3):
+            Expense.objects.create(company_name=f'企业{i}')
+
+    def test_walks_all_pages(self):
+        seen = []
+        after = ''
+        while after is not None:
+            data = self.client.get('/expense/', {'after': after, 'page_size': '2'}).json()['data']
+            self.assertEqual(data['pageSize'], 2)
+            seen.extend(expense['company_name'] for expense in data['list'])
+            after = data['next']
+        self.assertEqual(sorted(seen), ['企业0', '企业1', '企业2'])
+
+    def test_invalid_page_size_returns_400(self):
+        response = self.client.get('/expense/', {'after': '', 'page_size': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+
+class ExpenseAutocompleteTests(TestCase):
+    """自动补全字典随费用记录的新建、修改、删除增量维护"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.viewer = self.user_with_scope('viewer', 'expense_data_view_all')
+
+    def user_with_scope(self, username, permission_name):
+        role = Role.objects.create(name=f'scope_{username}', code=f'scope_{username}')
+        Permission.objects.filter(role=role, permission_name=permission_name).update(permission_value=True)
+        return User.objects.create(username=username, roles=[role.name])
+
+    def counts(self, field):
+        return dict(AutocompleteValue.objects.filter(source='expense', field=field).values_list('value', 'count'))
+
+    def assert_matches_rebuild(self):
+        entries = set(AutocompleteValue.objects.filter(source='expense').values_list('field', 'value', 'count'))
+        rebuild_autocomplete('expense')
+        self.assertEqual(set(AutocompleteValue.objects.filter(source='expense').values_list('field', 'value', 'count')), entries)
+
+    def options(self, user, field, query):
+        self.client.force_authenticate(user)
+        response = self.client.get('/expense/autocomplete/', {'field': field, 'query': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_counts_follow_save_and_delete(self):
+        first = Expense.objects.create(company_name='星河科技', company_location='杭州')
+        Expense.objects.create(company_name='星河贸易', company_location='杭州')
+        self.assertEqual(self.counts('company_location'), {'杭州': 2})
+
+        first.company_location = '宁波'
+        first.save()
+        self.assertEqual(self.counts('company_location'), {'杭州': 1, '宁波': 1})
+
+        first.delete()
+        self.assertEqual(self.counts('company_location'), {'杭州': 1})
+        self.assertEqual(self.counts('company_name'), {'星河贸易': 1})
+        self.assert_matches_rebuild()
+
+    def test_options_reflect_changes_immediately(self):
+        expense = Expense.objects.create(company_name='Star Tech')
+        Expense.objects.create(company_name='Northstar')
+        # 前缀匹配在前，包含匹配在后
+        self.assertEqual(self.options(self.viewer, 'company_name', 'star'), ['Star Tech', 'Northstar'])
+
+        expense.company_name = 'Moon Tech'
+        expense.save()
+        self.assertEqual(self.options(self.viewer, 'company_name', 'star'), ['Northstar'])
+
+    def test_scoped_user_sees_only_visible_values(self):
+        owner = self.user_with_scope('owner', 'expense_data_view_own')
+        Expense.objects.create(company_name='Star Tech', submitter='owner')
+        Expense.objects.create(company_name='Star Trade', submitter='someone')
+        self.assertEqual(self.options(owner, 'company_name', 'star'), ['Star Tech'])
+
+    def index_values(self, *values):
+        AutocompleteValue.objects.bulk_create(
+            AutocompleteValue(source='expense', field='company_name', value=value, count=1) for value in values
+        )
+        invalidate_index('expense', 'company_name')
+
+    def test_search_stops_at_limit(self):
+        self.index_values('Star A', 'Star B', 'Star C', 'Northstar', 'Lodestar', 'Polestar')
+        # 前缀匹配已凑满时不再扫描包含匹配
+        self.assertEqual(search_index('expense', 'company_name', 'star', 2), ['Star A', 'Star B'])
+        self.assertEqual(search_index('expense', 'company_name', 'star', 5), ['Star A', 'Star B', 'Star C', 'Lodestar', 'Northstar'])
+        self.assertEqual(search_index('expense', 'company_name', 'estar', 1), ['Lodestar'])
+        # 单字符查询只做前缀匹配
+        self.assertEqual(search_index('expense', 'company_name', 'p', 10), ['Polestar'])
+        self.assertEqual(search_index('expense', 'company_name', 'a', 10), [])
+
+    def test_scoped_candidates_over_limit_fall_back(self):
+        self.index_values('Star A', 'Star B', 'Star C')
+        with mock.patch('apps.core.autocomplete.services.SCOPE_CANDIDATE_LIMIT', 2):
+            self.assertIsNone(get_autocomplete_values('expense', 'company_name', 'star', Expense.objects.all(), False))
+        Expense.objects.create(company_name='Star B')
+        self.assertEqual(get_autocomplete_values('expense', 'company_name', 'star', Expense.objects.all(), False), ['Star B'])
+
+
+class ExpenseRevenueSummaryTests(TestCase):
+    """收入汇总表随费用新建、修改、删除、审核增量维护，与全量重算结果一致"""
+
+    def setUp(self):
+        role = Role.objects.create(name='auditor', code='auditor')
+        Permission.objects.filter(role=role, permission_name='expense_data_view_all').update(permission_value=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='auditor', roles=['auditor']))
+        self.march = Expense.objects.create(
+            company_name='甲', company_location='杭州', charge_date=datetime.date(2025, 3, 5), agency_fee=300, total_fee=300,
+        )
+        self.april = Expense.objects.create(
+            company_name='乙', company_location='杭州', charge_date=datetime.date(2025, 4, 9), agency_fee=500, total_fee=500,
+        )
+
+    def assert_no_drift(self):
+        self.assertEqual(rebuild_summary(dry_run=True), [])
+
+    def row(self, month, status=0):
+        return ExpenseRevenueSummary.objects.filter(
+            month=datetime.date(2025, month, 1), company_location='杭州', status=status,
+        ).values('count', 'total_fee').first()
+
+    def test_create(self):
+        self.assertEqual(self.row(3), {'count': 1, 'total_fee': 300})
+        self.assert_no_drift()
+
+    def test_update_moves_contribution(self):
+        self.march.charge_date = datetime.date(2025, 4, 20)
+        self.march.total_fee = 350
+        self.march.save()
+        self.assertIsNone(self.row(3))
+        self.assertEqual(self.row(4), {'count': 2, 'total_fee': 850})
+        self.assert_no_drift()
+
+    def test_delete(self):
+        self.april.delete()
+        self.assertIsNone(self.row(4))
+        self.assert_no_drift()
+
+    def test_audit_and_cancel(self):
+        response = self.client.post('/expense/audit/', {'id': self.march.id, 'status': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.row(3, status=1), {'count': 1, 'total_fee': 300})
+        self.assertIsNone(self.row(3))
+        self.assert_no_drift()
+
+        self.client.post('/expense/audit/batch/', {'ids': [self.april.id], 'status': 2}, format='json')
+        self.assertEqual(self.row(4, status=2), {'count': 1, 'total_fee': 500})
+        self.assert_no_drift()
+
+        self.client.post('/expense/cancel-audit/', {'id': self.march.id}, format='json')
+        self.client.post('/expense/cancel-audit/batch/', {'ids': [self.april.id]}, format='json')
+        self.assertEqual((self.row(3), self.row(4)), ({'count': 1, 'total_fee': 300}, {'count': 1, 'total_fee': 500}))
+        self.assert_no_drift()
+
+    def test_rebuild_repairs_drift(self):
+        # queryset.update() 不触发信号，汇总表与费用表出现偏差
+        Expense.objects.filter(id=self.march.id).update(total_fee=900)
+        stdout = StringIO()
+        call_command('rebuild_expense_summary', '--dry-run', stdout=stdout)
+        self.assertIn('1 summary rows drifted', stdout.getvalue())
+        self.assertEqual(self.row(3)['total_fee'], 300)
+
+        call_command('rebuild_expense_summary', stdout=StringIO())
+        self.assertEqual(self.row(3)['total_fee'], 900)
+        self.assert_no_drift()
+
+
+class ExpenseBatchAuditTests(TestCase):
+    """批量审核 / 取消审核：逐条返回处理结果，不符合条件的记录跳过，其余一次更新"""
+
+    def setUp(self):
+        role = Role.objects.create(name='own_auditor', code='own_auditor')
+        Permission.objects.filter(role=role, permission_name='expense_data_view_own').update(permission_value=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='auditor', roles=['own_auditor']))
+        self.pending = Expense.objects.create(company_name='甲', submitter='auditor', total_fee=100)
+        self.audited = Expense.objects.create(company_name='乙', submitter='auditor', status=1, auditor='other')
+        self.hidden = Expense.objects.create(company_name='丙', submitter='someone')
+        self.claimed = Expense.objects.create(company_name='丁', submitter='auditor')
+        claim_audit_queue('other', Expense.objects.filter(id=self.claimed.id), 1)
+
+    def post(self, url, **body):
+        response = self.client.post(url, body, format='json')
+        return response.status_code, response.json()
+
+    def results(self, data):
+        return {item['id']: item['result'] for item in data['data']['results']}
+
+    def test_batch_audit_partial(self):
+        missing_id = self.claimed.id + 100
+        ids = [self.pending.id, self.audited.id, self.hidden.id, self.claimed.id, missing_id, self.pending.id]
+        code, data = self.post('/expense/audit/batch/', ids=ids, status=1)
+        self.assertEqual(code, 200)
+        self.assertEqual(data['data']['updated'], 1)
+        self.assertEqual(self.results(data), {
+            self.pending.id: RESULT_UPDATED,
+            self.audited.id: RESULT_ALREADY_AUDITED,
+            self.hidden.id: RESULT_NO_PERMISSION,
+            self.claimed.id: RESULT_CLAIMED,
+            missing_id: RESULT_NOT_FOUND,
+        })
+
+        self.pending.refresh_from_db()
+        self.assertEqual((self.pending.status, self.pending.auditor), (1, 'auditor'))
+        self.assertEqual(Expense.objects.get(id=self.claimed.id).status, 0)
+        self.assertEqual(dict(AutocompleteValue.objects.filter(source='expense', field='auditor').values_list('value', 'count')), {'auditor': 1, 'other': 1})
+
+    def test_batch_reject_records_reason(self):
+        self.post('/expense/audit/batch/', ids=[self.pending.id], status=2, reject_reason='金额有误')
+        self.pending.refresh_from_db()
+        self.assertEqual((self.pending.status, self.pending.reject_reason), (2, '金额有误'))
+
+    def test_batch_cancel_partial(self):
+        missing_id = self.claimed.id + 100
+        code, data = self.post('/expense/cancel-audit/batch/', ids=[self.audited.id, self.pending.id, missing_id])
+        self.assertEqual(code, 200)
+        self.assertEqual(self.results(data), {
+            self.audited.id: RESULT_UPDATED,
+            self.pending.id: RESULT_NOT_AUDITED,
+            missing_id: RESULT_NOT_FOUND,
+        })
+        self.audited.refresh_from_db()
+        self.assertEqual((self.audited.status, self.audited.auditor, self.audited.audit_date), (0, None, None))
+
+    def test_invalid_input(self):
+        for body in ({'ids': [], 'status': 1}, {'ids': ['x'], 'status': 1}, {'ids': [self.pending.id], 'status': 5}):
+            with self.subTest(body=body):
+                code, _ = self.post('/expense/audit/batch/', **body)
+                self.assertEqual(code, 400)
+        code, _ = self.post('/expense/cancel-audit/batch/', ids=list(range(1, BATCH_AUDIT_MAX_IDS + 2)))
+        self.assertEqual(code, 400)
+        self.assertEqual(Expense.objects.get(id=self.pending.id).status, 0)
+
+
+def legacy_csv_row(expense):
+    """原导出视图逐个实例写出的一行，用于比对新导出的格式"""
+    create_time = expense.create_time.strftime('%Y-%m-%d %H:%M:%S') if expense.create_time else ''
+    values = [getattr(expense, field) for field in EXPORT_FIELDS]
+    values[EXPORT_FIELDS.index('create_time')] = create_time
+    values[EXPORT_FIELDS.index('status')] = expense.get_status_display()
+    buffer = StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+class ExpenseExportTests(TestCase):
+    """费用 CSV 导出：按 id 分批读取，格式与原导出一致，支持列表的搜索条件"""
+
+    def setUp(self):
+        role = Role.objects.create(name='viewer', code='viewer')
+        Permission.objects.filter(role=role, permission_name='expense_data_view_all').update(permission_value=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='viewer', roles=['viewer']))
+        self.expenses = [
+            Expense.objects.create(company_name='甲公司', status=0, total_fee=100, remarks='含,逗号'),
+            Expense.objects.create(company_name='乙公司', status=1, auditor='auditor', audit_date=datetime.date(2025, 3, 2), charge_date=datetime.date(2025, 3, 1)),
+            Expense.objects.create(company_name='丙公司', status=2, reject_reason='缺少发票'),
+        ]
+
+    def export(self, **params):
+        response = self.client.get('/expense/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_matches_legacy_format(self):
+        with mock.patch('apps.expense.exports.EXPORT_CHUNK_SIZE', 2):
+            content = self.export()
+        self.assertTrue(content.startswith('\ufeff'))
+        header, *lines = content[1:].splitlines(keepends=True)
+        self.assertEqual(next(csv.reader([header])), EXPORT_HEADERS)
+        self.assertEqual(lines, [legacy_csv_row(expense) for expense in self.expenses])
+        self.assertIn('已审核', lines[1])
+
+    def test_search_params_narrow_export(self):
+        content = self.export(companyName='乙')
+        self.assertEqual(content[1:].splitlines(keepends=True)[1:], [legacy_csv_row(self.expenses[1])])
+        self.assertEqual(len(self.export(status='0')[1:].splitlines()), 2)
+
+    def test_reads_in_keyset_batches(self):
+        with mock.patch('apps.expense.exports.EXPORT_CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            chunks = list(iter_expense_csv(Expense.objects.all()))
+        # 表头一块，每批一块
+        self.assertEqual(len(chunks), 3)
+        batches = [query['sql'] for query in queries if 'LIMIT 2' in query['sql']]
+        self.assertEqual(len(batches), 2)
+        self.assertIn('"zy_expense"."id" >', batches[1])
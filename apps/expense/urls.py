@@ -8,6 +8,10 @@ urlpatterns = [
     path('delete/', views.delete_expense, name='delete_expense'),
     path('audit/', views.audit_expense, name='audit_expense'),
     path('cancel-audit/', views.cancel_audit_expense, name='cancel_audit_expense'),
+    path('audit/batch/', views.batch_audit_expense, name='batch_audit_expense'),
+    path('cancel-audit/batch/', views.batch_cancel_audit_expense, name='batch_cancel_audit_expense'),
+    path('audit-queue/claim/', views.claim_audit_queue_expenses, name='claim_audit_queue_expenses'),
+    path('audit-queue/release/', views.release_audit_queue_expenses, name='release_audit_queue_expenses'),
     path('export/', views.export_expenses, name='export_expenses'),
     path('autocomplete/', views.get_autocomplete_options, name='expense-autocomplete'),
 ]
@@ -5,9 +5,16 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.paginator import Paginator
-from .models import Expense
+from .models import Expense, ExpenseAuditClaim
 from .serializers import ExpenseSerializer
 from apps.users.views import get_user_permissions_helper
+from apps.core.permissions.scopes import ScopeSpec, apply_scope
+from apps.core.utils.pagination import CURSOR_PARAM, InvalidCursor, get_cursor_page, parse_page_size
+from apps.core.utils.counting import get_count_mode, paginate_with_count_mode
+from apps.core.autocomplete.services import get_autocomplete_fields, get_autocomplete_values
+from .exports import iter_expense_csv
+from .audit import RESULT_UPDATED, InvalidBatch, parse_batch_ids, batch_audit_expenses, batch_cancel_audit_expenses
+from .audit import get_active_claims, claim_audit_queue, release_audit_claims
 import json
 from datetime import datetime, date
 from calendar import monthrange
@@ -18,10 +25,9 @@ from django.core.files.storage import default_storage
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.viewsets import ModelViewSet
 from django.contrib.auth.models import Group
-from apps.users.models import User
 from django.db.models import Q
-import csv
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.db.models import Func, F
 from django.db.models.functions import Lower
@@ -46,27 +52,16 @@ class ExpenseViewSet(ModelViewSet):
 
         return Response(serializer.data)
 
+# 费用数据权限范围：按地区查看时匹配企业归属地等于用户所在部门名称的费用
+EXPENSE_SCOPE = ScopeSpec(location_field='company_location')
+
 def apply_permission_filters(queryset, request):
-    user = request.user
+    return apply_user_permission_filters(queryset, request.user)
+
+def apply_user_permission_filters(queryset, user):
     user_permissions = get_user_permissions_helper(user)
-    
     expense_permissions = user_permissions['permissions']['expense']
-    
-    if not expense_permissions['data']['view_all']:
-        filters = Q()
-        
-        if expense_permissions['data']['view_own']:
-            filters |= Q(submitter=user.username)
-        
-        if expense_permissions['data']['view_by_location']:
-            filters |= Q(company_location=user.dept.name)
-        
-        if expense_permissions['data']['view_department_submissions']:
-            department_users = User.objects.filter(dept_id=user.dept_id).values_list('username', flat=True)
-            filters |= Q(submitter__in=department_users)
-        
-        queryset = queryset.filter(filters)
-    
+    queryset = apply_scope(queryset, expense_permissions['data'], user, EXPENSE_SCOPE)
     return queryset, expense_permissions
 
 @api_view(['GET'])
@@ -82,21 +77,41 @@ def get_expense_list(request):
     # 应用查询条件
     queryset = queryset.filter(query)
 
-    # 排序
-    queryset = queryset.order_by('-id')
+    # 游标分页：按 id 索引定位下一页，不统计总数
+    if CURSOR_PARAM in request.query_params:
+        try:
+            page_size = parse_page_size(request.query_params.get('page_size', 10))
+            expenses, next_cursor = get_cursor_page(queryset, request.query_params.get(CURSOR_PARAM), page_size)
+        except InvalidCursor as e:
+            return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ExpenseSerializer(expenses, many=True, context={'request': request})
+        return Response({
+            'success': True,
+            'data': {
+                'list': serializer.data,
+                'next': next_cursor,
+                'pageSize': page_size,
+                'permissions': user_permissions
+            }
+        })
 
-    # 分页
     page = int(request.query_params.get('page', 1))
     page_size = int(request.query_params.get('page_size', 10))
-    paginator = Paginator(queryset, page_size)
-    expenses = paginator.get_page(page)
+
+    # 排序
+    queryset = queryset.order_by('-id')
+
+    # 分页，总数统计方式由 count_mode 参数选择
+    expenses, page_info = paginate_with_count_mode(queryset, page, page_size, get_count_mode(request.query_params))
 
     serializer = ExpenseSerializer(expenses, many=True, context={'request': request})
     return Response({
         'success': True,
         'data': {
             'list': serializer.data,
-            'total': paginator.count,
+            'total': page_info['total'],
+            'hasMore': page_info['hasMore'],
+            'countMode': page_info['countMode'],
             'currentPage': page,
             'pageSize': page_size,
             'permissions': user_permissions
@@ -159,7 +174,9 @@ def create_expense(request):
 
     serializer = ExpenseSerializer(data=data)
     if serializer.is_valid():
-        serializer.save()
+        # 收入汇总表与费用记录在同一事务中更新
+        with transaction.atomic():
+            serializer.save()
         return Response({'success': True, 'data': serializer.data}, status=status.HTTP_201_CREATED)
     return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -276,7 +293,8 @@ def update_expense(request):
 
         serializer = ExpenseSerializer(expense, data=converted_data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response({'success': True, 'data': serializer.data}, status=status.HTTP_200_OK)
         return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
     except Expense.DoesNotExist:
@@ -288,7 +306,8 @@ def delete_expense(request):
     expense_id = request.data.get('id')
     try:
         expense = Expense.objects.get(id=expense_id)
-        expense.delete()
+        with transaction.atomic():
+            expense.delete()
         return Response({'success': True, 'message': 'Expense deleted successfully'}, status=status.HTTP_200_OK)
     except Expense.DoesNotExist:
         return Response({'success': False, 'message': 'Expense not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -303,6 +322,8 @@ def audit_expense(request):
 
     try:
         expense = Expense.objects.get(id=expense_id)
+        if get_active_claims([expense.id], exclude_auditor=request.user.username):
+            return Response({'success': False, 'message': '该记录已被其他审核员领取'}, status=status.HTTP_409_CONFLICT)
         expense.status = audit_status
         expense.auditor = request.user.username
         expense.audit_date = date.today()
@@ -310,7 +331,9 @@ def audit_expense(request):
         if audit_status == 2:  # 审核拒绝
             expense.reject_reason = reject_reason
 
-        expense.save()
+        with transaction.atomic():
+            expense.save()
+            ExpenseAuditClaim.objects.filter(expense_id=expense.id).delete()
         return Response({'success': True, 'message': '审核成功'}, status=status.HTTP_200_OK)
     except Expense.DoesNotExist:
         return Response({'success': False, 'message': '费用记录不存在'}, status=status.HTTP_404_NOT_FOUND)
@@ -328,55 +351,102 @@ def cancel_audit_expense(request):
         expense.auditor = None
         expense.audit_date = None
         expense.reject_reason = None
-        expense.save()
+        with transaction.atomic():
+            expense.save()
         return Response({'success': True, 'message': '取消审核成功'}, status=status.HTTP_200_OK)
     except Expense.DoesNotExist:
         return Response({'success': False, 'message': '费用记录不存在'}, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_audit_expense(request):
+    """批量审核，已审核或不在数据权限范围内的记录跳过，按 id 返回处理结果"""
+    try:
+        ids = parse_batch_ids(request.data.get('ids'))
+        audit_status = int(request.data.get('status'))
+    except InvalidBatch as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except (TypeError, ValueError):
+        audit_status = None
+    if audit_status not in (1, 2):
+        return Response({'success': False, 'message': '无效的审核状态'}, status=status.HTTP_400_BAD_REQUEST)
+
+    queryset, _ = apply_permission_filters(Expense.objects.all(), request)
+    results = batch_audit_expenses(ids, queryset, request.user.username, audit_status, request.data.get('reject_reason'))
+    return Response({'success': True, 'data': format_batch_results(results)}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_cancel_audit_expense(request):
+    """批量取消审核，未审核或不在数据权限范围内的记录跳过，按 id 返回处理结果"""
+    try:
+        ids = parse_batch_ids(request.data.get('ids'))
+    except InvalidBatch as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    queryset, _ = apply_permission_filters(Expense.objects.all(), request)
+    results = batch_cancel_audit_expenses(ids, queryset)
+    return Response({'success': True, 'data': format_batch_results(results)}, status=status.HTTP_200_OK)
+
+def format_batch_results(results):
+    return {
+        'updated': sum(1 for result in results.values() if result == RESULT_UPDATED),
+        'results': [{'id': expense_id, 'result': result} for expense_id, result in results.items()],
+    }
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def claim_audit_queue_expenses(request):
+    """审核队列：为当前审核员领取接下来的 N 条未审核记录，租约到期前其他审核员不会领到这些记录"""
+    if not request.user.is_expense_auditor:
+        return Response({'success': False, 'message': '仅费用审核员可使用审核队列'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        count = int(request.data.get('count', 10))
+    except (TypeError, ValueError):
+        return Response({'success': False, 'message': '无效的领取数量'}, status=status.HTTP_400_BAD_REQUEST)
+    count = max(1, min(count, settings.EXPENSE_AUDIT_CLAIM_MAX))
+
+    queryset, _ = apply_permission_filters(Expense.objects.all(), request)
+    ids, lease_until = claim_audit_queue(request.user.username, queryset, count)
+    expenses = Expense.objects.filter(id__in=ids).order_by('id')
+    return Response({
+        'success': True,
+        'data': {
+            'lease_until': timezone.localtime(lease_until).strftime('%Y-%m-%d %H:%M:%S'),
+            'items': ExpenseSerializer(expenses, many=True).data,
+        }
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def release_audit_queue_expenses(request):
+    """归还领取的记录，未提供 ids 时归还当前审核员的全部领取"""
+    ids = request.data.get('ids')
+    if ids is not None:
+        try:
+            ids = parse_batch_ids(ids)
+        except InvalidBatch as e:
+            return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    released = release_audit_claims(request.user.username, ids)
+    return Response({'success': True, 'data': {'released': released}}, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def export_expenses(request):
-    user = request.user
-    current_role = request.query_params.get('current_role', 'default')
-    
     queryset = Expense.objects.all()
     queryset, user_permissions = apply_permission_filters(queryset, request)
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="expenses.csv"'
-    
-    response.write(u'\ufeff'.encode('utf-8'))
-
-    writer = csv.writer(response)
-    writer.writerow(['企业名称', '企业类型', '企业归属地', '办照类型', '办照费用', '一次性地址费', '牌子费', '刻章费',
-                     '代理类型', '代理费', '记账软件费', '地址费', '代理开始日期', '代理结束日期', '业务类型', '合同类型',
-                     '开票软件服务商', '开票软件费', '开票软件开始日期', '开票软件结束日期', '参保险种', '参保人数',
-                     '社保代理费', '社保开始日期', '社保结束日期', '统计局报表费', '统计开始日期', '统计结束日期',
-                     '变更业务', '变更收费', '行政许可', '行政许可收费', '其他业务', '其他业务收费', '总费用',
-                     '提交人', '创建日期', '收费日期', '收费方式', '审核员', '审核日期', '状态', '备注'])
-
-    for expense in queryset:
-        # 格式化创建日期到秒级别
-        create_time = expense.create_time.strftime('%Y-%m-%d %H:%M:%S') if expense.create_time else ''
-        
-        writer.writerow([
-            expense.company_name, expense.company_type, expense.company_location, expense.license_type,
-            expense.license_fee, expense.one_time_address_fee, expense.brand_fee, expense.seal_fee,
-            expense.agency_type, expense.agency_fee, expense.accounting_software_fee, expense.address_fee,
-            expense.agency_start_date, expense.agency_end_date, expense.business_type, expense.contract_type,
-            expense.invoice_software_provider, expense.invoice_software_fee, expense.invoice_software_start_date,
-            expense.invoice_software_end_date, expense.insurance_types, expense.insured_count,
-            expense.social_insurance_agency_fee, expense.social_insurance_start_date, expense.social_insurance_end_date,
-            expense.statistical_report_fee, expense.statistical_start_date, expense.statistical_end_date,
-            expense.change_business, expense.change_fee, expense.administrative_license, expense.administrative_license_fee,
-            expense.other_business, expense.other_business_fee, expense.total_fee, expense.submitter,
-            create_time, expense.charge_date, expense.charge_method, expense.auditor,
-            expense.audit_date, expense.get_status_display(), expense.remarks
-        ])
+    # 导出与列表使用相同的搜索条件
+    queryset = queryset.filter(build_search_query(request))
 
+    # 按 id 分批读取并逐批输出，不缓存整个结果集
+    response = StreamingHttpResponse(iter_expense_csv(queryset), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="expenses.csv"'
     return response
 
 def build_search_query(request):
+    return build_search_query_from_params(request.query_params)
+
+def build_search_query_from_params(params):
     query = Q()
 
     # 所有搜索字段
@@ -424,7 +494,7 @@ def build_search_query(request):
     }
 
     for param, config in search_fields.items():
-        value = request.query_params.get(param)
+        value = params.get(param)
 
         if value:
             field = config.get('field', param)
@@ -432,8 +502,8 @@ def build_search_query(request):
             query &= Q(**{f"{field}__{lookup}": value})
 
     # 处理日期范围
-    charge_date_start = request.query_params.get('chargeDateStart')
-    charge_date_end = request.query_params.get('chargeDateEnd')
+    charge_date_start = params.get('chargeDateStart')
+    charge_date_end = params.get('chargeDateEnd')
     if charge_date_start and charge_date_end:
         query &= Q(charge_date__range=[charge_date_start, charge_date_end])
     return query
@@ -451,7 +521,18 @@ def get_autocomplete_options(request):
         return Response({'success': False, 'error': 'Invalid field'}, status=status.HTTP_400_BAD_REQUEST)
     
     # 应用权限过滤
-    queryset, _ = apply_permission_filters(Expense.objects.all(), request)
+    queryset, expense_permissions = apply_permission_filters(Expense.objects.all(), request)
+
+    # 已维护补全字典的字段直接从内存索引查询
+    if field in get_autocomplete_fields('expense'):
+        values = get_autocomplete_values(
+            'expense', field, query, queryset, unrestricted=expense_permissions['data']['view_all']
+        )
+        if values is not None:
+            return Response({
+                'success': True,
+                'data': values
+            })
     
     # 获取唯一值，忽略大小写并按字段值排序
     values = queryset.annotate(
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.fileupload.services import claim_next_export_job, recover_stale_export_jobs, run_export_job
+
+class Command(BaseCommand):
+    help = 'Process queued export jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            requeued, failed = recover_stale_export_jobs()
+            if requeued or failed:
+                self.stdout.write(self.style.WARNING(f'Recovered stale export jobs: {requeued} requeued, {failed} failed'))
+
+            job = claim_next_export_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            self.stdout.write(f'Running export job {job.id} ({job.kind})')
+            if run_export_job(job):
+                self.stdout.write(self.style.SUCCESS(f'Export job {job.id} finished'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Export job {job.id} failed'))
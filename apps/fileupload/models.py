@@ -1,3 +1,47 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class ExportJob(models.Model):
+    """后台导出任务，同时作为数据库队列使用"""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '等待中'),
+        (STATUS_RUNNING, '导出中'),
+        (STATUS_SUCCESS, '已完成'),
+        (STATUS_FAILED, '失败'),
+    )
+
+    KIND_CHOICES = (
+        ('customer', '客户'),
+        ('expense', '费用'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='导出类型')
+    params = models.JSONField(default=dict, blank=True, verbose_name='导出参数')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs', verbose_name='提交人')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='状态')
+    progress = models.IntegerField(default=0, verbose_name='已导出行数')
+    total = models.IntegerField(null=True, blank=True, verbose_name='总行数')
+    file_path = models.CharField(max_length=500, blank=True, default='', verbose_name='文件路径')
+    error = models.TextField(blank=True, default='', verbose_name='错误信息')
+    create_time = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    start_time = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finish_time = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
+    heartbeat_time = models.DateTimeField(null=True, blank=True, verbose_name='心跳时间')
+    attempts = models.IntegerField(default=0, verbose_name='执行次数')
+
+    class Meta:
+        db_table = 'zy_export_job'
+        verbose_name = '导出任务'
+        verbose_name_plural = '导出任务'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='export_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.id}'
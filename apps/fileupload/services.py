@@ -1,7 +1,16 @@
 import boto3
+import logging
+import tempfile
+import uuid
+from datetime import timedelta
 from botocore.config import Config
 from botocore.exceptions import ClientError
 from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
 def generate_presigned_url(object_key, content_type=None, expiration=3600):
     """
@@ -38,4 +47,112 @@ def generate_presigned_url(object_key, content_type=None, expiration=3600):
         }
         
     except ClientError as e:
-        raise Exception(f"生成预签名URL失败: {str(e)}")
\ No newline at end of file
+        raise Exception(f"生成预签名URL失败: {str(e)}")
+
+
+logger = logging.getLogger(__name__)
+
+# 导出类型 -> 导出函数，函数签名为 (user, params, output, progress)，返回文件名
+EXPORT_HANDLERS = {
+    'customer': 'apps.customer.exports.run_export',
+    'expense': 'apps.expense.exports.run_export',
+}
+
+# 导出文件使用的存储（私有 ACL），未配置时直接报错，不回退到公开读的默认存储
+EXPORT_STORAGE_ALIAS = 'exports'
+
+
+def get_export_storage():
+    return storages[EXPORT_STORAGE_ALIAS]
+
+
+def submit_export_job(user_id, kind, params):
+    from .models import ExportJob
+
+    return ExportJob.objects.create(user_id=user_id, kind=kind, params=params)
+
+
+def claim_next_export_job():
+    """
+    取出最早的等待中任务，通过带状态条件的 UPDATE 抢占，
+    多个 worker 同时运行时同一任务只会被一个 worker 领取
+    """
+    from .models import ExportJob
+
+    while True:
+        job_id = ExportJob.objects.filter(status=ExportJob.STATUS_PENDING).order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(id=job_id, status=ExportJob.STATUS_PENDING).update(
+            status=ExportJob.STATUS_RUNNING, start_time=now, heartbeat_time=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return ExportJob.objects.select_related('user').get(id=job_id)
+
+
+def recover_stale_export_jobs():
+    """
+    worker 崩溃后遗留在导出中的任务：心跳超时后重新排队，已达最大执行次数的标记为失败
+    返回 (重新排队数, 失败数)
+    """
+    from .models import ExportJob
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS)
+    stale = ExportJob.objects.filter(status=ExportJob.STATUS_RUNNING).filter(
+        Q(heartbeat_time__lt=cutoff) | Q(heartbeat_time__isnull=True)
+    )
+    failed = stale.filter(attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+        status=ExportJob.STATUS_FAILED, error='导出进程中断', finish_time=now
+    )
+    requeued = stale.filter(attempts__lt=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+        status=ExportJob.STATUS_PENDING, progress=0, total=None
+    )
+    return requeued, failed
+
+
+def run_export_job(job):
+    """生成导出文件并写入导出存储，过程中记录进度和心跳"""
+    from .models import ExportJob
+
+    def heartbeat(**fields):
+        ExportJob.objects.filter(id=job.id).update(heartbeat_time=timezone.now(), **fields)
+
+    def progress(count, total):
+        heartbeat(progress=count, total=total)
+
+    try:
+        handler = import_string(EXPORT_HANDLERS[job.kind])
+        with tempfile.TemporaryFile() as output:
+            filename = handler(job.user, job.params, output, progress)
+            output.seek(0)
+            heartbeat()
+            # 随机目录名，文件地址不可由任务 id 推测；按块写入存储（S3/MinIO 为分片上传），不整体读入内存
+            file_path = get_export_storage().save(f'exports/{uuid.uuid4().hex}/{filename}', File(output, name=filename))
+    except Exception as e:
+        logger.exception('导出任务 %s 失败', job.id)
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.STATUS_FAILED, error=str(e), finish_time=timezone.now()
+        )
+        return False
+
+    ExportJob.objects.filter(id=job.id).update(
+        status=ExportJob.STATUS_SUCCESS, file_path=file_path, finish_time=timezone.now()
+    )
+    return True
+
+
+def serialize_export_job(job):
+    """仅用于返回给任务提交人：下载地址为导出存储生成的短时效签名 URL"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'error': job.error or None,
+        'downloadUrl': get_export_storage().url(job.file_path) if job.file_path else None,
+        'createTime': job.create_time.strftime('%Y-%m-%d %H:%M:%S') if job.create_time else None,
+        'finishTime': job.finish_time.strftime('%Y-%m-%d %H:%M:%S') if job.finish_time else None,
+    }
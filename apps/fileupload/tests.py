@@ -1,3 +1,96 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.expense.models import Expense
+from apps.users.models import Permission, Role, User
+
+from .models import ExportJob
+from .services import claim_next_export_job, get_export_storage, recover_stale_export_jobs, run_export_job
+
+MEDIA_ROOT = tempfile.mkdtemp()
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': MEDIA_ROOT}},
+    'exports': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': MEDIA_ROOT}},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=TEST_STORAGES, EXPORT_JOB_STALE_SECONDS=900, EXPORT_JOB_MAX_ATTEMPTS=3)
+class ExportJobTests(TestCase):
+    """后台导出任务的提交、领取、执行、查询及中断恢复"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        role = Role.objects.create(name='exporter', code='exporter')
+        Permission.objects.filter(role=role, permission_name='expense_data_view_all').update(permission_value=True)
+        self.user = User.objects.create(username='exporter', roles=['exporter'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Expense.objects.create(company_name='甲公司', total_fee=100)
+        Expense.objects.create(company_name='乙公司', total_fee=200)
+
+    def submit(self):
+        response = self.client.post('/fileupload/export-jobs/', {'kind': 'expense'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return ExportJob.objects.get(id=response.json()['data']['id'])
+
+    def test_lifecycle(self):
+        job = self.submit()
+        self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+
+        claimed = claim_next_export_job()
+        self.assertEqual(claimed.id, job.id)
+        self.assertIsNone(claim_next_export_job())
+        self.assertTrue(run_export_job(claimed))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_SUCCESS)
+        self.assertEqual((job.progress, job.total, job.attempts), (2, 2, 1))
+        # 文件路径为随机目录，不包含任务 id
+        self.assertRegex(job.file_path, r'^exports/[0-9a-f]{32}/expenses\.csv$')
+        with get_export_storage().open(job.file_path) as f:
+            self.assertIn('甲公司', f.read().decode('utf-8'))
+
+        data = self.client.get(f'/fileupload/export-jobs/{job.id}/').json()['data']
+        self.assertEqual(data['status'], ExportJob.STATUS_SUCCESS)
+        self.assertTrue(data['downloadUrl'])
+
+    def test_other_user_cannot_see_job(self):
+        job = self.submit()
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='other'))
+        self.assertEqual(other.get(f'/fileupload/export-jobs/{job.id}/').status_code, 404)
+
+    def test_failed_job(self):
+        job = self.submit()
+        ExportJob.objects.filter(id=job.id).update(kind='unknown')
+        with self.assertLogs('apps.fileupload.services', 'ERROR'):
+            self.assertFalse(run_export_job(claim_next_export_job()))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+    def test_recover_stale_jobs(self):
+        stale = timezone.now() - timedelta(seconds=901)
+        requeue = ExportJob.objects.create(user=self.user, kind='expense', status=ExportJob.STATUS_RUNNING, heartbeat_time=stale, attempts=1, progress=10)
+        exhausted = ExportJob.objects.create(user=self.user, kind='expense', status=ExportJob.STATUS_RUNNING, heartbeat_time=stale, attempts=3)
+        alive = ExportJob.objects.create(user=self.user, kind='expense', status=ExportJob.STATUS_RUNNING, heartbeat_time=timezone.now(), attempts=1)
+
+        self.assertEqual(recover_stale_export_jobs(), (1, 1))
+        statuses = dict(ExportJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[requeue.id], ExportJob.STATUS_PENDING)
+        self.assertEqual(statuses[exhausted.id], ExportJob.STATUS_FAILED)
+        self.assertEqual(statuses[alive.id], ExportJob.STATUS_RUNNING)
+
+        # 重新排队的任务再次被领取时执行次数累加
+        job = claim_next_export_job()
+        self.assertEqual((job.id, job.attempts, job.progress), (requeue.id, 2, 0))
@@ -3,4 +3,6 @@ from . import views
 
 urlpatterns = [
     path('upload/', views.get_presigned_url, name='get-presigned-url'),
+    path('export-jobs/', views.create_export_job, name='create-export-job'),
+    path('export-jobs/<int:job_id>/', views.get_export_job, name='get-export-job'),
 ]
\ No newline at end of file
@@ -2,7 +2,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from .services import generate_presigned_url
+from .models import ExportJob
+from .services import generate_presigned_url, submit_export_job, serialize_export_job, EXPORT_HANDLERS
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -45,4 +46,54 @@ def get_presigned_url(request):
         return Response({
             'success': False,
             'message': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_export_job(request):
+    """
+    提交后台导出任务，立即返回任务 id，由 run_export_worker 命令生成文件
+
+    请求参数:
+    {
+        "kind": "customer",  // 导出类型: customer / expense
+        "params": {}  // 可选，与同步导出接口相同的过滤参数
+    }
+    """
+    kind = request.data.get('kind')
+    params = request.data.get('params') or {}
+
+    if kind not in EXPORT_HANDLERS:
+        return Response({
+            'success': False,
+            'message': '不支持的导出类型'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(params, dict):
+        return Response({
+            'success': False,
+            'message': '导出参数格式错误'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    job = submit_export_job(request.user.id, kind, params)
+    return Response({
+        'success': True,
+        'data': serialize_export_job(job)
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_export_job(request, job_id):
+    """查询导出任务的状态、进度，完成后返回下载地址"""
+    try:
+        job = ExportJob.objects.get(id=job_id, user_id=request.user.id)
+    except ExportJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': '导出任务不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'data': serialize_export_job(job)
+    })
@@ -0,0 +1,148 @@
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from PIL import Image, ImageOps
+
+# 头像缩略图尺寸（像素，正方形）
+AVATAR_SIZES = (64, 128, 256)
+
+# 文件头魔数 -> 图片类型
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+# 按内容摘要生成的头像路径：avatars/<用户id>/<摘要>.<扩展名>
+AVATAR_PATH_PATTERN = re.compile(r'^avatars/\d+/[0-9a-f]{16}\.\w+$')
+
+# 缩放线程池，限制同时处理的图片数量
+_resize_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'AVATAR_RESIZE_WORKERS', 2),
+    thread_name_prefix='avatar-resize',
+)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def detect_image_type(header):
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    return None
+
+
+class AvatarUploadHandler(FileUploadHandler):
+    """
+    收到第一个数据块时即校验图片文件头，并在接收过程中限制文件大小，
+    不合法时中止解析，不再读取剩余的请求体
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.error = None
+        self.received = 0
+        self.checked = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.checked:
+            self.checked = True
+            if detect_image_type(raw_data[:16]) is None:
+                self.error = '不支持的图片格式'
+                raise StopUpload(connection_reset=True)
+
+        self.received += len(raw_data)
+        if self.received > getattr(settings, 'AVATAR_MAX_UPLOAD_SIZE', 5 * 1024 * 1024):
+            self.error = '图片大小超过限制'
+            raise StopUpload(connection_reset=True)
+        # 交给后续的内存/临时文件处理器保存
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def avatar_variant_path(avatar_path, size):
+    """由原图路径推导指定尺寸缩略图的路径，旧格式的头像没有缩略图，返回原路径"""
+    if not avatar_path or not AVATAR_PATH_PATTERN.match(avatar_path):
+        return avatar_path
+    base, _ = avatar_path.rsplit('.', 1)
+    ext = 'jpg' if avatar_path.endswith('.jpg') else 'png'
+    return f'{base}_{size}.{ext}'
+
+
+def _save_if_missing(path, file_obj):
+    # 路径由内容摘要决定，已存在即为同一张图片，无需重复上传
+    if not default_storage.exists(path):
+        default_storage.save(path, file_obj)
+    return path
+
+
+def _render_variant(image, size, image_format, path):
+    variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        variant.save(buffer, format='JPEG', quality=85, optimize=True)
+    else:
+        variant.save(buffer, format='PNG', optimize=True)
+    return _save_if_missing(path, ContentFile(buffer.getvalue()))
+
+
+def store_avatar(user_id, uploaded_file):
+    """
+    保存头像原图并在线程池中生成各尺寸缩略图
+    返回 (原图路径, {尺寸: 缩略图路径})，图片无法解析时抛出 PIL 的异常，像素数超过上限时抛出 ImageTooLarge
+    """
+    digest = hashlib.sha1()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()[:16]
+
+    uploaded_file.seek(0)
+    header = uploaded_file.read(16)
+    image_type = detect_image_type(header)
+    if image_type is None:
+        raise ValueError('不支持的图片格式')
+
+    uploaded_file.seek(0)
+    image = Image.open(uploaded_file)
+    # Image.open 只解析文件头，在解码像素之前按宽高检查，避免小文件解压出超大图片
+    width, height = image.size
+    if width * height > getattr(settings, 'AVATAR_MAX_PIXELS', 16 * 1024 * 1024):
+        raise ImageTooLarge('图片尺寸超过限制')
+    image.load()
+    image = ImageOps.exif_transpose(image)
+
+    # JPEG 缩略图保持 JPEG，PNG/GIF 统一输出 PNG（GIF 取第一帧）
+    if image_type == 'jpeg':
+        image_format, ext = 'JPEG', 'jpg'
+        image = image.convert('RGB')
+    else:
+        image_format, ext = 'PNG', 'png'
+        image = image.convert('RGBA')
+
+    base = f'avatars/{user_id}/{digest}'
+    original_ext = 'jpg' if image_type == 'jpeg' else image_type
+    uploaded_file.seek(0)
+    original_path = _save_if_missing(f'{base}.{original_ext}', uploaded_file)
+
+    futures = {
+        size: _resize_executor.submit(_render_variant, image.copy(), size, image_format, f'{base}_{size}.{ext}')
+        for size in AVATAR_SIZES
+    }
+    variants = {size: future.result() for size, future in futures.items()}
+    return original_path, variants
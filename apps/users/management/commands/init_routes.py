@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from users.models import AsyncRoute
+from apps.users.models import AsyncRoute
+from apps.users.services import invalidate_route_tree
 
 class Command(BaseCommand):
     help = 'Initialize async routes in the database'
@@ -63,4 +64,7 @@ class Command(BaseCommand):
             }
         )
 
+        # 清除路由树缓存，前端下次请求将获取新的 ETag
+        invalidate_route_tree()
+
         self.stdout.write(self.style.SUCCESS('Successfully initialized async routes'))
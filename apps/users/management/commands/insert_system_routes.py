@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from users.models import AsyncRoute
+from apps.users.models import AsyncRoute
+from apps.users.services import invalidate_route_tree
 
 class Command(BaseCommand):
     help = 'Insert system management routes into the database'
@@ -61,4 +62,7 @@ class Command(BaseCommand):
                 parent=system_route
             )
 
+        # 清除路由树缓存，前端下次请求将获取新的 ETag
+        invalidate_route_tree()
+
         self.stdout.write(self.style.SUCCESS('Successfully inserted system management routes'))
\ No newline at end of file
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.users.services import rebuild_department_closure
+
+class Command(BaseCommand):
+    help = 'Rebuild the department closure table from parent relations'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_department_closure()
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt department closure ({count} rows)'))
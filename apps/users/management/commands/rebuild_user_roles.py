@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.users.services import rebuild_user_roles
+
+class Command(BaseCommand):
+    help = 'Rebuild the user-role association table from User.roles'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_user_roles()
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt user roles ({count} rows)'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.users.services import reconcile_role_permissions
+
+class Command(BaseCommand):
+    help = 'Reconcile permission rows of all roles against the permission catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='Delete permission rows that are not in the catalogue')
+        parser.add_argument(
+            '--reset-labels', action='store_true',
+            help='Overwrite page names and descriptions of existing rows with the catalogue values',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created, updated, deleted = reconcile_role_permissions(prune=options['prune'], reset_labels=options['reset_labels'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully synced role permissions (created {created}, updated {updated}, deleted {deleted})'
+        ))
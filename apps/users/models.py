@@ -1,7 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save, pre_save, post_delete
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
+from django.db import transaction
+from .services import bump_permission_version, invalidate_route_tree, provision_role_permissions
+from .services import sync_user_roles, rename_user_role, remove_user_role_name
+
+# 写入令牌声明或决定令牌是否有效的字段
+TOKEN_CLAIM_FIELDS = {'username', 'nickname', 'dept_id', 'roles', 'is_active', 'password'}
 
 class User(AbstractUser):
     nickname = models.CharField(max_length=50, blank=True, default='', verbose_name='昵称', db_comment='用户昵称')
@@ -15,6 +21,7 @@ class User(AbstractUser):
     user_groups = models.JSONField(default=list, verbose_name='用户组列表', db_comment='用户组列表，JSON格式')
     user_permissions = models.JSONField(default=list, verbose_name='用户权限列表', db_comment='用户权限列表，JSON格式')
     is_expense_auditor = models.BooleanField(default=False, verbose_name="是否为费用审核员")
+    token_version = models.IntegerField(default=0, verbose_name='令牌版本', db_comment='令牌声明相关字段变化时递增，使已签发令牌中的声明失效')
 
     def to_dict(self):
         return {
@@ -45,8 +52,22 @@ class User(AbstractUser):
     def has_role(self, role_name):
         return role_name in self.roles
 
+    def save(self, *args, **kwargs):
+        # 令牌声明相关字段可能变化时递增令牌版本，已签发的令牌随之回退为读取数据库
+        update_fields = kwargs.get('update_fields')
+        if self.pk and (update_fields is None or TOKEN_CLAIM_FIELDS & set(update_fields)):
+            self.token_version += 1
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'token_version'}
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'zy_user'
+        indexes = [
+            # 数据权限按部门过滤时关联用户表
+            models.Index(fields=['dept_id', 'username']),
+            models.Index(fields=['nickname']),
+        ]
 
 class AsyncRoute(models.Model):
     path = models.CharField(max_length=255, default='', verbose_name='路由路径', db_comment='异步路由路径')
@@ -107,6 +128,45 @@ class Department(models.Model):
         ordering = ['sort', 'id']
         db_table = 'zy_department'
 
+class UserRole(models.Model):
+    """用户角色关联表，与 User.roles 保持同步，用于按索引解析权限和查询角色成员"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='role_links', verbose_name='用户', db_comment='用户ID')
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='user_links', verbose_name='角色', db_comment='角色ID')
+
+    class Meta:
+        db_table = 'zy_user_role'
+        unique_together = ('user', 'role')
+
+class DepartmentClosure(models.Model):
+    """部门层级闭包表，每条记录表示 ancestor 是 descendant 的祖先（包含自身，depth 为 0）"""
+    ancestor = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='descendant_links', verbose_name='祖先部门', db_comment='祖先部门ID')
+    descendant = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='ancestor_links', verbose_name='后代部门', db_comment='后代部门ID')
+    depth = models.IntegerField(default=0, verbose_name='层级距离', db_comment='祖先到后代的层级距离，自身为0')
+
+    class Meta:
+        db_table = 'zy_department_closure'
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+class PermissionVersion(models.Model):
+    """全局权限版本（单行），由数据库保存以保证所有 worker 读到同一版本，已编译权限缓存以此为键"""
+    version = models.CharField(max_length=32, verbose_name='版本号', db_comment='角色或权限变化时重新生成的版本号')
+    update_time = models.DateTimeField(auto_now=True, verbose_name='更新时间', db_comment='更新时间')
+
+    class Meta:
+        db_table = 'zy_permission_version'
+
+class CacheVersion(models.Model):
+    """按键区分的缓存版本号，保存在数据库中，进程内缓存以此为键，任一进程更新后所有 worker 的缓存立即失效"""
+    key = models.CharField(max_length=100, unique=True, verbose_name='缓存键', db_comment='缓存数据标识，如 route_tree')
+    version = models.CharField(max_length=32, verbose_name='版本号', db_comment='数据变化时重新生成的版本号')
+    update_time = models.DateTimeField(auto_now=True, verbose_name='更新时间', db_comment='更新时间')
+
+    class Meta:
+        db_table = 'zy_cache_version'
+
 class Permission(models.Model):
     """权限表"""
     role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='permissions', verbose_name='角色', db_comment='关联的角色')
@@ -139,28 +199,32 @@ class Permission(models.Model):
             self.role_name = self.role.name
         super().save(*args, **kwargs)
 
+@receiver(pre_save, sender=Role)
+def remember_role_name(sender, instance, **kwargs):
+    """记录角色原名称，用于重命名后同步用户的角色列表"""
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = Role.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
 @receiver(post_save, sender=Role)
 def create_or_update_permission(sender, instance, created, **kwargs):
     """当角色创建或更新时，同步更新权限"""
     if created:
-        # 获取现有的所有权限名称和描述
-        existing_permissions = Permission.objects.exclude(role=instance).values(
-            'permission_name', 'description', 'page_name'
-        ).distinct()
-        
-        # 为新角色创建所有权限记录
-        for perm in existing_permissions:
-            Permission.objects.create(
-                role=instance,
-                role_name=instance.name,
-                page_name=perm['page_name'],
-                permission_name=perm['permission_name'],
-                description=perm['description'],
-                permission_value=False  # 默认无权限
-            )
+        # 按权限目录一次性批量创建新角色的权限记录
+        with transaction.atomic():
+            provision_role_permissions(instance)
     else:
         # 更新角色时，只更新角色名称
         Permission.objects.filter(role=instance).update(role_name=instance.name)
+        previous_name = getattr(instance, '_previous_name', None)
+        if previous_name and previous_name != instance.name:
+            rename_user_role(instance.id, previous_name, instance.name)
+    bump_permission_version()
+
+@receiver(pre_delete, sender=Role)
+def remember_role_users(sender, instance, **kwargs):
+    """记录角色关联的用户，关联记录会随角色级联删除"""
+    instance._linked_user_ids = list(UserRole.objects.filter(role=instance).values_list('user_id', flat=True))
 
 @receiver(post_delete, sender=Role)
 def delete_role_permissions(sender, instance, **kwargs):
@@ -169,6 +233,26 @@ def delete_role_permissions(sender, instance, **kwargs):
         Permission.objects.filter(role_name=instance.name).delete()
     except Exception as e:
         print(f"Error in delete_role_permissions: {str(e)}")
+    remove_user_role_name(getattr(instance, '_linked_user_ids', []), instance.name)
+    bump_permission_version()
+
+@receiver(post_save, sender=User)
+def sync_user_role_links(sender, instance, update_fields=None, **kwargs):
+    """用户角色列表变化时同步用户角色关联表"""
+    if update_fields is None or 'roles' in update_fields:
+        sync_user_roles(instance)
+
+@receiver(post_save, sender=AsyncRoute)
+@receiver(post_delete, sender=AsyncRoute)
+def invalidate_async_routes(sender, instance, **kwargs):
+    """路由保存或删除时，清除路由树缓存"""
+    invalidate_route_tree()
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permission_cache(sender, instance, **kwargs):
+    """权限记录变化时，使已编译的权限缓存失效"""
+    bump_permission_version()
 
 # 确保信号被注册
 Role.post_save = post_save.connect(create_or_update_permission, sender=Role)
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from .models import Role, User, Department  # 修改这行导入语句
+from .services import get_department_map
+from .avatars import avatar_variant_path
 
 User = get_user_model()
 
@@ -11,10 +13,11 @@ class UserSerializer(serializers.ModelSerializer):
     roles = serializers.ListField(child=serializers.CharField(), required=False)
     dept = serializers.SerializerMethodField()
     createTime = serializers.SerializerMethodField()
+    avatarThumb = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'nickname', 'avatar', 'phone', 'sex', 'status', 'dept', 'remark', 'createTime', 'roles', 'password', 'dept_id')
+        fields = ('id', 'username', 'email', 'nickname', 'avatar', 'avatarThumb', 'phone', 'sex', 'status', 'dept', 'remark', 'createTime', 'roles', 'password', 'dept_id')
         extra_kwargs = {
             'password': {'write_only': True},
             'username': {'required': False},
@@ -31,20 +34,20 @@ class UserSerializer(serializers.ModelSerializer):
     def get_createTime(self, obj):
         return int(obj.date_joined.timestamp() * 1000)
 
+    def get_avatarThumb(self, obj):
+        # 列表展示使用 64px 缩略图，旧头像没有缩略图时返回原图
+        return avatar_variant_path(obj.avatar, 64)
+
     def get_dept(self, obj):
         if obj.dept_id:
-            try:
-                department = Department.objects.get(id=obj.dept_id)
-                return {'id': department.id, 'name': department.name}
-            except Department.DoesNotExist:
-                pass
+            # 列表接口通过 context 传入整页的部门映射，否则使用缓存的全量部门映射
+            dept_map = self.context.get('dept_map')
+            if dept_map is None:
+                dept_map = get_department_map()
+            if obj.dept_id in dept_map:
+                return {'id': obj.dept_id, 'name': dept_map[obj.dept_id]}
         return {'id': None, 'name': None}
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        ret['dept'] = self.get_dept(instance)
-        return ret
-
     def create(self, validated_data):
         password = validated_data.pop('password', None)
         user = User.objects.create(**validated_data)
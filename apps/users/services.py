@@ -0,0 +1,469 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+PERMISSION_CACHE_PREFIX = 'users:compiled_permissions'
+ROUTE_TREE_CACHE_PREFIX = 'users:async_route_tree'
+ROUTE_TREE_VERSION_KEY = 'route_tree'
+DEPARTMENT_MAP_CACHE_KEY = 'users:department_map'
+
+# 标准权限目录：模块 -> (页面名称, 数据权限, 操作权限)
+# permission_name 格式为 模块_类型_动作，如 expense_data_view_all
+PERMISSION_CATALOGUE = {
+    'expense': ('费用管理', {
+        'view_all': '查看全部数据',
+        'view_by_location': '按归属地查看数据',
+        'view_department_submissions': '查看部门提交的数据',
+        'view_own': '查看本人提交的数据',
+    }, {
+        'create': '新增',
+        'edit': '编辑',
+        'delete': '删除',
+        'audit': '审核',
+        'cancel_audit': '取消审核',
+        'view_receipt': '查看收据',
+    }),
+    'customer': ('客户管理', {
+        'view_all': '查看全部数据',
+        'view_by_location': '按归属地查看数据',
+        'view_department_submissions': '查看部门提交的数据',
+        'view_own': '查看本人提交的数据',
+    }, {
+        'create': '新增',
+        'edit': '编辑',
+        'delete': '删除',
+    }),
+    'contract': ('合同管理', {
+        'view_all': '查看全部数据',
+        'view_by_location': '按归属地查看数据',
+        'view_department_submissions': '查看部门提交的数据',
+        'view_own': '查看本人提交的数据',
+    }, {
+        'create': '新增',
+        'edit': '编辑',
+        'delete': '删除',
+    }),
+}
+
+# 权限模块，与 permission_name 的第一段对应
+PERMISSION_MODULES = tuple(PERMISSION_CATALOGUE)
+
+
+def get_permission_version():
+    """
+    获取当前权限版本号，不存在时生成一个新的版本号
+    版本号保存在数据库中，进程内缓存（LocMemCache）以版本号为键，其它 worker 修改权限后也能立即失效
+    """
+    from .models import PermissionVersion
+
+    version = PermissionVersion.objects.filter(id=1).values_list('version', flat=True).first()
+    if version is None:
+        version = PermissionVersion.objects.get_or_create(id=1, defaults={'version': uuid.uuid4().hex})[0].version
+    return version
+
+
+def bump_permission_version():
+    """角色或权限发生变化时调用，使所有已编译的权限缓存失效"""
+    from .models import PermissionVersion
+
+    version = uuid.uuid4().hex
+    if not PermissionVersion.objects.filter(id=1).update(version=version):
+        PermissionVersion.objects.update_or_create(id=1, defaults={'version': version})
+    return version
+
+
+def get_cache_version(key):
+    """获取数据库中保存的缓存版本号，不存在时生成一个新的版本号"""
+    from .models import CacheVersion
+
+    version = CacheVersion.objects.filter(key=key).values_list('version', flat=True).first()
+    if version is None:
+        version = CacheVersion.objects.get_or_create(key=key, defaults={'version': uuid.uuid4().hex})[0].version
+    return version
+
+
+def bump_cache_version(key):
+    """数据变化时调用，使所有进程中以旧版本号为键的缓存失效"""
+    from .models import CacheVersion
+
+    version = uuid.uuid4().hex
+    if not CacheVersion.objects.filter(key=key).update(version=version):
+        CacheVersion.objects.update_or_create(key=key, defaults={'version': version})
+    return version
+
+
+def parse_permission_name(permission_name):
+    """将 expense_data_view_all 拆分为 (module, perm_type, action)，格式不符时返回 None"""
+    parts = permission_name.split('_')
+    if len(parts) < 3:
+        return None
+    return parts[0], parts[1], '_'.join(parts[2:])
+
+
+def compile_permissions(rows):
+    """
+    将 (permission_name, permission_value) 记录合并为权限字典
+    任一角色拥有权限即为 True
+    """
+    combined_permissions = {module: {'data': {}, 'action': {}} for module in PERMISSION_MODULES}
+
+    for permission_name, permission_value in rows:
+        parsed = parse_permission_name(permission_name)
+        if not parsed:
+            continue
+        module, perm_type, action = parsed
+        if module in combined_permissions and perm_type in combined_permissions[module]:
+            if action not in combined_permissions[module][perm_type] or permission_value:
+                combined_permissions[module][perm_type][action] = permission_value
+
+    return combined_permissions
+
+
+def iter_permission_catalogue():
+    """按 (permission_name, page_name, description) 遍历标准权限目录"""
+    for module, (page_name, data_actions, operate_actions) in PERMISSION_CATALOGUE.items():
+        for perm_type, actions in (('data', data_actions), ('action', operate_actions)):
+            for action, description in actions.items():
+                yield f'{module}_{perm_type}_{action}', page_name, f'{page_name}-{description}'
+
+
+def provision_role_permissions(role):
+    """按权限目录为新角色一次性批量创建权限记录，默认无权限"""
+    from .models import Permission
+
+    Permission.objects.bulk_create([
+        Permission(
+            role=role,
+            role_name=role.name,
+            page_name=page_name,
+            permission_name=permission_name,
+            description=description,
+            permission_value=False,
+        )
+        for permission_name, page_name, description in iter_permission_catalogue()
+    ], ignore_conflicts=True)
+
+
+def reconcile_role_permissions(prune=False, reset_labels=False):
+    """
+    将所有角色的权限记录与权限目录对齐
+    批量补齐缺失的权限并修正冗余的角色名称；已有记录的页面名称/描述可能由管理员修改过，
+    仅在 reset_labels 为 True 时恢复为目录中的值；prune 为 True 时删除目录外的权限
+    返回 (新增数, 更新数, 删除数)
+    """
+    from .models import Role, Permission
+
+    catalogue = {name: (page_name, description) for name, page_name, description in iter_permission_catalogue()}
+    roles = list(Role.objects.values_list('id', 'name'))
+    existing = {
+        (perm.role_id, perm.permission_name): perm
+        for perm in Permission.objects.only('id', 'role_id', 'role_name', 'permission_name', 'page_name', 'description')
+    }
+
+    to_create, to_update = [], []
+    for role_id, role_name in roles:
+        for permission_name, (page_name, description) in catalogue.items():
+            perm = existing.get((role_id, permission_name))
+            if perm is None:
+                to_create.append(Permission(
+                    role_id=role_id,
+                    role_name=role_name,
+                    page_name=page_name,
+                    permission_name=permission_name,
+                    description=description,
+                    permission_value=False,
+                ))
+                continue
+
+            changed = perm.role_name != role_name
+            perm.role_name = role_name
+            if reset_labels and (perm.page_name, perm.description) != (page_name, description):
+                perm.page_name, perm.description = page_name, description
+                changed = True
+            if changed:
+                to_update.append(perm)
+
+    update_fields = ['role_name', 'page_name', 'description'] if reset_labels else ['role_name']
+    Permission.objects.bulk_create(to_create, batch_size=1000)
+    Permission.objects.bulk_update(to_update, update_fields, batch_size=1000)
+
+    deleted = 0
+    if prune:
+        deleted, _ = Permission.objects.exclude(permission_name__in=list(catalogue)).delete()
+
+    bump_permission_version()
+    return len(to_create), len(to_update), deleted
+
+
+def build_permission_matrix():
+    """
+    构建所有启用角色的权限矩阵
+    角色与权限各一次查询，模块/类型/动作骨架由权限数据推导
+    """
+    from .models import Role, Permission
+
+    roles = list(Role.objects.filter(status=1).order_by('id').values_list('id', 'name'))
+    rows = Permission.objects.filter(role__status=1).values_list(
+        'role_id', 'permission_name', 'permission_value'
+    )
+
+    skeleton = {}
+    role_values = {}
+    for role_id, permission_name, permission_value in rows:
+        parsed = parse_permission_name(permission_name)
+        if not parsed:
+            continue
+        module, perm_type, action = parsed
+        skeleton.setdefault(module, {}).setdefault(perm_type, {})[action] = False
+        role_values.setdefault(role_id, []).append((module, perm_type, action, permission_value))
+
+    permissions_data = []
+    for role_id, role_name in roles:
+        permissions = {
+            module: {perm_type: dict(actions) for perm_type, actions in types.items()}
+            for module, types in skeleton.items()
+        }
+        for module, perm_type, action, permission_value in role_values.get(role_id, []):
+            permissions[module][perm_type][action] = permission_value
+        permissions_data.append({
+            'role_name': role_name,
+            'permissions': permissions
+        })
+
+    return permissions_data
+
+
+def _permission_cache_key(role_names, version):
+    roles_key = json.dumps(sorted(set(role_names or [])), ensure_ascii=False)
+    digest = hashlib.md5(roles_key.encode('utf-8')).hexdigest()
+    return f'{PERMISSION_CACHE_PREFIX}:{version}:{digest}'
+
+
+def get_compiled_permissions(role_names, version=None):
+    """
+    获取角色集合对应的已编译权限，按角色集合和权限版本缓存
+    version 为调用方已读取的权限版本，未提供时从数据库读取
+    """
+    from .models import Permission
+
+    cache_key = _permission_cache_key(role_names, version or get_permission_version())
+    permissions = cache.get(cache_key)
+    if permissions is None:
+        # 通过角色表的唯一索引关联权限，而不是扫描未建索引的 role_name 列
+        rows = Permission.objects.filter(role__name__in=role_names or []).values_list(
+            'permission_name', 'permission_value'
+        )
+        permissions = compile_permissions(rows)
+        cache.set(cache_key, permissions, settings.PERMISSION_CACHE_TIMEOUT)
+    return permissions
+
+
+def sync_user_roles(user):
+    """根据 User.roles 中的角色名称同步用户角色关联表"""
+    from .models import Role, UserRole
+
+    role_ids = set(Role.objects.filter(name__in=user.roles or []).values_list('id', flat=True))
+    existing_ids = set(UserRole.objects.filter(user_id=user.id).values_list('role_id', flat=True))
+
+    if existing_ids - role_ids:
+        UserRole.objects.filter(user_id=user.id, role_id__in=existing_ids - role_ids).delete()
+    UserRole.objects.bulk_create(
+        [UserRole(user_id=user.id, role_id=role_id) for role_id in role_ids - existing_ids],
+        ignore_conflicts=True
+    )
+
+
+def rename_user_role(role_id, old_name, new_name):
+    """角色重命名后，批量更新关联用户 roles 列表中的角色名称"""
+    from .models import User
+
+    users = list(User.objects.filter(role_links__role_id=role_id).only('id', 'roles', 'token_version'))
+    for user in users:
+        user.roles = [new_name if name == old_name else name for name in user.roles or []]
+        user.token_version += 1
+    User.objects.bulk_update(users, ['roles', 'token_version'], batch_size=500)
+
+
+def remove_user_role_name(user_ids, role_name):
+    """角色删除后，从关联用户的 roles 列表中移除该角色"""
+    from .models import User
+
+    users = list(User.objects.filter(id__in=user_ids).only('id', 'roles', 'token_version'))
+    for user in users:
+        user.roles = [name for name in user.roles or [] if name != role_name]
+        user.token_version += 1
+    User.objects.bulk_update(users, ['roles', 'token_version'], batch_size=500)
+
+
+def rebuild_user_roles():
+    """根据所有用户的 roles 列表全量重建用户角色关联表，返回写入的记录数"""
+    from .models import Role, User, UserRole
+
+    role_ids = dict(Role.objects.values_list('name', 'id'))
+    rows = [
+        UserRole(user_id=user_id, role_id=role_ids[name])
+        for user_id, roles in User.objects.values_list('id', 'roles').iterator()
+        for name in set(roles or [])
+        if name in role_ids
+    ]
+
+    UserRole.objects.all().delete()
+    UserRole.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def build_route_tree():
+    """
+    一次查询加载全部异步路由，在内存中组装为树形结构
+    返回结构与 AsyncRoute.to_dict() 保持一致
+    """
+    from .models import AsyncRoute
+
+    rows = AsyncRoute.objects.order_by('id').values(
+        'id', 'parent_id', 'path', 'name', 'component', 'redirect', 'meta'
+    )
+
+    nodes = {}
+    children_map = {}
+    for row in rows:
+        nodes[row['id']] = {
+            'path': row['path'],
+            'name': row['name'],
+            'component': row['component'] if row['component'] else None,
+            'redirect': row['redirect'] if row['redirect'] else None,
+            'meta': row['meta'],
+        }
+        children_map.setdefault(row['parent_id'], []).append(row['id'])
+
+    for parent_id, child_ids in children_map.items():
+        if parent_id in nodes:
+            nodes[parent_id]['children'] = [nodes[child_id] for child_id in child_ids]
+
+    return [nodes[route_id] for route_id in children_map.get(None, [])]
+
+
+def get_route_tree():
+    """获取缓存的路由树，返回 (routes, etag)，缓存以数据库中的路由版本为键"""
+    cache_key = f'{ROUTE_TREE_CACHE_PREFIX}:{get_cache_version(ROUTE_TREE_VERSION_KEY)}'
+    cached = cache.get(cache_key)
+    if cached is None:
+        routes = build_route_tree()
+        cached = (routes, compute_etag(routes))
+        cache.set(cache_key, cached, settings.ROUTE_TREE_CACHE_TIMEOUT)
+    return cached
+
+
+def filter_routes_by_roles(routes, role_names):
+    """按路由 meta.roles 过滤路由树，未配置 roles 的路由对所有角色可见"""
+    role_names = set(role_names or [])
+    result = []
+    for route in routes:
+        allowed_roles = (route.get('meta') or {}).get('roles')
+        if allowed_roles and not role_names.intersection(allowed_roles):
+            continue
+        route = dict(route)
+        if 'children' in route:
+            route['children'] = filter_routes_by_roles(route['children'], role_names)
+        result.append(route)
+    return result
+
+
+def compute_etag(payload):
+    """根据响应数据计算 ETag"""
+    content = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return '"%s"' % hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def invalidate_route_tree():
+    """路由数据变化时更新路由版本，管理命令或其它 worker 中的修改也会使各进程的路由树缓存失效"""
+    bump_cache_version(ROUTE_TREE_VERSION_KEY)
+
+
+def get_department_map():
+    """获取 {部门ID: 部门名称} 映射，一次查询加载全部部门并缓存"""
+    from .models import Department
+
+    dept_map = cache.get(DEPARTMENT_MAP_CACHE_KEY)
+    if dept_map is None:
+        dept_map = dict(Department.objects.values_list('id', 'name'))
+        cache.set(DEPARTMENT_MAP_CACHE_KEY, dept_map, settings.DEPARTMENT_CACHE_TIMEOUT)
+    return dept_map
+
+
+def get_department_map_for(dept_ids):
+    """获取指定部门ID的名称映射，用于序列化一页用户时放入 serializer context"""
+    dept_map = get_department_map()
+    return {dept_id: dept_map[dept_id] for dept_id in set(dept_ids) if dept_id in dept_map}
+
+
+def invalidate_department_cache():
+    """部门创建、更新或删除后清除部门缓存"""
+    cache.delete(DEPARTMENT_MAP_CACHE_KEY)
+
+
+def get_department_subtree_ids(dept_id):
+    """
+    返回部门及其全部下级部门ID的查询集（基于闭包表的单次索引查询）
+    返回值未求值，可直接用作 dept_id__in 的子查询
+    """
+    from .models import DepartmentClosure
+
+    return DepartmentClosure.objects.filter(ancestor_id=dept_id).values_list('descendant_id', flat=True)
+
+
+def insert_department_closure(dept):
+    """新建部门后，写入自身及所有祖先到该部门的闭包记录"""
+    from .models import DepartmentClosure
+
+    rows = [DepartmentClosure(ancestor_id=dept.id, descendant_id=dept.id, depth=0)]
+    if dept.parent_id:
+        ancestors = DepartmentClosure.objects.filter(descendant_id=dept.parent_id).values_list('ancestor_id', 'depth')
+        rows.extend(
+            DepartmentClosure(ancestor_id=ancestor_id, descendant_id=dept.id, depth=depth + 1)
+            for ancestor_id, depth in ancestors
+        )
+    DepartmentClosure.objects.bulk_create(rows)
+
+
+def move_department_closure(dept_id, new_parent_id):
+    """
+    部门移动到新的上级部门（new_parent_id 为 None 表示成为顶级部门）后维护闭包表
+    先断开子树与原祖先的关联，再与新祖先建立关联
+    """
+    from .models import DepartmentClosure
+
+    subtree = list(DepartmentClosure.objects.filter(ancestor_id=dept_id).values_list('descendant_id', 'depth'))
+    subtree_ids = [descendant_id for descendant_id, _ in subtree]
+
+    DepartmentClosure.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+    if new_parent_id:
+        ancestors = DepartmentClosure.objects.filter(descendant_id=new_parent_id).values_list('ancestor_id', 'depth')
+        DepartmentClosure.objects.bulk_create([
+            DepartmentClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+            for ancestor_id, ancestor_depth in ancestors
+            for descendant_id, depth in subtree
+        ])
+
+
+def rebuild_department_closure():
+    """根据 parent 关系全量重建闭包表，返回写入的记录数"""
+    from .models import Department, DepartmentClosure
+
+    parent_map = dict(Department.objects.values_list('id', 'parent_id'))
+    rows = []
+    for dept_id in parent_map:
+        ancestor_id, depth, seen = dept_id, 0, set()
+        # 沿 parent 链向上遍历，seen 用于防止脏数据中的环
+        while ancestor_id is not None and ancestor_id in parent_map and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append(DepartmentClosure(ancestor_id=ancestor_id, descendant_id=dept_id, depth=depth))
+            ancestor_id = parent_map[ancestor_id]
+            depth += 1
+
+    DepartmentClosure.objects.all().delete()
+    DepartmentClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -1,3 +1,640 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, ImageFile
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.core.authentication.backends import ClaimsJWTAuthentication, ClaimsUser, refresh_token_for_user
+from apps.core.utils.pagination import MAX_PAGE_SIZE
+
+from .models import AsyncRoute, CacheVersion, Department, DepartmentClosure, User, UserRole, Role, Permission, PermissionVersion
+from .services import (
+    ROUTE_TREE_VERSION_KEY, get_compiled_permissions, get_department_subtree_ids, get_permission_version, get_route_tree,
+    rebuild_department_closure, rebuild_user_roles, reconcile_role_permissions,
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': MEDIA_ROOT}},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+PERMISSION_NAMES = [
+    'expense_data_view_all', 'expense_data_view_own', 'expense_action_create', 'expense_action_audit',
+    'customer_data_view_all', 'customer_action_edit',
+    'contract_data_view_all', 'contract_action_delete',
+]
+
+
+class PermissionMatrixTests(TestCase):
+    """权限矩阵接口的查询次数不应随角色数量增长"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', roles=['admin']))
+
+    def seed_roles(self, count):
+        start = Role.objects.count()
+        roles = Role.objects.bulk_create([
+            Role(name=f'role_{i}', code=f'role_{i}') for i in range(start, start + count)
+        ])
+        Permission.objects.bulk_create([
+            Permission(
+                role=role,
+                role_name=role.name,
+                page_name=name.split('_')[0],
+                permission_name=name,
+                permission_value=(index % 2 == 0),
+                description=name,
+            )
+            for role in roles
+            for index, name in enumerate(PERMISSION_NAMES)
+        ])
+
+    def get_matrix(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/permission')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data'], len(queries)
+
+    def test_query_count_is_constant(self):
+        self.seed_roles(5)
+        data, small_count = self.get_matrix()
+        self.assertEqual(len(data), 5)
+
+        self.seed_roles(495)
+        data, large_count = self.get_matrix()
+        self.assertEqual(len(data), 500)
+        self.assertEqual(small_count, large_count)
+
+    def test_matrix_values(self):
+        self.seed_roles(1)
+        Role.objects.create(name='empty', code='empty')
+        Role.objects.bulk_create([Role(name='disabled', code='disabled', status=0)])
+
+        data, _ = self.get_matrix()
+        by_role = {item['role_name']: item['permissions'] for item in data}
+
+        self.assertNotIn('disabled', by_role)
+        self.assertTrue(by_role['role_0']['expense']['data']['view_all'])
+        self.assertFalse(by_role['role_0']['expense']['data']['view_own'])
+        self.assertTrue(by_role['role_0']['contract']['data']['view_all'])
+        # 没有权限记录的角色也返回完整骨架，默认无权限
+        self.assertFalse(by_role['empty']['customer']['action']['edit'])
+
+
+class CompiledPermissionCacheTests(TestCase):
+    """已编译权限按数据库中的权限版本缓存，其它进程修改权限后立即失效"""
+
+    def setUp(self):
+        self.role = Role.objects.create(name='auditor', code='auditor')
+
+    def set_view_all(self, value):
+        # queryset.update() 不触发信号，模拟缓存未被本进程失效的情况
+        Permission.objects.filter(role=self.role, permission_name='expense_data_view_all').update(permission_value=value)
+
+    def test_cached_until_version_changes(self):
+        self.assertFalse(get_compiled_permissions(['auditor'])['expense']['data']['view_all'])
+        self.set_view_all(True)
+        self.assertFalse(get_compiled_permissions(['auditor'])['expense']['data']['view_all'])
+
+        # 其它 worker 修改权限时只更新了数据库中的版本号
+        PermissionVersion.objects.filter(id=1).update(version='changed-elsewhere')
+        self.assertTrue(get_compiled_permissions(['auditor'])['expense']['data']['view_all'])
+
+    def test_permission_save_bumps_version(self):
+        self.assertFalse(get_compiled_permissions(['auditor'])['expense']['data']['view_all'])
+        permission = Permission.objects.get(role=self.role, permission_name='expense_data_view_all')
+        permission.permission_value = True
+        permission.save()
+        self.assertTrue(get_compiled_permissions(['auditor'])['expense']['data']['view_all'])
+
+
+class ClaimsAuthenticationTests(TestCase):
+    """令牌声明只在用户令牌版本未变化且用户仍启用时使用，否则回退为读取数据库"""
+
+    def setUp(self):
+        self.role = Role.objects.create(name='auditor', code='auditor')
+        self.user = User.objects.create(username='claims', nickname='甲', roles=['auditor'])
+
+    def authenticate(self):
+        token = AccessToken(str(refresh_token_for_user(self.user).access_token))
+        return lambda: ClaimsJWTAuthentication().get_user(token)
+
+    def test_claims_used_while_current(self):
+        get_user = self.authenticate()
+        with CaptureQueriesContext(connection) as queries:
+            user = get_user()
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(user.roles, ['auditor'])
+        self.assertEqual(len(queries), 1)
+
+        # 仅更新登录时间不影响令牌声明
+        self.user.save(update_fields=['last_login'])
+        self.assertIsInstance(get_user(), ClaimsUser)
+
+    def test_role_revoke_falls_back_to_database(self):
+        get_user = self.authenticate()
+        self.user.roles = []
+        self.user.save()
+        user = get_user()
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertEqual(user.roles, [])
+
+    def test_role_delete_falls_back_to_database(self):
+        get_user = self.authenticate()
+        self.role.delete()
+        user = get_user()
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertEqual(user.roles, [])
+
+    def test_disabled_user_rejected(self):
+        get_user = self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            get_user()
+
+    def test_disabled_without_save_rejected(self):
+        # 其它进程直接更新数据库、未递增令牌版本时同样失效
+        get_user = self.authenticate()
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            get_user()
+
+    def test_stale_claim_without_version(self):
+        token = AccessToken(str(refresh_token_for_user(self.user).access_token))
+        del token['token_version']
+        self.assertNotIsInstance(ClaimsJWTAuthentication().get_user(token), ClaimsUser)
+
+    def test_permission_change_keeps_other_tokens(self):
+        get_user = self.authenticate()
+        other = User.objects.create(username='other')
+        other.roles = ['auditor']
+        other.save()
+        permission = Permission.objects.get(role=self.role, permission_name='expense_data_view_all')
+        permission.permission_value = True
+        permission.save()
+
+        user = get_user()
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertTrue(get_compiled_permissions(user.roles, user.permission_version)['expense']['data']['view_all'])
+
+
+class UserCursorPaginationTests(TestCase):
+    """用户列表游标分页：每页记录数取自请求体，需要转换和限制范围"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', roles=['admin']))
+        User.objects.bulk_create([User(username=f'user_{i}') for i in range(4)])
+
+    def fetch(self, **body):
+        return self.client.post('/user', body, format='json')
+
+    def test_walks_all_pages(self):
+        seen = []
+        after = ''
+        while after is not None:
+            data = self.fetch(after=after, pageSize='2').json()['data']
+            self.assertEqual(data['pageSize'], 2)
+            self.assertLessEqual(len(data['list']), 2)
+            seen.extend(user['username'] for user in data['list'])
+            after = data['next']
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_page_size_is_clamped(self):
+        data = self.fetch(after='', pageSize=0).json()['data']
+        self.assertEqual((data['pageSize'], len(data['list'])), (1, 1))
+        self.assertEqual(self.fetch(after='', pageSize=10 ** 6).json()['data']['pageSize'], MAX_PAGE_SIZE)
+
+    def test_invalid_input_returns_400(self):
+        self.assertEqual(self.fetch(after='', pageSize='abc').status_code, 400)
+        self.assertEqual(self.fetch(after='', pageSize=None).status_code, 400)
+        self.assertEqual(self.fetch(after='not-a-cursor', pageSize=2).status_code, 400)
+
+
+# Django 4.2 覆盖 STORAGES 时 default 存储的 OPTIONS 不生效，需同时覆盖 MEDIA_ROOT
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_ROOT=MEDIA_ROOT, AVATAR_MAX_PIXELS=32 * 32)
+class AvatarUploadTests(TestCase):
+    """multipart 头像上传：在解码像素之前按宽高拒绝超大图片"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create(username='avatar')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, size):
+        buffer = BytesIO()
+        Image.new('RGB', size).save(buffer, format='PNG')
+        upload = SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+        return self.client.post('/user/upload-avatar', {'id': self.user.id, 'file': upload}, format='multipart')
+
+    def test_small_image_is_stored(self):
+        response = self.upload((32, 32))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['data'][0]['variants']), {'64', '128', '256'})
+
+    def test_too_many_pixels_rejected_before_decoding(self):
+        with mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            response = self.upload((33, 32))
+        self.assertEqual(response.status_code, 400)
+        load.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+
+class ReconcileRolePermissionsTests(TestCase):
+    """权限同步只补齐缺失的记录，管理员修改过的页面名称/描述需显式指定才会恢复"""
+
+    def setUp(self):
+        self.role = Role.objects.create(name='clerk', code='clerk')
+        self.edited = Permission.objects.get(role=self.role, permission_name='expense_data_view_all')
+        self.catalogue_labels = (self.edited.page_name, self.edited.description)
+        Permission.objects.filter(id=self.edited.id).update(page_name='自定义页面', description='自定义说明')
+        Permission.objects.filter(role=self.role, permission_name='customer_action_edit').delete()
+
+    def labels(self):
+        self.edited.refresh_from_db()
+        return self.edited.page_name, self.edited.description
+
+    def test_creates_missing_rows_and_keeps_labels(self):
+        self.assertEqual(reconcile_role_permissions(), (1, 0, 0))
+        self.assertTrue(Permission.objects.filter(role=self.role, permission_name='customer_action_edit').exists())
+        self.assertEqual(self.labels(), ('自定义页面', '自定义说明'))
+
+    def test_reset_labels_flag(self):
+        call_command('sync_role_permissions', '--reset-labels', stdout=StringIO())
+        self.assertEqual(self.labels(), self.catalogue_labels)
+
+
+class DepartmentClosureTests(TestCase):
+    """部门新建、移动、删除时增量维护闭包表，结果与全量重建一致"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', roles=['admin']))
+
+    def body(self, name, parent=None):
+        return {'name': name, 'parentId': parent.id if parent else 0, 'sort': 0, 'status': 1, 'phone': '', 'principal': '', 'email': '', 'remark': ''}
+
+    def create(self, name, parent=None):
+        response = self.client.post('/dept/create', self.body(name, parent), format='json')
+        self.assertEqual(response.status_code, 201)
+        return Department.objects.get(name=name)
+
+    def closure(self):
+        return set(DepartmentClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assert_matches_rebuild(self):
+        closure = self.closure()
+        rebuild_department_closure()
+        self.assertEqual(self.closure(), closure)
+
+    def subtree(self, dept):
+        return set(Department.objects.filter(id__in=get_department_subtree_ids(dept.id)).values_list('name', flat=True))
+
+    def test_create(self):
+        root = self.create('总公司')
+        branch = self.create('分公司', root)
+        team = self.create('销售部', branch)
+        self.assertIn((root.id, team.id, 2), self.closure())
+        self.assertEqual(self.subtree(root), {'总公司', '分公司', '销售部'})
+        self.assert_matches_rebuild()
+
+    def test_move(self):
+        root = self.create('总公司')
+        east = self.create('华东', root)
+        west = self.create('华西', root)
+        team = self.create('销售部', east)
+        self.create('销售一组', team)
+
+        response = self.client.post('/dept/update', {**self.body('销售部', west), 'id': team.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.subtree(east), {'华东'})
+        self.assertEqual(self.subtree(west), {'华西', '销售部', '销售一组'})
+        self.assert_matches_rebuild()
+
+        # 不能移动到自身的下级部门下
+        response = self.client.post('/dept/update', {**self.body('总公司', team), 'id': root.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete(self):
+        root = self.create('总公司')
+        branch = self.create('分公司', root)
+        team = self.create('销售部', branch)
+
+        response = self.client.post('/dept/delete', branch.id, format='json')
+        self.assertEqual(response.status_code, 200)
+        # 下级部门成为顶级部门，与原祖先断开关联
+        self.assertEqual(self.subtree(root), {'总公司'})
+        self.assertEqual(self.subtree(team), {'销售部'})
+        self.assertFalse(DepartmentClosure.objects.filter(ancestor_id=root.id, descendant_id=team.id).exists())
+        self.assert_matches_rebuild()
+
+
+class BatchPermissionUpdateTests(TestCase):
+    """批量修改权限：一次事务内生效，任一角色或权限不存在时整批不修改"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', roles=['admin']))
+        Role.objects.create(name='clerk', code='clerk')
+        Role.objects.create(name='manager', code='manager')
+
+    def batch_update(self, changes):
+        return self.client.post('/permission/batch-update', {'changes': changes}, format='json')
+
+    def value(self, role_name, permission_name):
+        return Permission.objects.get(role__name=role_name, permission_name=permission_name).permission_value
+
+    def test_applies_changes(self):
+        version = get_permission_version()
+        response = self.batch_update([
+            {'role': 'clerk', 'field': 'expense_data_view_own', 'isAllowed': True},
+            {'role': 'manager', 'field': 'expense_data_view_all', 'isAllowed': False},
+            {'role': 'manager', 'field': 'expense_data_view_all', 'isAllowed': True},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.value('clerk', 'expense_data_view_own'))
+        # 同一单元格多次修改以最后一次为准
+        self.assertTrue(self.value('manager', 'expense_data_view_all'))
+        self.assertNotEqual(get_permission_version(), version)
+
+        by_role = {item['role_name']: item['permissions'] for item in response.json()['data']}
+        self.assertTrue(by_role['clerk']['expense']['data']['view_own'])
+
+    def test_unknown_role_or_permission_changes_nothing(self):
+        valid = {'role': 'clerk', 'field': 'expense_data_view_own', 'isAllowed': True}
+        for invalid in (
+            {'role': 'nobody', 'field': 'expense_data_view_own', 'isAllowed': True},
+            {'role': 'clerk', 'field': 'expense_data_view_nothing', 'isAllowed': True},
+        ):
+            with self.subTest(invalid=invalid):
+                self.assertEqual(self.batch_update([valid, invalid]).status_code, 404)
+                self.assertFalse(self.value('clerk', 'expense_data_view_own'))
+
+    def test_missing_parameters(self):
+        self.assertEqual(self.batch_update([]).status_code, 400)
+        self.assertEqual(self.batch_update([{'role': 'clerk', 'field': 'expense_data_view_own'}]).status_code, 400)
+
+
+class RouteTreeTests(TestCase):
+    """路由树一次查询构建，以数据库中的路由版本为缓存键，客户端 ETag 相同时返回 304"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', roles=['admin']))
+
+    def seed_routes(self, count):
+        for i in range(count):
+            parent = AsyncRoute.objects.create(path=f'/module{i}', name=f'Module{i}', meta={'title': f'模块{i}'})
+            AsyncRoute.objects.create(path=f'/module{i}/list', name=f'Module{i}List', parent=parent, meta={'title': '列表'})
+
+    def fetch(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/get-async-routes/', **headers)
+
+    def test_single_query_build(self):
+        self.seed_routes(2)
+        with CaptureQueriesContext(connection) as small:
+            routes, _ = get_route_tree()
+        self.assertEqual(routes, [route.to_dict() for route in AsyncRoute.objects.filter(parent=None).order_by('id')])
+
+        self.seed_routes(20)
+        with CaptureQueriesContext(connection) as large:
+            get_route_tree()
+        self.assertEqual(len(small), len(large))
+
+        # 缓存命中时只读取路由版本
+        with self.assertNumQueries(1):
+            get_route_tree()
+
+    def test_etag_not_modified(self):
+        self.seed_routes(1)
+        response = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.fetch(etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(self.fetch('"stale"').status_code, 200)
+
+    def test_invalidated_on_save_and_delete(self):
+        self.seed_routes(1)
+        etag = self.fetch()['ETag']
+
+        route = AsyncRoute.objects.get(name='Module0List')
+        route.meta = {'title': '明细'}
+        route.save()
+        response = self.fetch(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['children'][0]['meta'], {'title': '明细'})
+
+        etag = response['ETag']
+        route.delete()
+        response = self.fetch(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('children', response.json()['data'][0])
+
+    def test_invalidated_by_other_process(self):
+        self.seed_routes(1)
+        etag = self.fetch()['ETag']
+        # 其它进程（管理命令或其它 worker）修改路由时只更新了数据库中的版本号
+        AsyncRoute.objects.filter(name='Module0').update(meta={'title': '新模块'})
+        CacheVersion.objects.filter(key=ROUTE_TREE_VERSION_KEY).update(version='changed-elsewhere')
+        response = self.fetch(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['meta'], {'title': '新模块'})
+
+
+class UserRoleSyncTests(TestCase):
+    """用户角色关联表与 User.roles 保持同步"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin'))
+        self.clerk = Role.objects.create(name='clerk', code='clerk')
+        self.manager = Role.objects.create(name='manager', code='manager')
+
+    def links(self, user):
+        return set(UserRole.objects.filter(user=user).values_list('role__name', flat=True))
+
+    def json_scan(self, role):
+        """原实现：逐个用户扫描 roles 列表"""
+        return sorted(user.id for user in User.objects.all() if role.name in (user.roles or []))
+
+    def test_create_and_update_sync_links(self):
+        user = User.objects.create(username='alice', roles=['clerk', 'unknown'])
+        self.assertEqual(self.links(user), {'clerk'})
+
+        user.roles = ['manager']
+        user.save(update_fields=['roles'])
+        self.assertEqual(self.links(user), {'manager'})
+
+        # 未涉及 roles 的部分更新不改动关联表
+        user.nickname = 'Alice'
+        user.save(update_fields=['nickname'])
+        self.assertEqual(self.links(user), {'manager'})
+
+    def test_role_rename_rewrites_roles(self):
+        user = User.objects.create(username='alice', roles=['clerk', 'manager'])
+        version = User.objects.get(id=user.id).token_version
+
+        self.clerk.name = 'cashier'
+        self.clerk.save()
+        user.refresh_from_db()
+        self.assertEqual(user.roles, ['cashier', 'manager'])
+        self.assertEqual(self.links(user), {'cashier', 'manager'})
+        self.assertGreater(user.token_version, version)
+
+    def test_role_delete_removes_name(self):
+        user = User.objects.create(username='alice', roles=['clerk', 'manager'])
+        self.clerk.delete()
+        user.refresh_from_db()
+        self.assertEqual(user.roles, ['manager'])
+        self.assertEqual(self.links(user), {'manager'})
+
+    def test_role_filters_match_json_scan(self):
+        for i, roles in enumerate((['clerk'], ['manager'], ['clerk', 'manager'], [])):
+            User.objects.create(username=f'user_{i}', roles=roles)
+
+        for role in (self.clerk, self.manager):
+            with self.subTest(role=role.name):
+                data = self.client.post('/user', {'roleId': role.id, 'pageSize': 50}, format='json').json()['data']
+                self.assertEqual(sorted(user['id'] for user in data['list']), self.json_scan(role))
+
+        user = User.objects.get(username='user_2')
+        data = self.client.post('/list-role-ids', {'userId': user.id}, format='json').json()['data']
+        self.assertEqual(sorted(data), sorted(Role.objects.filter(name__in=user.roles).values_list('id', flat=True)))
+
+    def test_rebuild_repairs_drift(self):
+        alice = User.objects.create(username='alice', roles=['clerk'])
+        bob = User.objects.create(username='bob', roles=['manager'])
+        # queryset.update() 不触发信号，关联表与 roles 出现偏差
+        User.objects.filter(id=alice.id).update(roles=['manager'])
+        UserRole.objects.filter(user=bob).delete()
+
+        self.assertEqual(rebuild_user_roles(), 2)
+        self.assertEqual((self.links(alice), self.links(bob)), ({'manager'}, {'manager'}))
+
+
+class SessionBootstrapTests(TestCase):
+    """登录后一次性返回用户信息、按角色过滤的路由和权限，内容不变时返回 304"""
+
+    def setUp(self):
+        cache.clear()
+        self.role = Role.objects.create(name='clerk', code='clerk')
+        self.user = User.objects.create(username='alice', nickname='甲', roles=['clerk'])
+        AsyncRoute.objects.create(path='/home', name='Home', meta={'title': '首页'})
+        AsyncRoute.objects.create(path='/system', name='System', meta={'title': '系统', 'roles': ['admin']})
+        clerk = AsyncRoute.objects.create(path='/expense', name='Expense', meta={'title': '费用', 'roles': ['clerk']})
+        AsyncRoute.objects.create(path='/expense/audit', name='ExpenseAudit', parent=clerk, meta={'title': '审核', 'roles': ['admin']})
+        AsyncRoute.objects.create(path='/expense/list', name='ExpenseList', parent=clerk, meta={'title': '列表'})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/session-bootstrap/', **headers)
+
+    def test_routes_filtered_by_roles(self):
+        data = self.fetch().json()['data']
+        self.assertEqual([route['name'] for route in data['routes']], ['Home', 'Expense'])
+        self.assertEqual([route['name'] for route in data['routes'][1]['children']], ['ExpenseList'])
+        self.assertEqual((data['profile']['username'], data['roles']), ('alice', ['clerk']))
+        self.assertIn('expense', data['permissions'])
+
+    def test_etag_not_modified(self):
+        etag = self.fetch()['ETag']
+        response = self.fetch(etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_etag_changes_with_profile_and_permissions(self):
+        etag = self.fetch()['ETag']
+
+        self.user.nickname = '乙'
+        self.user.save()
+        response = self.fetch(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        permission = Permission.objects.get(role=self.role, permission_name='expense_data_view_all')
+        permission.permission_value = True
+        permission.save()
+        response = self.fetch(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['data']['permissions']['expense']['data']['view_all'])
+
+    def test_claims_user_reads_user_row_once(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh_token_for_user(self.user).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/session-bootstrap/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['profile']['nickname'], '甲')
+        # 只有认证时校验令牌版本的一次用户查询
+        user_queries = [query['sql'] for query in queries if 'FROM "zy_user" ' in query['sql']]
+        self.assertEqual(len(user_queries), 1)
+
+
+class UserListDepartmentTests(TestCase):
+    """用户列表的部门名称取自缓存的部门映射，查询数与每页条数无关，部门增删改后立即生效"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', roles=['admin']))
+        self.depts = [Department.objects.create(name=f'部门{i}') for i in range(3)]
+        User.objects.bulk_create([User(username=f'user_{i}', dept_id=self.depts[i % 3].id) for i in range(8)])
+
+    def dept_names(self):
+        data = self.client.post('/user', {'pageSize': 20}, format='json').json()['data']
+        return {user['username']: user['dept']['name'] for user in data['list']}
+
+    def dept_payload(self, **fields):
+        payload = {'parentId': 0, 'sort': 0, 'phone': '', 'principal': '', 'email': '', 'status': 1, 'remark': ''}
+        payload.update(fields)
+        return payload
+
+    def test_query_count_independent_of_page_size(self):
+        counts = []
+        for page_size in (2, 8):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/user', {'pageSize': page_size}, format='json')
+            self.assertEqual(len(response.json()['data']['list']), page_size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_department_changes_visible_immediately(self):
+        self.assertEqual(self.dept_names()['user_0'], '部门0')
+
+        response = self.client.post('/dept/update', self.dept_payload(id=self.depts[0].id, name='财务部'), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.dept_names()['user_0'], '财务部')
+
+        response = self.client.post('/dept/create', self.dept_payload(name='新部门'), format='json')
+        self.assertEqual(response.status_code, 201)
+        User.objects.filter(username='user_1').update(dept_id=response.json()['data']['id'])
+        self.assertEqual(self.dept_names()['user_1'], '新部门')
+
+        self.client.post('/dept/delete', self.depts[2].id, format='json')
+        self.assertIsNone(self.dept_names()['user_2'])
@@ -8,6 +8,7 @@ urlpatterns = [
     path('login/', views.LoginView.as_view(), name='login'),
     path('refresh-token/', views.RefreshTokenView.as_view(), name='refresh-token'),
     path('get-async-routes/', views.get_async_routes, name='get_async_routes'),
+    path('session-bootstrap/', views.get_session_bootstrap, name='session_bootstrap'),
     
     # 用户管理
     path('user', views.get_user_list, name='get_user_list'),
@@ -36,5 +37,6 @@ urlpatterns = [
     # 权限管理
     path('permission', views.get_permissions_list, name='get_permissions_list'),
     path('permission/update', views.update_permission, name='update_permission'),
+    path('permission/batch-update', views.batch_update_permissions, name='batch_update_permissions'),
     path('current-user-permissions/', views.get_current_user_permissions, name='current_user_permissions'),
 ] 
\ No newline at end of file
@@ -9,7 +9,12 @@ from django.utils.decorators import method_decorator # type: ignore
 from django.views.decorators.csrf import csrf_exempt # type: ignore
 from rest_framework_simplejwt.exceptions import TokenError # type: ignore
 import logging
-from .models import AsyncRoute, Role, Department, Permission
+from .models import Role, Department, Permission
+from .services import get_compiled_permissions, bump_permission_version, get_route_tree, build_permission_matrix
+from .services import get_department_map_for, invalidate_department_cache
+from .services import get_department_subtree_ids, insert_department_closure, move_department_closure
+from .services import filter_routes_by_roles, compute_etag
+from .avatars import AvatarUploadHandler, ImageTooLarge, store_avatar
 from rest_framework.decorators import api_view, permission_classes # type: ignore
 from rest_framework.permissions import IsAuthenticated # type: ignore
 from django.http import JsonResponse # type: ignore
@@ -19,6 +24,7 @@ from django.contrib.auth import get_user_model # type: ignore
 import time
 from django.core.files.base import ContentFile # type: ignore
 import base64
+from PIL import Image # type: ignore
 import uuid
 import os
 from django.conf import settings # type: ignore
@@ -29,6 +35,8 @@ from django.db.models import Model # type: ignore
 from django.db import models # type: ignore
 from django.db.models import Q # type: ignore
 from storages.backends.s3boto3 import S3Boto3Storage # type: ignore
+from apps.core.authentication.backends import refresh_token_for_user, set_user_claims
+from apps.core.utils.pagination import CURSOR_PARAM, InvalidCursor, get_cursor_page, parse_page_size
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -42,7 +50,8 @@ class LoginView(APIView):
             password = serializer.validated_data['password']
             user = authenticate(username=username, password=password)
             if user:
-                refresh = RefreshToken.for_user(user)
+                # 令牌携带用户常用字段和权限版本，后续请求无需再读取用户表
+                refresh = refresh_token_for_user(user)
                 user_data = UserSerializer(user).data
                 return Response({
                     'success': True,
@@ -69,6 +78,11 @@ class RefreshTokenView(APIView):
 
         try:
             token = RefreshToken(refresh_token)
+            # 使用最新的用户信息和权限版本刷新令牌声明
+            user = User.objects.filter(id=token['user_id']).first()
+            if user is None or not user.is_active:
+                return Response({"success": False, "message": "User not found"}, status=status.HTTP_401_UNAUTHORIZED)
+            set_user_claims(token, user)
             access_token = str(token.access_token)
             new_refresh_token = str(token)
             expires_timestamp = token.access_token.payload['exp']
@@ -91,12 +105,17 @@ class RefreshTokenView(APIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_async_routes(request):
-    top_level_routes = AsyncRoute.objects.filter(parent=None)  # 只获取启用的顶路由
-    routes_data = [route.to_dict() for route in top_level_routes]
-    return Response({
-        "success": True,
-        "data": routes_data
-    })
+    # 路由树一次查询构建并缓存，客户端携带相同 ETag 时直接返回 304
+    routes_data, etag = get_route_tree()
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({
+            "success": True,
+            "data": routes_data
+        })
+    response['ETag'] = etag
+    return response
 
 @csrf_exempt
 @api_view(['POST'])
@@ -106,6 +125,7 @@ def get_user_list(request):
     username = data.get('username', '')
     status = data.get('status')
     dept_id = data.get('deptId')
+    role_id = data.get('roleId')
     page = data.get('currentPage', 1)
     page_size = data.get('pageSize', 10)
 
@@ -116,17 +136,39 @@ def get_user_list(request):
         users = users.filter(status=status)
     if dept_id:
         users = users.filter(dept_id=dept_id)
+    if role_id:
+        users = users.filter(role_links__role_id=role_id)
 
-    paginator = Paginator(users, page_size)
-    users_page = paginator.get_page(page)
+    cursor_mode = CURSOR_PARAM in data
+    if cursor_mode:
+        # 游标分页：按 id 索引定位下一页，不统计总数
+        try:
+            page_size = parse_page_size(page_size)
+            users_page, next_cursor = get_cursor_page(users, data.get(CURSOR_PARAM), page_size)
+        except InvalidCursor as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    else:
+        paginator = Paginator(users, page_size)
+        users_page = paginator.get_page(page)
 
-    serializer = UserSerializer(users_page, many=True)
+    # 整页用户的部门名称一次性取出，避免逐行查询部门表
+    dept_map = get_department_map_for(user.dept_id for user in users_page)
+    serializer = UserSerializer(users_page, many=True, context={'dept_map': dept_map})
     user_data = serializer.data
     
     # 确保每个用户都有 dept 字段，即使它可能为空
     for user in user_data:
         if 'dept' not in user or user['dept'] is None:
             user['dept'] = {'id': None, 'name': None}
+    if cursor_mode:
+        return JsonResponse({
+            'success': True,
+            'data': {
+                'list': user_data,
+                'next': next_cursor,
+                'pageSize': page_size
+            }
+        })
     return JsonResponse({
         'success': True,
         'data': {
@@ -145,11 +187,11 @@ def get_role_ids(request):
     user_id = data.get('userId')
     if user_id:
         try:
-            user = User.objects.get(id=user_id)
-            role_names = user.roles  # 假设这是角色名称列表
-            
-            # 获取对应的角色ID
-            role_ids = Role.objects.filter(name__in=role_names).values_list('id', flat=True)
+            if not User.objects.filter(id=user_id).exists():
+                raise User.DoesNotExist
+
+            # 通过用户角色关联表获取角色ID
+            role_ids = Role.objects.filter(user_links__user_id=user_id).values_list('id', flat=True)
             
             return JsonResponse({
                 'success': True,
@@ -259,6 +301,10 @@ def reset_password(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_avatar(request):
+    # multipart 上传走流式处理并生成缩略图，JSON base64 方式保持兼容
+    if request.content_type.startswith('multipart/form-data'):
+        return upload_avatar_file(request)
+
     try:
         data = json.loads(request.body)
         user_id = data.get('id')
@@ -330,6 +376,53 @@ def upload_avatar(request):
             'message': '无效的请求数据'
         }, status=status.HTTP_400_BAD_REQUEST)
 
+def upload_avatar_file(request):
+    """multipart 头像上传：读取请求体时即校验文件头，保存原图及 64/128/256 缩略图"""
+    handler = AvatarUploadHandler(request._request)
+    # 必须在访问 request.data 之前插入，才能在解析请求体时生效
+    request.upload_handlers.insert(0, handler)
+
+    user_id = request.data.get('id')
+    upload = request.FILES.get('file')
+    if handler.error:
+        return JsonResponse({
+            'success': False,
+            'message': handler.error
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not user_id or not upload:
+        return JsonResponse({
+            'success': False,
+            'message': '参数不完整'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not User.objects.filter(id=user_id).exists():
+        return JsonResponse({
+            'success': False,
+            'message': '用户不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        original_path, variants = store_avatar(user_id, upload)
+    except ImageTooLarge as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except (ValueError, OSError, Image.DecompressionBombError):
+        return JsonResponse({
+            'success': False,
+            'message': '无效的图片文件'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    User.objects.filter(id=user_id).update(avatar=original_path)
+    return JsonResponse({
+        'success': True,
+        'data': [{
+            'avatar_url': original_path,
+            'variants': {str(size): path for size, path in variants.items()}
+        }]
+    })
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -560,7 +653,10 @@ def create_dept(request):
     }
     serializer = DepartmentSerializer(data=backend_data)
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():
+            department = serializer.save()
+            insert_department_closure(department)
+        invalidate_department_cache()
         converted_data = convert_to_frontend_format(serializer.data)
         return JsonResponse({'success': True, 'data': converted_data}, status=status.HTTP_201_CREATED)
     return JsonResponse({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -592,10 +688,19 @@ def update_dept(request):
         # 如果 parentId 为 0，将其置为 None（表示顶级部门）
         if backend_data['parent_id'] == 0:
             backend_data['parent_id'] = None
-        
+
+        # 不允许将部门移动到自身或其下级部门下
+        if backend_data['parent_id'] is not None and get_department_subtree_ids(department.id).filter(descendant_id=backend_data['parent_id']).exists():
+            return JsonResponse({'success': False, 'message': '不能将部门移动到自身或其下级部门下'}, status=status.HTTP_400_BAD_REQUEST)
+
+        old_parent_id = department.parent_id
         serializer = DepartmentSerializer(department, data=backend_data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                department = serializer.save()
+                if department.parent_id != old_parent_id:
+                    move_department_closure(department.id, department.parent_id)
+            invalidate_department_cache()
             converted_data = convert_to_frontend_format(serializer.data)
             return JsonResponse({'success': True, 'data': converted_data}, status=status.HTTP_200_OK)
         return JsonResponse({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -609,7 +714,13 @@ def delete_dept(request):
 
     try:
         department = Department.objects.get(id=dept_id)
-        department.delete()
+        with transaction.atomic():
+            # 删除后下级部门成为顶级部门（parent 置空），需同步断开与原祖先的闭包关联
+            child_ids = list(department.children.values_list('id', flat=True))
+            department.delete()
+            for child_id in child_ids:
+                move_department_closure(child_id, None)
+        invalidate_department_cache()
         return JsonResponse({'success': True, 'message': 'Department deleted successfully'}, status=status.HTTP_200_OK)
     except Department.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Department not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -631,78 +742,7 @@ def get_user_roles(request):
 def get_permissions_list(request):
     """获取所有角色的权限列表"""
     try:
-        # 获取所有启用的角色
-        roles = Role.objects.filter(status=1)
-        permissions_data = []
-
-        for role in roles:
-            # 构建权限数据结构
-            permissions = {
-                'expense': {
-                    'data': {
-                        'view_all': False,
-                        'view_by_location': False,
-                        'view_department_submissions': False,
-                        'view_own': False
-                    },
-                    'action': {
-                        'create': False,
-                        'edit': False,
-                        'delete': False,
-                        'audit': False,
-                        'cancel_audit': False,
-                        'view_receipt': False
-                    }
-                },
-                'customer': {
-                    'data': {
-                        'view_all': False,
-                        'view_by_location': False,
-                        'view_department_submissions': False,
-                        'view_own': False
-                    },
-                    'action': {
-                        'create': False,
-                        'edit': False,
-                        'delete': False
-                    }
-                },
-                'contract': {  # 新增合同管理权限
-                    'data': {
-                        'view_all': False,
-                        'view_by_location': False,
-                        'view_department_submissions': False,
-                        'view_own': False
-                    },
-                    'action': {
-                        'create': False,
-                        'edit': False,
-                        'delete': False
-                    }
-                }
-            }
-
-            # 获取该角色的所有权限记录
-            role_permissions = Permission.objects.filter(role=role)
-
-            # 设置权限值
-            for perm in role_permissions:
-                parts = perm.permission_name.split('_')
-                if len(parts) >= 3:
-                    module = parts[0]  # expense/customer/contract
-                    perm_type = parts[1]  # data/action
-                    action = '_'.join(parts[2:])  # view_all/create 等
-                    
-                    if module in permissions and perm_type in permissions[module]:
-                        if action in permissions[module][perm_type]:
-                            permissions[module][perm_type][action] = perm.permission_value
-
-            # 添加到结果列表
-            role_data = {
-                'role_name': role.name,
-                'permissions': permissions
-            }
-            permissions_data.append(role_data)
+        permissions_data = build_permission_matrix()
 
         return JsonResponse({
             'success': True,
@@ -740,6 +780,8 @@ def update_permission(request):
         )
         permission.permission_value = is_allowed
         permission.save()
+        # 显式失效权限缓存，保证下一次请求读取到最新权限
+        bump_permission_version()
 
         return JsonResponse({
             'success': True,
@@ -762,36 +804,81 @@ def update_permission(request):
             'message': f'更新权限失败: {str(e)}'
         }, status=500)
 
-def get_user_permissions_helper(user):
-    """获取用户权限的辅助函数"""
-    user_roles = user.roles
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_permissions(request):
+    """批量更新角色权限，请求体格式: {"changes": [{"role": "", "field": "", "isAllowed": true}]}"""
+    try:
+        data = json.loads(request.body)
+        changes = data.get('changes') if isinstance(data, dict) else data
 
-    # 获取用户所有角色的权限
-    permissions = Permission.objects.filter(role_name__in=user_roles)
+        if not changes or not all(
+            isinstance(change, dict) and change.get('role') and change.get('field') and change.get('isAllowed') is not None
+            for change in changes
+        ):
+            return JsonResponse({
+                'success': False,
+                'message': '缺少必要参数'
+            }, status=400)
 
-    # 初始化权限字典
-    combined_permissions = {
-        'expense': {'data': {}, 'action': {}},
-        'customer': {'data': {}, 'action': {}},
-        'contract': {'data': {}, 'action': {}}  # 新增合同管理权限
-    }
+        # 同一单元格多次修改时以最后一次为准
+        new_values = {(change['role'], change['field']): bool(change['isAllowed']) for change in changes}
+        role_names = {role_name for role_name, _ in new_values}
+        fields = {field for _, field in new_values}
 
-    # 合并权限（任一角色有权限即为True）
-    for permission in permissions:
-        perm_dict = permission.to_dict()
-        parts = permission.permission_name.split('_')
-        if len(parts) >= 3:
-            module = parts[0]  # expense/customer/contract
-            perm_type = parts[1]  # data/action
-            action = '_'.join(parts[2:])  # view_all/create 等
-            
-            if module in combined_permissions and perm_type in combined_permissions[module]:
-                if action not in combined_permissions[module][perm_type] or permission.permission_value:
-                    combined_permissions[module][perm_type][action] = permission.permission_value
+        with transaction.atomic():
+            role_ids = dict(Role.objects.filter(name__in=role_names).values_list('name', 'id'))
+            missing_roles = role_names - set(role_ids)
+            if missing_roles:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'角色不存在: {", ".join(sorted(missing_roles))}'
+                }, status=404)
+
+            role_names_by_id = {role_id: role_name for role_name, role_id in role_ids.items()}
+            permissions = {
+                (role_names_by_id[perm.role_id], perm.permission_name): perm
+                for perm in Permission.objects.select_for_update().filter(
+                    role_id__in=role_ids.values(), permission_name__in=fields
+                ).only('id', 'role_id', 'permission_name', 'permission_value')
+            }
+            missing_permissions = set(new_values) - set(permissions)
+            if missing_permissions:
+                return JsonResponse({
+                    'success': False,
+                    'message': '权限不存在: ' + ', '.join(f'{role_name}.{field}' for role_name, field in sorted(missing_permissions))
+                }, status=404)
+
+            changed = []
+            for key, value in new_values.items():
+                perm = permissions[key]
+                if perm.permission_value != value:
+                    perm.permission_value = value
+                    changed.append(perm)
+            Permission.objects.bulk_update(changed, ['permission_value'])
+
+        # bulk_update 不触发信号，统一失效一次权限缓存
+        bump_permission_version()
+
+        return JsonResponse({
+            'success': True,
+            'message': f'已更新 {len(changed)} 项权限',
+            'data': build_permission_matrix()
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'批量更新权限失败: {str(e)}'
+        }, status=500)
+
+def get_user_permissions_helper(user):
+    """获取用户权限的辅助函数（按角色集合和权限版本缓存）"""
+    user_roles = user.roles
 
     return {
         'roles': user_roles,
-        'permissions': combined_permissions
+        'permissions': get_compiled_permissions(user_roles, getattr(user, 'permission_version', None))
     }
 
 @api_view(['GET'])
@@ -804,3 +891,27 @@ def get_current_user_permissions(request):
         'data': permissions_data
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_session_bootstrap(request):
+    """登录后一次性返回用户信息、按角色过滤的路由和权限，替代多次独立请求"""
+    user = request.user
+    routes_data, _ = get_route_tree()
+    permissions_data = get_user_permissions_helper(user)
+
+    payload = {
+        'profile': UserSerializer(user).data,
+        'roles': permissions_data['roles'],
+        'permissions': permissions_data['permissions'],
+        'routes': filter_routes_by_roles(routes_data, user.roles),
+    }
+    etag = compute_etag(payload)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({
+            'success': True,
+            'data': payload
+        })
+    response['ETag'] = etag
+    return response
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'apps.expense',
     'apps.contract',
     'apps.core.permissions',
+    'apps.core.autocomplete',
     'apps.fileupload',
     'rest_framework',
     'rest_framework_simplejwt',
@@ -78,7 +79,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.core.authentication.backends.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -113,6 +114,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
+# 导出文件存储，可通过 EXPORT_STORAGE_BACKEND 切换（如本地开发使用 FileSystemStorage）
+EXPORT_STORAGE_BACKEND = os.environ.get('EXPORT_STORAGE_BACKEND', 'storages.backends.s3boto3.S3Boto3Storage')
+if EXPORT_STORAGE_BACKEND == 'storages.backends.s3boto3.S3Boto3Storage':
+    # 导出文件包含税务密码等敏感字段：私有 ACL，下载地址为短时效签名 URL
+    EXPORT_STORAGE_OPTIONS = {
+        'bucket_name': os.environ.get('MINIO_EXPORT_BUCKET', 'zhongyue'),
+        'default_acl': 'private',
+        'querystring_auth': True,
+        'querystring_expire': 300,
+        'custom_domain': None,
+        'file_overwrite': False,
+    }
+else:
+    # 不放在 MEDIA_ROOT 下，避免随媒体目录一起公开
+    EXPORT_STORAGE_OPTIONS = {
+        'location': os.environ.get('EXPORT_STORAGE_ROOT', os.path.join(BASE_DIR, 'storage/exports')),
+        'base_url': os.environ.get('EXPORT_STORAGE_URL', '/exports/'),
+    }
+
 # MinIO 基础配置
 STORAGES = {
     'default': {
@@ -120,7 +140,11 @@ STORAGES = {
     },
     'staticfiles': {
         'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
-    }
+    },
+    'exports': {
+        'BACKEND': EXPORT_STORAGE_BACKEND,
+        'OPTIONS': EXPORT_STORAGE_OPTIONS,
+    },
 }
 
 # MinIO 通用配置
@@ -140,3 +164,36 @@ AWS_S3_MAX_MEMORY_SIZE = None
 AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',
 }
+
+# 缓存配置（可通过环境变量切换为 Redis 等共享缓存；已编译权限、路由树和列表总数以数据库中的版本号为键，进程内缓存下也能在各 worker 间失效）
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'zhongyue'),
+    }
+}
+
+# 编译后的用户权限缓存时间（秒），权限版本变化时立即失效
+PERMISSION_CACHE_TIMEOUT = 3600
+
+# 路由树缓存时间（秒），路由版本变化时立即失效
+ROUTE_TREE_CACHE_TIMEOUT = 3600
+
+# 部门名称缓存时间（秒）
+DEPARTMENT_CACHE_TIMEOUT = 300
+
+# 头像上传大小上限（字节）、像素数上限及缩略图生成线程数
+AVATAR_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+AVATAR_MAX_PIXELS = 16 * 1024 * 1024
+AVATAR_RESIZE_WORKERS = 2
+
+# 自动补全字典在进程内的缓存时间（秒）
+AUTOCOMPLETE_INDEX_TTL = 60
+
+# 导出任务心跳超时（秒）后视为 worker 已中断，重新排队，超过最大尝试次数则标记失败
+EXPORT_JOB_STALE_SECONDS = 900
+EXPORT_JOB_MAX_ATTEMPTS = 3
+
+# 费用审核队列中领取记录的租约时间（秒）及单次领取上限
+EXPENSE_AUDIT_LEASE_SECONDS = 600
+EXPENSE_AUDIT_CLAIM_MAX = 100